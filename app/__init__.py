@@ -1,4 +1,3 @@
-import logging
 import os
 
 from flask import Flask, request
@@ -6,8 +5,8 @@ from flask import Flask, request
 app = Flask(__name__)
 app.config.from_object('config.' + (os.environ.get('FLASK_ENV') or 'Dev'))
 
-logging.basicConfig(level=logging.INFO, filename="logs/app.log", filemode="w",
-                    format="%(asctime)s - %(levelname)s - %(message)s", datefmt="%d.%m.%Y %H:%M:%S")
+# Общая с воркером настройка логов: ограниченная очередь и ротация файла (без затирания при запуске)
+import logging_config  # noqa: E402,F401
 
 
 # @app.before_request
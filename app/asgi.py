@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from app.helpers.json_helper import dumps, loads
+from app.services import bulk_ingest, metrics
+from app.services.task_queue import queue_commands, stamp_received
+from app.task_dto import TaskDTO, TaskValidationError
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер тела вебхука
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class PipelineWriter:
+    """
+    Объединяет записи конкурентных запросов в один pipeline Redis.
+    Запросы, пришедшие, пока выполняется предыдущий pipeline, уходят следующим одним round-trip.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis, stream_mode: bool, max_batch: int = 500):
+        self.redis = redis_client
+        self.stream_mode = stream_mode
+        self.max_batch = max_batch
+        self._pending: list[tuple[str, str, asyncio.Future]] = []
+        self._flushing: Optional[asyncio.Task] = None
+
+    async def write(self, task_key: str, payload: str):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((task_key, payload, future))
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.create_task(self._flush())
+        await future
+
+    async def _flush(self):
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            pipe = self.redis.pipeline(transaction=False)
+            for task_key, payload, _ in batch:
+                if self.stream_mode:
+                    queue_commands(pipe, task_key, payload)
+                else:
+                    pipe.set(task_key, payload)
+            try:
+                await pipe.execute()
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+
+class IngestApp:
+    """
+    ASGI-приложение приёма вебхуков (/gh, /gh/bulk и /health) без Flask.
+    Работает через асинхронный пул соединений Redis, записи конкурентных запросов
+    объединяются в pipeline. Запуск: uvicorn app.asgi:application --workers 4
+    """
+
+    def __init__(self, redis_client: Optional[aioredis.Redis] = None):
+        self.redis = redis_client or aioredis.Redis(
+            host=config.get("REDIS_HOST"),
+            port=config.get("REDIS_PORT"),
+            db=config.get("REDIS_DB"),
+            password=config.get("REDIS_PASSWORD"),
+            decode_responses=True,
+            max_connections=int(config.get("REDIS_MAX_CONNECTIONS") or 50),
+        )
+        self.stream_mode = config.get("QUEUE_MODE") == "stream"
+        self.writer = PipelineWriter(self.redis, self.stream_mode)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path, method = scope["path"], scope["method"]
+        started = time.perf_counter()
+        if path == "/health" and method == "GET":
+            status, body = 200, {"status": "healthy"}
+        elif path == "/metrics" and method == "GET":
+            content, content_type = metrics.render()
+            await self._send(send, 200, content, content_type.encode())
+            return
+        elif path == "/gh" and method == "POST":
+            status, body = await self.handle_task(receive)
+            self._track("gh", status, started)
+        elif path == "/gh/bulk" and method == "POST":
+            body = await bulk_ingest.ingest_async(self._iter_body(receive), self.redis, self.stream_mode)
+            status = 200
+            self._track("gh_bulk", status, started)
+        elif path in ("/health", "/metrics", "/gh", "/gh/bulk"):
+            status, body = 405, {"error": "Method not allowed"}
+        else:
+            status, body = 404, {"error": "Not found"}
+        await self._respond(send, status, body)
+
+    async def handle_task(self, receive) -> tuple[int, dict]:
+        raw = await self._read_body(receive)
+        if raw is None:
+            return 413, {"error": "Request body too large"}
+        try:
+            data = loads(raw) if raw else None
+        except ValueError:
+            return 400, {"error": "Invalid JSON"}
+        if not data or not isinstance(data, dict) or "key" not in data:
+            return 400, {"error": "No JSON data provided"}
+
+        try:
+            task = TaskDTO.from_payload(data)
+        except TaskValidationError as e:
+            return 400, {"error": str(e)}
+
+        try:
+            # Сохраняем последнее значение по key в Redis
+            await self.writer.write(task.key, dumps(stamp_received(data)))
+        except Exception as e:
+            logger.error("Error handling task: %s", str(e))
+            return 500, {"error": "Failed to process task"}
+        return 200, {"message": "success"}
+
+    @staticmethod
+    async def _read_body(receive) -> Optional[bytes]:
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_SIZE:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    @staticmethod
+    async def _iter_body(receive):
+        while True:
+            message = await receive()
+            yield message.get("body", b"")
+            if not message.get("more_body"):
+                return
+
+    @staticmethod
+    def _track(endpoint: str, status: int, started: float):
+        metrics.WEBHOOK_REQUESTS.labels(endpoint, str(status)).inc()
+        metrics.WEBHOOK_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+
+    async def _respond(self, send, status: int, body: dict):
+        await self._send(send, status, dumps(body).encode(), b"application/json")
+
+    @staticmethod
+    async def _send(send, status: int, content: bytes, content_type: bytes):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type), (b"content-length", str(len(content)).encode())],
+        })
+        await send({"type": "http.response.body", "body": content})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.redis.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = IngestApp()
@@ -3,19 +3,83 @@ import logging
 import signal
 import os
 import time
+import tracemalloc
+from dataclasses import dataclass
 from threading import Thread
+from typing import Callable, Optional
+
+from config import config
 
 logger = logging.getLogger(__name__)
 
+GUNICORN_PID_FILE = config.get('GUNICORN_PID_FILE') or '/tmp/gunicorn.pid'
+MB = 1024 * 1024
+
+
+def _flag(name: str, default: str = '') -> bool:
+    return (config.get(name) or default).lower() in ('1', 'true', 'yes')
+
+
+def tracemalloc_enabled() -> bool:
+    return _flag('HEALTH_TRACEMALLOC')
+
+
+@dataclass
+class ProcessState:
+    """Наблюдение за одним процессом между проверками"""
+    pid: int
+    role: str  # web - воркер gunicorn, worker - redis_worker, self - процесс самого монитора
+    rss: int = 0
+    peak_rss: int = 0
+    start_rss: int = 0
+    over_limit_checks: int = 0
+    restart_requested_at: Optional[float] = None
+
 
 class HealthMonitor:
-    def __init__(self, memory_threshold=80, restart_callback=None):
+    """
+    Следит за RSS каждого процесса приложения и перезапускает процесс, который держится выше лимита
+    несколько проверок подряд (сброс - только ниже порога возврата). С tracemalloc пишет в лог места роста.
+    """
+
+    def __init__(self, memory_threshold=80, restart_callback=None, discover: bool = True,
+                 process_rss_limit_mb: Optional[float] = None, process_rss_resume_mb: Optional[float] = None,
+                 consecutive_checks: Optional[int] = None, restart_cooldown: Optional[float] = None,
+                 check_interval: Optional[float] = None, use_tracemalloc: Optional[bool] = None,
+                 role: str = 'self'):
         self.memory_threshold = memory_threshold
-        self.restart_callback = restart_callback
+        self.restart_callback: Optional[Callable[[ProcessState], None]] = restart_callback
         self.monitoring = False
+        # False - следить только за своим процессом (например, внутри redis_worker)
+        self.discover = discover
+        # Роль своего процесса: 'self' не перезапускается, 'worker' (redis_worker в своём контейнере)
+        # перезапускается restart_callback, если роль есть в HEALTH_RESTART_ROLES
+        self.role = role
+
+        self.process_rss_limit = (process_rss_limit_mb
+                                  or float(config.get('HEALTH_PROCESS_RSS_LIMIT_MB') or 1024)) * MB
+        resume_mb = process_rss_resume_mb or config.get('HEALTH_PROCESS_RSS_RESUME_MB')
+        self.process_rss_resume = float(resume_mb) * MB if resume_mb else self.process_rss_limit * 0.8
+        self.consecutive_checks = consecutive_checks or int(config.get('HEALTH_CONSECUTIVE_CHECKS') or 3)
+        self.restart_cooldown = restart_cooldown or float(config.get('HEALTH_RESTART_COOLDOWN') or 600)
+        self.check_interval = check_interval or float(config.get('HEALTH_CHECK_INTERVAL') or 30)
+
+        self.use_tracemalloc = tracemalloc_enabled() if use_tracemalloc is None else use_tracemalloc
+        self.tracemalloc_frames = int(config.get('HEALTH_TRACEMALLOC_FRAMES') or 10)
+        self.tracemalloc_growth = float(config.get('HEALTH_TRACEMALLOC_GROWTH_MB') or 50) * MB
+        self.tracemalloc_top = int(config.get('HEALTH_TRACEMALLOC_TOP') or 15)
+        self.tracemalloc_dump_dir = config.get('HEALTH_TRACEMALLOC_DUMP_DIR')
+
+        self.processes: dict[int, ProcessState] = {}
+        self._system_over_checks = 0
+        self._last_restart: dict[str, float] = {}
+        self._baseline_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._baseline_traced = 0
 
     def start_monitoring(self):
         self.monitoring = True
+        if self.use_tracemalloc:
+            self._start_tracemalloc()
         monitor_thread = Thread(target=self._monitor_loop, daemon=True)
         monitor_thread.start()
         logger.info("Health monitoring started")
@@ -27,33 +91,172 @@ class HealthMonitor:
     def _monitor_loop(self):
         while self.monitoring:
             try:
-                # Проверяем использование памяти
-                memory_percent = psutil.virtual_memory().percent
+                self.check()
 
-                if memory_percent > self.memory_threshold:
-                    logger.warning(f"High memory usage: {memory_percent}%")
-                    if self.restart_callback:
-                        self.restart_callback()
-
-                # Проверяем каждые 30 секунд
-                time.sleep(30)
+                # Проверяем каждые check_interval секунд (по умолчанию 30)
+                time.sleep(self.check_interval)
 
             except Exception as e:
-                logger.error(f"Error in health monitoring: {e}")
-                time.sleep(60)  # Увеличиваем интервал при ошибке
+                logger.error("Error in health monitoring: %s", e)
+                time.sleep(self.check_interval * 2)  # Увеличиваем интервал при ошибке
+
+    def check(self):
+        """Одна проверка: RSS процессов, решения о перезапуске, снимок tracemalloc"""
+        self._update_processes()
+        for state in list(self.processes.values()):
+            self._check_process(state)
+        if self.discover:
+            self._check_system()
+        if self.use_tracemalloc:
+            self._check_tracemalloc()
+
+    def _discover_processes(self) -> dict[int, str]:
+        processes = {os.getpid(): self.role}
+        if not self.discover:
+            return processes
+        master = _gunicorn_master()
+        if master is not None:
+            for child in master.children():
+                processes[child.pid] = 'web'
+        for proc in psutil.process_iter(['pid', 'cmdline']):
+            cmdline = proc.info['cmdline'] or []
+            if any(os.path.basename(arg) == 'redis_worker.py' for arg in cmdline):
+                processes[proc.info['pid']] = 'worker'
+        return processes
+
+    def _update_processes(self):
+        discovered = self._discover_processes()
+        for pid in set(self.processes) - set(discovered):
+            # Процесс завершился (в том числе после перезапуска) - его история больше не нужна
+            del self.processes[pid]
+        for pid, role in discovered.items():
+            try:
+                rss = psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                self.processes.pop(pid, None)
+                continue
+            state = self.processes.get(pid)
+            if state is None:
+                state = self.processes[pid] = ProcessState(pid, role, start_rss=rss)
+            state.role = role
+            state.rss = rss
+            state.peak_rss = max(state.peak_rss, rss)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Process memory: %s", ", ".join(
+                f"{state.role}:{state.pid}={state.rss / MB:.0f}MB" for state in self.processes.values()
+            ))
+
+    def _check_process(self, state: ProcessState):
+        if state.rss > self.process_rss_limit:
+            state.over_limit_checks += 1
+            logger.warning("%s process %s RSS %.0fMB is above the limit %.0fMB (%s/%s, started at %.0fMB)",
+                           state.role, state.pid, state.rss / MB, self.process_rss_limit / MB,
+                           state.over_limit_checks, self.consecutive_checks, state.start_rss / MB)
+        elif state.rss < self.process_rss_resume:
+            state.over_limit_checks = 0
+        # Между порогом возврата и лимитом счётчик не меняется: колебания у лимита не дают перезапусков
+
+        if state.over_limit_checks >= self.consecutive_checks:
+            self._restart(state, f"RSS above {self.process_rss_limit / MB:.0f}MB "
+                                 f"for {state.over_limit_checks} checks")
+
+    def _check_system(self):
+        memory_percent = psutil.virtual_memory().percent
+        if memory_percent <= self.memory_threshold:
+            self._system_over_checks = 0
+            return
+        self._system_over_checks += 1
+        logger.warning("High memory usage: %s%% (%s/%s)",
+                       memory_percent, self._system_over_checks, self.consecutive_checks)
+        if self._system_over_checks < self.consecutive_checks:
+            return
+        # Перезапускаем только самый крупный из наших процессов, и только если он сам заметно большой;
+        # если память съел кто-то другой на хосте, перезапуск приложения не поможет
+        candidates = [state for state in self.processes.values()
+                      if state.role != 'self' and state.rss >= self.process_rss_resume]
+        if not candidates:
+            logger.warning("High memory usage is not caused by the app processes, nothing to restart")
+            return
+        largest = max(candidates, key=lambda state: state.rss)
+        if self._restart(largest, f"host memory at {memory_percent}% and it is the largest app process"):
+            self._system_over_checks = 0
+
+    def _restart(self, state: ProcessState, reason: str) -> bool:
+        now = time.monotonic()
+        if self.restart_callback is None or state.role == 'self':
+            return False
+        if state.restart_requested_at is not None and now - state.restart_requested_at < self.restart_cooldown:
+            return False
+        last_restart = self._last_restart.get(state.role)
+        if last_restart is not None and now - last_restart < self.restart_cooldown:
+            logger.warning("%s process %s needs a restart (%s), but another %s process was restarted recently",
+                           state.role, state.pid, reason, state.role)
+            return False
+        logger.warning("Restarting %s process %s: %s", state.role, state.pid, reason)
+        state.restart_requested_at = now
+        self._last_restart[state.role] = now
+        self.restart_callback(state)
+        return True
+
+    def _start_tracemalloc(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+        self._baseline_snapshot = self._take_snapshot()
+        self._baseline_traced = tracemalloc.get_traced_memory()[0]
+
+    def _check_tracemalloc(self):
+        traced = tracemalloc.get_traced_memory()[0]
+        growth = traced - self._baseline_traced
+        if growth < self.tracemalloc_growth:
+            return
+        snapshot = self._take_snapshot()
+        stats = snapshot.compare_to(self._baseline_snapshot, 'traceback')
+        lines = [f"Traced memory grew by {growth / MB:.1f}MB to {traced / MB:.1f}MB, top allocations:"]
+        for stat in stats[:self.tracemalloc_top]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size_diff / 1024:+.0f}KB ({stat.count_diff:+d} blocks) "
+                         f"{frame.filename}:{frame.lineno}")
+        logger.warning("\n".join(lines))
+
+        if self.tracemalloc_dump_dir:
+            os.makedirs(self.tracemalloc_dump_dir, exist_ok=True)
+            path = os.path.join(self.tracemalloc_dump_dir, f"tracemalloc-{os.getpid()}-{int(time.time())}.snap")
+            snapshot.dump(path)
+            logger.warning("Tracemalloc snapshot saved to %s", path)
+
+        # Следующий отчёт - только при дальнейшем росте относительно этого снимка
+        self._baseline_snapshot = snapshot
+        self._baseline_traced = traced
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+
+def _gunicorn_master() -> Optional[psutil.Process]:
+    try:
+        with open(GUNICORN_PID_FILE, 'r') as f:
+            return psutil.Process(int(f.read().strip()))
+    except (OSError, ValueError, psutil.Error):
+        return None
 
 
-def graceful_restart():
-    """Функция для graceful restart воркеров"""
+def restart_process(state: ProcessState):
+    """SIGTERM процессу роли из HEALTH_RESTART_ROLES: воркер gunicorn поднимет мастер, redis_worker - супервизор"""
+    roles = [role.strip() for role in (config.get('HEALTH_RESTART_ROLES') or 'web').split(',')]
+    if state.role not in roles:
+        logger.warning("Restart of %s processes is disabled, process %s left running", state.role, state.pid)
+        return
     try:
-        # Отправляем сигнал HUP мастер-процессу gunicorn
-        with open('/tmp/gunicorn.pid', 'r') as f:
-            master_pid = int(f.read().strip())
-        os.kill(master_pid, signal.SIGHUP)
-        logger.info("Sent SIGHUP signal for graceful restart")
+        os.kill(state.pid, signal.SIGTERM)
+        logger.info("Sent SIGTERM to %s process %s", state.role, state.pid)
     except Exception as e:
-        logger.error(f"Failed to restart: {e}")
+        logger.error("Failed to restart process %s: %s", state.pid, e)
 
 
-# Инициализация монитора
-health_monitor = HealthMonitor(memory_threshold=85, restart_callback=graceful_restart)
\ No newline at end of file
+# Монитор для запуска без gunicorn (python run.py); под gunicorn монитор запускает мастер (gunicorn_config.when_ready)
+health_monitor = HealthMonitor(memory_threshold=85, restart_callback=restart_process)
@@ -0,0 +1,77 @@
+import re
+from datetime import date, datetime
+from typing import Any, Optional
+
+# Нулевой день серийных дат Google Sheets
+_SERIAL_EPOCH = datetime(1899, 12, 30)
+# Языки, в локалях которых десятичный разделитель - запятая, а аргументы формул разделяются ";"
+_DECIMAL_COMMA_LANGUAGES = frozenset((
+    "ru", "uk", "be", "kk", "de", "fr", "es", "it", "pt", "nl", "pl", "cs", "sk", "sl", "hr", "sr", "bg",
+    "ro", "hu", "tr", "sv", "fi", "da", "nb", "no", "is", "et", "lv", "lt", "el", "id", "vi", "az", "ka",
+))
+# Локаль листа, если её не удалось узнать: лист ведётся на русском
+DEFAULT_LOCALE = "ru_RU"
+
+
+def decimal_comma(locale: Optional[str]) -> bool:
+    """Десятичный разделитель локали листа - запятая"""
+    return (locale or DEFAULT_LOCALE).split("_")[0].lower() in _DECIMAL_COMMA_LANGUAGES
+
+
+def formula_separator(locale: Optional[str]) -> str:
+    """Разделитель аргументов формул, с которым Sheets разбирает введённую формулу в этой локали"""
+    return ";" if decimal_comma(locale) else ","
+
+
+def typed_row(values: list[Any], date_columns, locale: Optional[str] = None) -> list[Any]:
+    """
+    Копия строки в том виде, в каком её вернёт чтение с FORMULA после записи с USER_ENTERED:
+    строки-числа - числами, строки-даты в колонках date_columns - серийными числами.
+    По ней сравниваются старые и новые значения, иначе такие ячейки всегда выглядели бы изменёнными.
+    """
+    values = list(values)
+    date_columns = frozenset(date_columns)
+    for col, value in enumerate(values):
+        if isinstance(value, str):
+            values[col] = typed_value(value, col in date_columns, locale)
+    return values
+
+
+def typed_value(value: str, is_date: bool = False, locale: Optional[str] = None) -> Any:
+    """Значение строки после разбора USER_ENTERED: число, серийная дата или сама строка"""
+    number = number_value(value, locale)
+    if number is not None:
+        return number
+    if is_date:
+        serial = date_serial(value)
+        if serial is not None:
+            return serial
+    return value
+
+
+def number_value(value: str, locale: Optional[str] = None) -> int | float | None:
+    """Число из строки, которую Sheets разберёт как число: целое или дробное с разделителем локали"""
+    separator = "," if decimal_comma(locale) else "."
+    match = re.fullmatch(r"\s*([+-]?\d+)(?:" + re.escape(separator) + r"(\d+))?\s*", value)
+    if match is None:
+        return None
+    if match.group(2) is None:
+        return int(match.group(1))
+    return float(f"{match.group(1)}.{match.group(2)}")
+
+
+def date_serial(value: str) -> int | float | None:
+    """
+    Серийный номер даты Google Sheets для строк вида 2024-05-20 (целое число)
+    и 2024-05-20T10:00:00 (дробное, время - доля суток; часовой пояс не учитывается, как и при вводе)
+    """
+    try:
+        if len(value) == 10:
+            return (date.fromisoformat(value) - _SERIAL_EPOCH.date()).days
+        moment = datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
+    delta = moment - _SERIAL_EPOCH
+    if not delta.seconds and not delta.microseconds:
+        return delta.days
+    return delta.days + (delta.seconds + delta.microseconds / 1_000_000) / 86400
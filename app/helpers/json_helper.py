@@ -0,0 +1,19 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, без него работает стандартный json
+    orjson = None
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(data: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data)
@@ -1,5 +1,5 @@
 import string
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Tuple
 
 
 def add_alphabet_keys(data: List[Any]) -> Dict[str, Any]:
@@ -14,3 +14,34 @@ def add_alphabet_keys(data: List[Any]) -> Dict[str, Any]:
         result[key] = value
 
     return result
+
+
+def normalize_cell(value: Any) -> str:
+    # Приводит значение ячейки к виду, в котором его вернёт таблица: True -> "TRUE", 3.0 -> "3", None -> ""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def changed_ranges(old: List[Any], new: List[Any]) -> List[Tuple[int, List[Any]]]:
+    """
+    Сравнивает строки по ячейкам и возвращает непрерывные участки изменившихся ячеек
+    в виде (индекс первой ячейки, новые значения участка).
+    """
+    result = []
+    start = None
+    for i, value in enumerate(new):
+        old_value = old[i] if i < len(old) else ''
+        if normalize_cell(old_value) != normalize_cell(value):
+            if start is None:
+                start = i
+        elif start is not None:
+            result.append((start, list(new[start:i])))
+            start = None
+    if start is not None:
+        result.append((start, list(new[start:])))
+    return result
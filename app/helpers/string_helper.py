@@ -1,17 +1,39 @@
-from datetime import datetime
+from datetime import date
+from functools import lru_cache
 import re
 
+_sprint_dates_pattern = re.compile(r"\((\d{1,2})\.(\d{1,2})\s*–\s*(\d{1,2})\.(\d{1,2})\)")
 
-def extract_dates(sprint_str: str) -> tuple[datetime.date, datetime.date] | None:
-    # Разбираем шаблон "(01.01 – 02.02)"
-    match = re.search(r"\((\d{1,2}\.\d{1,2})\s*–\s*(\d{1,2}\.\d{1,2})\)", sprint_str)
+
+@lru_cache(maxsize=256)
+def sprint_dates(sprint_str: str, year: int) -> tuple[date, date] | None:
+    # Спринт начинается в году year. Если конец раньше начала, спринт переходит через Новый год
+    # и заканчивается в следующем году: "(25.12 – 07.01)" -> 25.12.year – 07.01.(year + 1)
+    match = _sprint_dates_pattern.search(sprint_str)
     if not match:
         return None
 
-    start_date_str, end_date_str = match.groups()
-    # Текущий год подставляется по умолчанию
-    current_year = datetime.now().year
-    start_date = datetime.strptime(f"{start_date_str}.{current_year}", "%d.%m.%Y").date()
-    end_date = datetime.strptime(f"{end_date_str}.{current_year}", "%d.%m.%Y").date()
+    start_day, start_month, end_day, end_month = map(int, match.groups())
+    end_year = year + 1 if (end_month, end_day) < (start_month, start_day) else year
+    try:
+        return date(year, start_month, start_day), date(end_year, end_month, end_day)
+    except ValueError:
+        # Несуществующая дата (31.02, 29.02 в невисокосный год)
+        return None
+
+
+_hyperlink_pattern = re.compile(r'^=HYPERLINK\(".*?"[;,]\s*"(.*)"\)$', re.IGNORECASE | re.DOTALL)
+
+
+def extract_task_key(cell: str | None) -> str | None:
+    # Ячейка может содержать "KEY: summary" или формулу =HYPERLINK("url"; "KEY: summary") (в локалях с точкой - ",")
+    if not cell:
+        return None
+
+    value = str(cell)
+    match = _hyperlink_pattern.match(value)
+    if match:
+        value = match.group(1)
 
-    return start_date, end_date
+    key = value.split(":")[0].strip()
+    return key or None
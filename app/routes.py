@@ -1,10 +1,14 @@
 import json
+import time
 
 from app import app
-from flask import request, jsonify
+from flask import Response, request, jsonify
 import logging
 from functools import wraps
 import redis
+from app.services import bulk_ingest, metrics
+from app.services.task_queue import TaskQueue, stamp_received
+from app.task_dto import TaskDTO, TaskValidationError
 from config import config
 
 
@@ -20,6 +24,21 @@ def handle_errors(f):
     return decorated_function
 
 
+def track_webhook(endpoint):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            started = time.perf_counter()
+            response, status = f(*args, **kwargs)
+            metrics.WEBHOOK_REQUESTS.labels(endpoint, str(status)).inc()
+            metrics.WEBHOOK_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+            return response, status
+
+        return decorated_function
+
+    return decorator
+
+
 redis_client = redis.StrictRedis(
     host=config.get("REDIS_HOST"),
     port=config.get("REDIS_PORT"),
@@ -28,9 +47,13 @@ redis_client = redis.StrictRedis(
     decode_responses=True
 )
 
+# В режиме stream задачи пишутся в Redis Stream, иначе - отдельным ключом на задачу
+task_queue = TaskQueue(redis_client) if config.get("QUEUE_MODE") == "stream" else None
+
 
 # Объединенный маршрут для создания/обновления задач
 @app.route("/gh", methods=["POST"])
+@track_webhook("gh")
 @handle_errors
 def handle_task():
     try:
@@ -38,9 +61,18 @@ def handle_task():
         if not data or "key" not in data:
             return jsonify({"error": "No JSON data provided"}), 400
 
-        task_key = str(data["key"])
+        try:
+            task = TaskDTO.from_payload(data)
+        except TaskValidationError as e:
+            return jsonify({"error": str(e)}), 400
+
+        task_key = task.key
+        stamp_received(data)
         # Сохраняем последнее значение по key в Redis
-        redis_client.set(task_key, json.dumps(data))
+        if task_queue is not None:
+            task_queue.enqueue(task_key, json.dumps(data))
+        else:
+            redis_client.set(task_key, json.dumps(data))
 
         return jsonify({"message": "success"}), 200
     except Exception as e:
@@ -48,6 +80,23 @@ def handle_task():
         return jsonify({"error": "Failed to process task"}), 500
 
 
+# Пачка задач: JSON-массив или NDJSON, разбирается потоково и пишется в Redis pipeline
+@app.route("/gh/bulk", methods=["POST"])
+@track_webhook("gh_bulk")
+@handle_errors
+def handle_tasks_bulk():
+    chunks = iter(lambda: request.stream.read(64 * 1024), b"")
+    result = bulk_ingest.ingest(chunks, redis_client, task_queue is not None)
+    logging.info(f"Bulk ingest: {result['accepted']} queued, {result['rejected']} rejected")
+    return jsonify(result), 200
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "healthy"}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    content, content_type = metrics.render()
+    return Response(content, content_type=content_type)
@@ -0,0 +1,71 @@
+import logging
+import os
+import threading
+from typing import Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+
+class AssigneeMapping:
+    """
+    Общий на процесс маппинг исполнителей из mapping.yaml.
+    Файл читается один раз и перечитывается только при изменении mtime (refresh)
+    или по запросу (request_reload, например из обработчика SIGHUP).
+    """
+
+    def __init__(self, path: str = 'mapping.yaml'):
+        self.path = path
+        self._mapping: Optional[dict] = None
+        self._mtime: Optional[float] = None
+        self._reload_requested = False
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        if self._mapping is None or self._reload_requested:
+            self.refresh()
+        return self._mapping.get(name, name)
+
+    def refresh(self):
+        """Перечитывает файл, если он изменился с момента последней загрузки"""
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                mtime = None
+
+            if self._mapping is not None and not self._reload_requested and mtime == self._mtime:
+                return
+
+            self._reload_requested = False
+            try:
+                self._mapping = self._load()
+            except yaml.YAMLError:
+                # Битый файл при перечитывании не должен останавливать обработку, оставляем прежний маппинг
+                if self._mapping is None:
+                    raise
+                logger.warning("Keeping previous assignee mapping")
+            self._mtime = mtime
+
+    def request_reload(self):
+        """Помечает маппинг для перечитывания при следующем обращении (безопасно вызывать из обработчика сигнала)"""
+        self._reload_requested = True
+
+    def _load(self) -> dict:
+        """Загружает маппинги из YAML файла"""
+        # TODO обработать ошибку табуляции в файле YAML
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = yaml.safe_load(file) or {}
+                logger.info("Loaded assignee mapping from %s", self.path)
+                return data.get('assignee', {}) or {}
+        except FileNotFoundError:
+            logger.error("Mapping file not found, using empty mapping")
+            return {}
+        except yaml.YAMLError as e:
+            logger.error("Error parsing mapping file: %s", e)
+            raise
+
+
+assignee_mapping = AssigneeMapping()
@@ -0,0 +1,309 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+from urllib.parse import quote
+
+import httpx
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+
+from app.helpers.cell_helper import DEFAULT_LOCALE
+from app.helpers.string_helper import extract_task_key
+from app.services.base_sheets_service import BaseSheetsService, append_rows_request, grid_rows_after
+from app.services.metrics import QUOTA_WAIT_SECONDS, count_retry, track_api_call
+from app.services.quota_scheduler import READ, WRITE, QuotaScheduler
+from app.services.sheet_lock import SheetLock, SheetLockTimeout
+from app.task_dto import TaskDTO
+from config import config
+from logging_config import logger
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+
+class SheetsAPIError(Exception):
+    def __init__(self, status_code: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def is_retryable(self) -> bool:
+        return self.status_code == 429 or self.status_code >= 500
+
+
+def _is_retryable(exception: BaseException) -> bool:
+    if isinstance(exception, SheetsAPIError):
+        return exception.is_retryable
+    return isinstance(exception, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class AsyncGoogleSheetsService(BaseSheetsService):
+    """
+    Асинхронный вариант GoogleSheetsService с тем же публичным интерфейсом (store_task, store_tasks_batch).
+    Ходит в Sheets REST API через httpx.AsyncClient с пулом keep-alive соединений,
+    независимые чтения и записи выполняет параллельно (не более max_concurrency одновременно).
+    Один httpx-клиент можно передать нескольким сервисам, чтобы синхронизировать несколько листов
+    через общий пул соединений.
+    """
+
+    def __init__(self, sheet_key: Optional[str] = None, worksheet_title: Optional[str] = None,
+                 client: Optional[httpx.AsyncClient] = None, max_concurrency: int = 4, redis_client=None,
+                 quota_namespace: Optional[str] = None, quota_tenant: Optional[str] = None):
+        super().__init__()
+        self.task_key = None
+        self.sheet_key = sheet_key or config.get('GOOGLE_SHEET_KEY')
+        self.worksheet_title = worksheet_title or config.get('GOOGLE_SHEET_WORKSHEET')
+        self.credentials = Credentials.from_service_account_file('credentials/google.json', scopes=SCOPES)
+        self.client = client or self.create_client(max_concurrency)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.quota = QuotaScheduler.from_config(redis_client, namespace=quota_namespace, tenant=quota_tenant)
+        # Та же блокировка записи в лист, что и у синхронного сервиса
+        self.write_lock = (SheetLock.from_config(redis_client, self.sheet_key, self.worksheet_title)
+                           if redis_client is not None else None)
+        self._token_lock = asyncio.Lock()
+        self._batch_get_chunk_size = 100
+        self._sheet_id = None
+
+    @staticmethod
+    def create_client(max_connections: int = 4) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def store_task(self, task: TaskDTO):
+        """
+        Обычное сохранение задачи в Google Sheets.
+        """
+        self.task_key = task.key
+        await self.store_tasks_batch([task])
+
+    async def store_tasks_batch(self, tasks: list[TaskDTO]):
+        """
+        Пакетное сохранение задач в Google Sheets.
+        Заголовок и первый столбец читаются параллельно, обновления и новые строки
+        отправляются одним values:batchUpdate.
+        """
+        if self.write_lock is None:
+            return await self._store_tasks_batch(tasks)
+        # Ожидание блокировки в Redis - в потоке, чтобы не останавливать запись в другие листы
+        if not await asyncio.to_thread(self.write_lock.acquire):
+            raise SheetLockTimeout(f"Sheet lock {self.write_lock.key} is held elsewhere")
+        try:
+            await self._store_tasks_batch(tasks)
+        finally:
+            await asyncio.to_thread(self.write_lock.release)
+
+    async def _store_tasks_batch(self, tasks: list[TaskDTO]):
+        self._start_batch()
+        if self._grid_rows is None:
+            await self._load_properties()
+        header, all_keys = await asyncio.gather(
+            self._get_values("1:1"),
+            self._get_values("A:A"),
+        )
+        header_row = self._normalize_header(header[0] if header else [])
+        if header_row != self.header:
+            self.header = header_row
+        task_keys = [task.key for task in tasks]
+        key_to_row, first_empty_row = self._resolve_rows(all_keys, task_keys)
+
+        # Как и в синхронном сервисе, вместе со строками задач читаются строки под дозапись: если их
+        # успели занять (дописал другой писатель), номера строк пересобираются
+        append_count = len(set(task_keys) - set(key_to_row))
+        existing_rows = await self._get_rows(list(key_to_row.values()), (first_empty_row, append_count))
+        if (self._has_row_drift(key_to_row, existing_rows)
+                or self._has_append_drift(first_empty_row, append_count, existing_rows)):
+            logger.warning("Task rows moved in the worksheet, rebuilding row lookup")
+            key_to_row, first_empty_row = self._resolve_rows(await self._get_values("A:A"), task_keys)
+            append_count = len(set(task_keys) - set(key_to_row))
+            existing_rows = await self._get_rows(list(key_to_row.values()), (first_empty_row, append_count))
+
+        # Строки без ключа в первом столбце чтение A:A не видит: дописываем ниже них
+        while self._has_append_drift(first_empty_row, append_count, existing_rows):
+            first_empty_row = self._skip_taken_rows(first_empty_row, existing_rows)
+            existing_rows.update(await self._get_rows([], (first_empty_row, append_count)))
+
+        data = []
+        next_row = first_empty_row
+        updated = created = 0
+        for task in tasks:
+            row = key_to_row.get(task.key)
+            if row:
+                old_task_list = existing_rows.get(row) or []
+                requests = self._row_update_requests(row, self.mapping(task, old_task_list), old_task_list)
+                data.extend(requests)
+                updated += bool(requests)
+            else:
+                data.append({"range": f"A{next_row}", "values": [self.mapping(task)]})
+                key_to_row[task.key] = next_row
+                next_row += 1
+                created += 1
+
+        if not data:
+            logger.info("Skipped %s unchanged rows", len(tasks))
+            return
+
+        for request in data:
+            request["range"] = self._absolute_range(request["range"])
+        try:
+            await self._grow_grid(next_row - 1)
+            await self._request("POST", "/values:batchUpdate", json={
+                "valueInputOption": "USER_ENTERED",
+                "data": data,
+            })
+        except SheetsAPIError:
+            self._forget_grid_rows()
+            raise
+        logger.info("Updated %s and created %s tasks (new rows from %s)", updated, created, first_empty_row)
+
+    @staticmethod
+    def _resolve_rows(all_keys: list[list], task_keys: list[str]) -> tuple[dict[str, int], int]:
+        """
+        Сопоставляет ключи задач с номерами строк по прочитанному первому столбцу.
+        Возвращает (ключ -> номер строки для найденных задач, первая свободная строка для новых).
+        """
+        all_rows = {}
+        for idx, row in enumerate(all_keys, start=1):
+            prefix = extract_task_key(row[0] if row else None)
+            if prefix:
+                all_rows[prefix] = idx
+        return {key: all_rows[key] for key in task_keys if key in all_rows}, len(all_keys) + 1
+
+    async def _grow_grid(self, last_row: int):
+        """Расширяет сетку листа (appendDimension), если дозапись выходит за её последнюю строку"""
+        request = append_rows_request(self._sheet_id, self._grid_rows, last_row)
+        if request is None:
+            return
+        await self._request("POST", ":batchUpdate", json={"requests": [request]})
+        self._grid_rows = grid_rows_after(self._grid_rows, last_row)
+
+    async def _load_properties(self):
+        """
+        Читает свойства таблицы и листа: локаль (от неё зависит разделитель аргументов формулы HYPERLINK),
+        id листа и размер его сетки.
+        """
+        response = await self._request("GET", "", params={
+            "fields": "properties.locale,sheets.properties(sheetId,title,gridProperties.rowCount)",
+        })
+        self.locale = response.get("properties", {}).get("locale") or DEFAULT_LOCALE
+        for sheet in response.get("sheets", []):
+            properties = sheet.get("properties", {})
+            if properties.get("title") == self.worksheet_title:
+                self._sheet_id = properties.get("sheetId", 0)
+                self._grid_rows = properties.get("gridProperties", {}).get("rowCount", 0)
+                return
+        raise SheetsAPIError(404, f"Worksheet {self.worksheet_title!r} not found")
+
+    async def _get_rows(self, rows: list[int], append_span: Optional[tuple[int, int]] = None) -> dict[int, list]:
+        """
+        Читает строки чанками по batch_get, чанки запрашиваются параллельно.
+        append_span - (первая строка, число строк): блок строк под дозапись, читается одним диапазоном
+        в первом чанке; в результат попадают только непустые строки блока.
+        """
+        rows = sorted(set(rows))
+        first, count = append_span or (0, 0)
+        chunks = [rows[i:i + self._batch_get_chunk_size] for i in range(0, len(rows), self._batch_get_chunk_size)]
+        ranges = [[self._row_range(row) for row in chunk] for chunk in chunks]
+        if count:
+            if not ranges:
+                ranges.append([])
+            ranges[0].append(self._row_range(first, first + count - 1))
+        responses = await asyncio.gather(*[
+            self._request("GET", "/values:batchGet", params=[
+                ("valueRenderOption", "FORMULA"),
+                *[("ranges", self._absolute_range(range_a1)) for range_a1 in chunk_ranges],
+            ])
+            for chunk_ranges in ranges
+        ])
+
+        result = {}
+        for index, response in enumerate(responses):
+            value_ranges = response.get("valueRanges", [])
+            if index == 0 and count:
+                append_range = value_ranges[-1] if value_ranges else {}
+                for row, values in enumerate(append_range.get("values") or [], start=first):
+                    if any(value not in (None, '') for value in values):
+                        result[row] = list(values)
+            for row, value_range in zip(chunks[index] if index < len(chunks) else [], value_ranges):
+                values = value_range.get("values") or [[]]
+                result[row] = list(values[0])
+        return result
+
+    async def _get_values(self, range_a1: str) -> list[list]:
+        # Название листа в пути URL кодируется целиком: пробелы, "#", "/" и не-ASCII символы
+        response = await self._request("GET", f"/values/{quote(self._absolute_range(range_a1), safe='')}")
+        return response.get("values", [])
+
+    def _absolute_range(self, range_a1: str) -> str:
+        title = self.worksheet_title.replace("'", "''")
+        return f"'{title}'!{range_a1}"
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=8),
+        retry=retry_if_exception(_is_retryable),
+        before_sleep=count_retry,
+    )
+    async def _request(self, method: str, path: str, **kwargs) -> dict:
+        kind = READ if method == "GET" else WRITE
+        started = time.perf_counter()
+        # Планировщик квоты ходит в синхронный Redis, поэтому вызываем его в потоке, не блокируя цикл событий
+        while (wait := await asyncio.to_thread(self.quota.reserve, kind)) > 0:
+            await asyncio.sleep(wait)
+        QUOTA_WAIT_SECONDS.labels(kind).observe(time.perf_counter() - started)
+
+        headers = {"Authorization": f"Bearer {await self._get_token()}"}
+        # values:batchGet / values:batchUpdate, для чтения диапазона - values.get,
+        # для свойств таблицы и расширения сетки - spreadsheets.get / spreadsheets:batchUpdate
+        if path.startswith("/values:"):
+            operation = path.lstrip("/")
+        elif path.startswith("/values/"):
+            operation = "values.get"
+        else:
+            operation = f"spreadsheets{path or '.get'}"
+        with track_api_call(operation):
+            async with self._semaphore:
+                response = await self.client.request(method, f"{SHEETS_API_URL}/{self.sheet_key}{path}",
+                                                     headers=headers, **kwargs)
+            if response.status_code >= 400:
+                retry_after = response.headers.get("Retry-After")
+                error = SheetsAPIError(response.status_code, response.text,
+                                       float(retry_after) if retry_after else None)
+                if response.status_code == 429:
+                    await asyncio.to_thread(self.quota.report_throttled, kind, error.retry_after)
+                logger.error("%s | Google Sheets API Error: %s %s", self.task_key, response.status_code, response.text)
+                raise error
+        return response.json()
+
+    async def _get_token(self) -> str:
+        async with self._token_lock:
+            if not self.credentials.valid:
+                # google-auth обновляет токен синхронно, выносим в поток, чтобы не блокировать event loop
+                await asyncio.to_thread(self.credentials.refresh, Request())
+            return self.credentials.token
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coroutine):
+    """
+    Выполняет корутину в постоянном event loop процесса и ждёт результата.
+    Loop работает в отдельном потоке и не пересоздаётся между пачками, поэтому пул соединений httpx
+    переживает между вызовами, а вызывать run_sync можно одновременно из нескольких потоков
+    (писатели листов SheetWriterPool): их корутины выполняются в loop параллельно.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True, name="sheets-event-loop").start()
+    return asyncio.run_coroutine_threadsafe(coroutine, _loop).result()
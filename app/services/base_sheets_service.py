@@ -0,0 +1,175 @@
+from datetime import date, datetime
+from typing import Any, Optional
+
+from gspread.utils import rowcol_to_a1
+
+from app.enums.column_enum import ColumnEnum
+from app.helpers.cell_helper import formula_separator, typed_row
+from app.helpers.list_helper import changed_ranges
+from app.helpers.string_helper import extract_task_key, sprint_dates
+from app.services.column_layout import ColumnLayout
+from app.services.metrics import MAPPING_SECONDS
+from app.task_dto import TaskDTO
+from config import config
+
+# Колонки дат: Sheets хранит их серийными числами и при чтении с FORMULA возвращает число, а не строку
+DATE_COLUMNS = (ColumnEnum.stage_deadline, ColumnEnum.due_date, ColumnEnum.deadline_fact)
+# На сколько строк расширять сетку листа сверх нужного, чтобы не расширять её на каждой пачке
+GRID_HEADROOM = 500
+
+
+class BaseSheetsService:
+    """
+    Общая для синхронного и асинхронного сервисов логика:
+    раскладка колонок, маппинг задачи в строку и построение диапазонов записи.
+    """
+
+    def __init__(self, diff_writes: Optional[bool] = None):
+        self.header = None
+        self._layout = None
+        # Дата, относительно которой считается "Текущий спринт", одна на всю пачку
+        self._today: Optional[date] = None
+        # Писать только изменившиеся ячейки вместо всей строки
+        if diff_writes is None:
+            diff_writes = (config.get('SHEET_DIFF_WRITES') or '').lower() in ('1', 'true', 'yes')
+        self._diff_writes = diff_writes
+        # Локаль таблицы: от неё зависит, как USER_ENTERED разбирает числа и формулы
+        self.locale: Optional[str] = None
+        self._grid_rows: Optional[int] = None  # размер сетки листа, нужен для расширения при дозаписи
+
+    @staticmethod
+    def _normalize_header(headers: list) -> list:
+        # Ищем ключ, который начинается с "Текущий спринт" значение может быть "Текущий спринт (461/1804)"
+        # Для того, что бы взять его индекс и заменить на "Текущий спринт"
+        sprint_index = next(
+            (i for i, header in enumerate(headers) if header.startswith("Текущий спринт")),
+            None  # если не найдено
+        )
+        headers[sprint_index] = "Текущий спринт"
+        return headers
+
+    @MAPPING_SECONDS.time()
+    def mapping(self, task: TaskDTO, old_task_list=None) -> list[Any]:
+        layout = self._get_layout()
+        columns = layout.columns
+        task_list = layout.empty_row()
+
+        sprint = self.is_current_date_in_sprint(task.sprint, self._today)
+
+        task_list[columns[ColumnEnum.name]] = task.hyperlink_formula(formula_separator(self.locale))
+        task_list[columns[ColumnEnum.assignee]] = task.assignee
+        task_list[columns[ColumnEnum.type]] = task.type or ""
+        task_list[columns[ColumnEnum.sprint]] = sprint
+        task_list[columns[ColumnEnum.status]] = task.status or ""
+        task_list[columns[ColumnEnum.stage_deadline]] = task.stage_deadline or ""
+        task_list[columns[ColumnEnum.due_date]] = task.due_date or ""
+        task_list[columns[ColumnEnum.deadline_fact]] = task.deadline_fact or ""
+        task_list[columns[ColumnEnum.project]] = task.project or ""
+        task_list[columns[ColumnEnum.priority]] = task.priority or ""
+        task_list[columns[ColumnEnum.off_the_plan]] = task.off_the_plan
+        task_list[columns[ColumnEnum.outside_of_the_sprint_plan]] = task.outside_sprint
+        task_list[columns[ColumnEnum.moving_on_to_the_next_sprint]] = task.moving_next_sprint
+
+        comment_index = columns[ColumnEnum.comment]
+        if old_task_list and comment_index < len(old_task_list):
+            task_list[comment_index] = old_task_list[comment_index] or ""
+
+        dev_index = layout.person_column(task.dev)
+        if dev_index is not None and task.sp_development != "":
+            task_list[dev_index] = task.sp_development
+
+        qa_index = layout.person_column(task.qa_engineer)
+        if qa_index is not None and task.sp_testing != "":
+            task_list[qa_index] = task.sp_testing
+
+        # Последняя ячейка - сток для колонок, которых нет в заголовке
+        return task_list[:layout.width]
+
+    def _get_layout(self) -> ColumnLayout:
+        """Пересобирает раскладку колонок только при смене заголовка"""
+        if self._layout is None or self._layout.header is not self.header:
+            self._layout = ColumnLayout(self.header)
+        return self._layout
+
+    @staticmethod
+    def is_current_date_in_sprint(sprint: Optional[str], today: Optional[date] = None) -> bool:
+        if not sprint:
+            return False
+        today = today or datetime.now().date()
+        # В начале года текущим может быть спринт, начавшийся в прошлом году
+        for year in (today.year - 1, today.year):
+            dates = sprint_dates(sprint, year)
+            if dates and dates[0] <= today <= dates[1]:
+                return True
+        return False
+
+    def _start_batch(self):
+        """Фиксирует дату для всей пачки, чтобы задачи одного спринта получили одинаковый признак"""
+        self._today = datetime.now().date()
+
+    @staticmethod
+    def _has_row_drift(key_to_row: dict[str, int], existing_rows: dict[int, list]) -> bool:
+        """Проверяет, что в прочитанных строках действительно лежат ожидаемые задачи"""
+        for key, row in key_to_row.items():
+            values = existing_rows.get(row)
+            if extract_task_key(values[0] if values else None) != key:
+                return True
+        return False
+
+    def _date_columns(self) -> tuple[int, ...]:
+        columns = self._get_layout().columns
+        return tuple(columns[column] for column in DATE_COLUMNS)
+
+    @staticmethod
+    def _has_append_drift(first_empty_row: int, count: int, existing_rows: dict[int, list]) -> bool:
+        """Проверяет, что строки, в которые будут дописаны новые задачи, действительно пустые"""
+        return any(existing_rows.get(row) for row in range(first_empty_row, first_empty_row + count))
+
+    @staticmethod
+    def _skip_taken_rows(first_empty_row: int, existing_rows: dict[int, list]) -> int:
+        """Строка сразу под последней занятой из прочитанных под дозапись"""
+        return max(row for row, values in existing_rows.items() if values and row >= first_empty_row) + 1
+
+    def _row_changes(self, values: list, old_values: list) -> list[tuple[int, list]]:
+        """
+        Что писать в строку: (индекс первой ячейки, значения) - вся строка или только изменившиеся участки.
+        Строки-числа и даты сравниваются числами, как их вернёт чтение с FORMULA, а mapping() отдаёт строку.
+        """
+        if not self._diff_writes:
+            return [(0, values)]
+        date_columns = self._date_columns()
+        return [
+            (start, list(values[start:start + len(chunk)]))
+            for start, chunk in changed_ranges(typed_row(old_values, date_columns, self.locale),
+                                              typed_row(values, date_columns, self.locale))
+        ]
+
+    def _row_update_requests(self, row: int, values: list, old_values: list) -> list[dict]:
+        """Диапазоны для записи строки: вся строка или только изменившиеся ячейки"""
+        return [
+            {"range": rowcol_to_a1(row, start + 1), "values": [chunk]}
+            for start, chunk in self._row_changes(values, old_values)
+        ]
+
+    def _forget_grid_rows(self):
+        """Сетку могли уменьшить вне сервиса (удаление строк): размер перечитается перед следующей записью"""
+        self._grid_rows = None
+
+    def _row_range(self, row: int, last_row: Optional[int] = None) -> str:
+        """Диапазон строки (или строк row..last_row) на всю ширину, которую пишет mapping()"""
+        width = self._get_layout().width
+        return f"A{row}:{rowcol_to_a1(last_row or row, width)}"
+
+
+def append_rows_request(sheet_id: int, grid_rows: int, last_row: int) -> Optional[dict]:
+    """Запрос appendDimension, расширяющий сетку до last_row с запасом GRID_HEADROOM, если строк не хватает"""
+    if last_row <= grid_rows:
+        return None
+    return {"appendDimension": {
+        "sheetId": sheet_id, "dimension": "ROWS", "length": last_row - grid_rows + GRID_HEADROOM,
+    }}
+
+
+def grid_rows_after(grid_rows: int, last_row: int) -> int:
+    """Размер сетки после append_rows_request"""
+    return last_row + GRID_HEADROOM if last_row > grid_rows else grid_rows
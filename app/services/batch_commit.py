@@ -0,0 +1,86 @@
+from typing import Any, Optional
+
+from app.helpers.cell_helper import typed_row, typed_value
+from app.services.base_sheets_service import append_rows_request, grid_rows_after
+
+# Формат дат в ячейках, которые пишутся числом (серийной датой), а не строкой
+DATE_NUMBER_FORMAT = {"type": "DATE", "pattern": "dd.mm.yyyy"}
+# Формат даты со временем (дробная серийная дата)
+DATE_TIME_NUMBER_FORMAT = {"type": "DATE_TIME", "pattern": "dd.mm.yyyy hh:mm:ss"}
+
+
+class BatchCommit:
+    """
+    Все записи пачки одним spreadsheets.batchUpdate (всё или ничего): расширение сетки, значения и формат дат.
+    Значения пишутся так, как их разобрал бы USER_ENTERED в локали листа.
+    """
+
+    def __init__(self, sheet_id: int, grid_rows: int, date_columns: tuple[int, ...] = (),
+                 locale: Optional[str] = None):
+        self.sheet_id = sheet_id
+        self.grid_rows = grid_rows
+        self.date_columns = frozenset(date_columns)
+        self.locale = locale
+        self.last_row = 0
+        self._value_requests: list[dict] = []
+        self._format_requests: list[dict] = []
+
+    def __bool__(self) -> bool:
+        return bool(self._value_requests)
+
+    def typed_row(self, values: list[Any]) -> list[Any]:
+        """
+        Строка в том виде, в каком её вернёт чтение с FORMULA: даты в колонках дат - серийными числами.
+        По ней сравниваются старые и новые значения, иначе дата всегда выглядела бы изменённой.
+        """
+        return typed_row(values, self.date_columns, self.locale)
+
+    def write(self, row: int, values: list[Any], start_col: int = 0):
+        """Записывает значения в строку row (с 1) начиная с колонки start_col (с 0)"""
+        cells = []
+        for col, value in enumerate(values, start=start_col):
+            is_date = col in self.date_columns
+            cell = to_cell_data(value, is_date, self.locale)
+            cells.append(cell)
+            number = cell.get("userEnteredValue", {}).get("numberValue")
+            if is_date and number is not None:
+                number_format = DATE_NUMBER_FORMAT if float(number).is_integer() else DATE_TIME_NUMBER_FORMAT
+                self._format_requests.append(self._update_cells(
+                    row, col, [{"userEnteredFormat": {"numberFormat": number_format}}],
+                    "userEnteredFormat.numberFormat",
+                ))
+        self._value_requests.append(self._update_cells(row, start_col, cells, "userEnteredValue"))
+        self.last_row = max(self.last_row, row)
+
+    def body(self) -> dict:
+        grow = append_rows_request(self.sheet_id, self.grid_rows, self.last_row)
+        return {"requests": ([grow] if grow else []) + self._value_requests + self._format_requests}
+
+    @property
+    def grid_rows_after(self) -> int:
+        """Размер сетки после применения запроса"""
+        return grid_rows_after(self.grid_rows, self.last_row)
+
+    def _update_cells(self, row: int, col: int, cells: list[dict], fields: str) -> dict:
+        return {"updateCells": {
+            "start": {"sheetId": self.sheet_id, "rowIndex": row - 1, "columnIndex": col},
+            "rows": [{"values": cells}],
+            "fields": fields,
+        }}
+
+
+def to_cell_data(value: Any, is_date: bool = False, locale: Optional[str] = None) -> dict:
+    """CellData для значения так, как его разобрал бы USER_ENTERED; пустая CellData очищает ячейку"""
+    if value is None or value == "":
+        return {}
+    if isinstance(value, bool):
+        return {"userEnteredValue": {"boolValue": value}}
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    value = str(value)
+    if value.startswith("="):
+        return {"userEnteredValue": {"formulaValue": value}}
+    typed = typed_value(value, is_date, locale)
+    if typed is not value:
+        return {"userEnteredValue": {"numberValue": typed}}
+    return {"userEnteredValue": {"stringValue": value}}
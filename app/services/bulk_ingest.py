@@ -0,0 +1,237 @@
+import codecs
+import json
+import logging
+from typing import Any, AsyncIterable, Iterable, Iterator, Optional
+
+from app.helpers.json_helper import dumps, loads
+from app.services.priority_lanes import SOURCE_FIELD
+from app.services.task_queue import queue_commands, stamp_received
+from app.task_dto import TaskDTO, TaskValidationError
+
+logger = logging.getLogger(__name__)
+
+# Максимальный размер одного payload задачи в пачке
+MAX_ITEM_SIZE = 1024 * 1024
+# Сколько задач пишется в Redis одним pipeline
+BULK_CHUNK_SIZE = 500
+
+
+class PayloadStreamParser:
+    """
+    Потоковый разбор тела пачки задач: JSON-массив или NDJSON (по объекту на строку).
+    Тело подаётся кусками через feed(), готовые элементы возвращаются сразу,
+    поэтому тело целиком в памяти не держится.
+    Элементы - пары (index, payload) либо (index, ValueError) для нераспознанных.
+    """
+
+    def __init__(self, max_item_size: int = MAX_ITEM_SIZE):
+        self.max_item_size = max_item_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._mode: Optional[str] = None  # "array" или "ndjson"
+        self._expect_item = True
+        self._ended = False  # массив закрыт "]", дальше допустимы только пробелы
+        self._done = False
+        self._index = 0
+
+    def feed(self, chunk: bytes) -> list[tuple[int, Any]]:
+        try:
+            self._buffer += self._decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            return self._fail(ValueError(f"Invalid UTF-8: {e}"))
+        return self._parse(final=False)
+
+    def close(self) -> list[tuple[int, Any]]:
+        try:
+            self._buffer += self._decoder.decode(b"", final=True)
+        except UnicodeDecodeError as e:
+            return self._fail(ValueError(f"Invalid UTF-8: {e}"))
+        items = self._parse(final=True)
+        if self._mode == "array" and not self._ended and not self._done:
+            items.extend(self._fail(ValueError("Unexpected end of JSON array")))
+        return items
+
+    def _parse(self, final: bool) -> list[tuple[int, Any]]:
+        if self._done:
+            return []
+        if self._mode is None:
+            stripped = self._buffer.lstrip()
+            if not stripped:
+                return []
+            self._mode = "array" if stripped[0] == "[" else "ndjson"
+            self._buffer = stripped[1:] if self._mode == "array" else stripped
+        if self._mode == "array":
+            return self._parse_array(final)
+        return self._parse_lines(final)
+
+    def _parse_lines(self, final: bool) -> list[tuple[int, Any]]:
+        items = []
+        lines = self._buffer.split("\n")
+        self._buffer = "" if final else lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line:
+                try:
+                    items.append(self._next(loads(line)))
+                except ValueError as e:
+                    items.append(self._next(ValueError(f"Invalid JSON: {e}")))
+        if len(self._buffer) > self.max_item_size:
+            items.extend(self._fail(ValueError("Task payload too large")))
+        return items
+
+    def _parse_array(self, final: bool) -> list[tuple[int, Any]]:
+        items = []
+        position = 0
+        buffer = self._buffer
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position >= len(buffer):
+                break
+            char = buffer[position]
+            if self._ended:
+                self._buffer = ""
+                return items + self._fail(ValueError("Unexpected data after JSON array"))
+            if char == "]" and (self._expect_item is None or (self._expect_item and self._index == 0)):
+                self._ended = True
+                position += 1
+                continue
+            if self._expect_item is None:
+                # После элемента ожидается запятая или конец массива
+                if char != ",":
+                    self._buffer = ""
+                    return items + self._fail(ValueError(f"Expected ',' or ']' at item {self._index}"))
+                self._expect_item = True
+                position += 1
+                continue
+            try:
+                value, end = self._json.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if final or len(buffer) - position > self.max_item_size:
+                    # Испорченный элемент массива: границу следующего найти нельзя, дальше не разбираем
+                    self._buffer = ""
+                    return items + self._fail(ValueError(f"Invalid JSON: {e.msg}"))
+                break  # Элемент ещё не пришёл целиком
+            items.append(self._next(value))
+            self._expect_item = None
+            position = end
+        self._buffer = buffer[position:]
+        return items
+
+    def _next(self, value: Any) -> tuple[int, Any]:
+        item = (self._index, value)
+        self._index += 1
+        return item
+
+    def _fail(self, error: ValueError) -> list[tuple[int, Any]]:
+        self._done = True
+        return [self._next(error)]
+
+
+class BulkResult:
+    """Результаты по каждому элементу пачки"""
+
+    def __init__(self):
+        self.results: list[dict] = []
+        self.accepted = 0
+        self.rejected = 0
+
+    def add_accepted(self, index: int, task_key: str):
+        self.accepted += 1
+        self.results.append({"index": index, "key": task_key, "status": "queued"})
+
+    def add_rejected(self, index: int, error: str, task_key: Optional[str] = None):
+        self.rejected += 1
+        result = {"index": index, "status": "error", "error": error}
+        if task_key:
+            result["key"] = task_key
+        self.results.append(result)
+
+    def to_dict(self) -> dict:
+        self.results.sort(key=lambda result: result["index"])
+        return {"accepted": self.accepted, "rejected": self.rejected, "results": self.results}
+
+
+def ingest(chunks: Iterable[bytes], redis_client, stream_mode: bool) -> dict:
+    """Разбирает, проверяет и ставит в очередь пачку задач, записывая в Redis pipeline по BULK_CHUNK_SIZE"""
+    parser = PayloadStreamParser()
+    result = BulkResult()
+    pending = []
+    for chunk in chunks:
+        pending.extend(_validate(parser.feed(chunk), result))
+        while len(pending) >= BULK_CHUNK_SIZE:
+            _write(redis_client, pending[:BULK_CHUNK_SIZE], stream_mode, result)
+            pending = pending[BULK_CHUNK_SIZE:]
+    pending.extend(_validate(parser.close(), result))
+    for start in range(0, len(pending), BULK_CHUNK_SIZE):
+        _write(redis_client, pending[start:start + BULK_CHUNK_SIZE], stream_mode, result)
+    return result.to_dict()
+
+
+async def ingest_async(chunks: AsyncIterable[bytes], redis_client, stream_mode: bool) -> dict:
+    """Асинхронный вариант ingest для redis.asyncio"""
+    parser = PayloadStreamParser()
+    result = BulkResult()
+    pending = []
+    async for chunk in chunks:
+        pending.extend(_validate(parser.feed(chunk), result))
+        while len(pending) >= BULK_CHUNK_SIZE:
+            await _write_async(redis_client, pending[:BULK_CHUNK_SIZE], stream_mode, result)
+            pending = pending[BULK_CHUNK_SIZE:]
+    pending.extend(_validate(parser.close(), result))
+    for start in range(0, len(pending), BULK_CHUNK_SIZE):
+        await _write_async(redis_client, pending[start:start + BULK_CHUNK_SIZE], stream_mode, result)
+    return result.to_dict()
+
+
+def _validate(items: list[tuple[int, Any]], result: BulkResult) -> Iterator[tuple[int, str, str]]:
+    """Проверяет элементы пачки, отдаёт (index, task_key, payload) корректных задач"""
+    for index, payload in items:
+        if isinstance(payload, ValueError):
+            result.add_rejected(index, str(payload))
+            continue
+        try:
+            task = TaskDTO.from_payload(payload)
+        except TaskValidationError as e:
+            result.add_rejected(index, str(e), payload.get("key") if isinstance(payload, dict) else None)
+            continue
+        # Пакетные задачи воркер может отнести к фоновой полосе (правило sources: [bulk] в lanes.yaml)
+        payload[SOURCE_FIELD] = "bulk"
+        yield index, task.key, dumps(stamp_received(payload))
+
+
+def _write(redis_client, chunk: list[tuple[int, str, str]], stream_mode: bool, result: BulkResult):
+    try:
+        _pipeline(redis_client, chunk, stream_mode).execute()
+    except Exception as e:
+        _write_failed(chunk, e, result)
+        return
+    for index, task_key, _ in chunk:
+        result.add_accepted(index, task_key)
+
+
+async def _write_async(redis_client, chunk: list[tuple[int, str, str]], stream_mode: bool, result: BulkResult):
+    try:
+        await _pipeline(redis_client, chunk, stream_mode).execute()
+    except Exception as e:
+        _write_failed(chunk, e, result)
+        return
+    for index, task_key, _ in chunk:
+        result.add_accepted(index, task_key)
+
+
+def _write_failed(chunk: list[tuple[int, str, str]], error: Exception, result: BulkResult):
+    logger.error("Failed to queue %s tasks: %s", len(chunk), error)
+    for index, task_key, _ in chunk:
+        result.add_rejected(index, "Failed to queue task", task_key)
+
+
+def _pipeline(redis_client, chunk: list[tuple[int, str, str]], stream_mode: bool):
+    pipe = redis_client.pipeline(transaction=False)
+    for _, task_key, payload in chunk:
+        if stream_mode:
+            queue_commands(pipe, task_key, payload)
+        else:
+            pipe.set(task_key, payload)
+    return pipe
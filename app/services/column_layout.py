@@ -0,0 +1,32 @@
+from typing import Optional
+
+from app.enums.column_enum import ColumnEnum
+
+
+class ColumnLayout:
+    """
+    Раскладка колонок листа, вычисляемая один раз по строке заголовков.
+    ColumnEnum и колонки сотрудников (оценки SP разработки/тестирования) сопоставляются
+    с позициями в строке, чтобы mapping() писал значения напрямую по индексу.
+    """
+
+    def __init__(self, header: list[str], width: int = 50):
+        self.header = header
+        self.width = width
+        # Колонки, которых нет в заголовке, пишутся в лишнюю ячейку за пределами строки и отбрасываются
+        self.sink = width
+        self.people: dict[str, int] = {}
+        for i, name in enumerate(header[:width]):
+            # При повторяющихся заголовках используется первая колонка
+            self.people.setdefault(name, i)
+        self.columns: dict[ColumnEnum, int] = {
+            column: self.people.get(column.value, self.sink) for column in ColumnEnum
+        }
+
+    def person_column(self, name: Optional[str]) -> Optional[int]:
+        if not name:
+            return None
+        return self.people.get(name)
+
+    def empty_row(self) -> list:
+        return [''] * (self.width + 1)
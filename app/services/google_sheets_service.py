@@ -1,44 +1,85 @@
+import logging
 import re
-from datetime import datetime
 import time
-from typing import Optional, Any
+from contextlib import contextmanager, nullcontext
+from typing import Optional
 
 import gspread
-from gspread.utils import ValueInputOption
+from gspread.utils import ValueInputOption, ValueRenderOption
 from gspread.exceptions import APIError
 
-from app.helpers.string_helper import extract_dates
+from app.helpers.string_helper import extract_task_key
 from app.task_dto import TaskDTO
 from config import config
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
-from app.enums.column_enum import ColumnEnum
+from app.services.base_sheets_service import BaseSheetsService
+from app.services.batch_commit import BatchCommit
+from app.services.metrics import track_api_call
+from app.services.quota_scheduler import (
+    READ, WRITE, QuotaScheduler, is_quota_error, retry_after_seconds, sheets_retry
+)
+from app.services.row_index import RowIndex
+from app.services.sheet_lock import SheetLock
+from app.services.task_archive import TaskArchive
+from app.services.worksheet_mirror import WorksheetMirror
 from logging_config import logger
 
 
-class GoogleSheetsService:
-    def __init__(self):
+class GoogleSheetsService(BaseSheetsService):
+    def __init__(self, redis_client=None, sheet_key: Optional[str] = None, worksheet_title: Optional[str] = None,
+                 quota_namespace: Optional[str] = None, quota_tenant: Optional[str] = None,
+                 mirror: Optional[bool] = None, diff_writes: Optional[bool] = None):
+        super().__init__(diff_writes)
         self.task_key = None
+        self.sheet_key = sheet_key or config.get('GOOGLE_SHEET_KEY')
+        self.worksheet_title = worksheet_title or config.get('GOOGLE_SHEET_WORKSHEET')
+        self.redis_client = redis_client
+        self.row_index = None
         self.sheet = None
         self.worksheet = None
-        self.header = None
+        self.mirror = None
+        self.archive = None
+        if mirror is None:
+            mirror = (config.get('SHEET_MIRROR_ENABLED') or '').lower() in ('1', 'true', 'yes')
+        self._mirror_enabled = mirror
         self._cached_keys = None
         self._cache_timestamp = 0
         self._cache_duration = 30  # кэш на 30 секунд
-        self._last_request_time = 0
-        self._min_request_interval = 1.0  # минимум 1 секунда между запросами
+        # Квота общая для всех процессов с тем же Redis и QUOTA_NAMESPACE, quota_tenant - доля листа в ней
+        self.quota = QuotaScheduler.from_config(redis_client, namespace=quota_namespace, tenant=quota_tenant)
+        # Блокировка записи в лист между репликами: номера строк определяются и пишутся под ней
+        self.write_lock = (SheetLock.from_config(redis_client, self.sheet_key, self.worksheet_title)
+                           if redis_client is not None else None)
+        self._batch_get_chunk_size = 100  # диапазонов в одном batch_get, чтобы не упереться в длину URL
+        # Вся пачка (обновления, новые строки, расширение сетки) одним spreadsheets.batchUpdate
+        self._single_commit = (config.get('SHEET_BATCH_COMMIT') or '').lower() in ('1', 'true', 'yes')
         self._initialize_connection()
 
-    @retry(
-        stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((APIError, ConnectionError, TimeoutError))
-    )
+    @sheets_retry(attempts=5, min_wait=4, max_wait=10)
     def _initialize_connection(self):
         try:
             gc = gspread.service_account(filename='credentials/google.json')
-            self.sheet = gc.open_by_key(config.get('GOOGLE_SHEET_KEY'))
-            self.worksheet = self.sheet.worksheet(config.get('GOOGLE_SHEET_WORKSHEET'))
+            self.sheet = gc.open_by_key(self.sheet_key)
+            self.worksheet = self.sheet.worksheet(self.worksheet_title)
+            self._grid_rows = self.worksheet.row_count
+            self.locale = self.sheet.locale
+            if self._mirror_enabled:
+                self.mirror = WorksheetMirror(
+                    self.sheet,
+                    self.worksheet,
+                    sync_interval=int(config.get('SHEET_MIRROR_SYNC_INTERVAL') or 600),
+                    cache_path=self._mirror_cache_path(),
+                    quota=self.quota,
+                )
+                self.mirror.ensure_fresh()
+            elif self.redis_client is not None and self._row_index_enabled():
+                self.row_index = RowIndex(
+                    self.redis_client,
+                    f"{self.sheet.id}:{self.worksheet.id}",
+                    rebuild_interval=int(config.get('ROW_INDEX_REBUILD_INTERVAL') or 3600),
+                )
+            if self.redis_client is not None and self._archive_enabled():
+                self.archive = TaskArchive.from_config(self, self.redis_client)
             self.header = self._get_header()
             logger.info("Google Sheets connection initialized successfully")
         except Exception as e:
@@ -50,13 +91,68 @@ class GoogleSheetsService:
         if self.sheet is None or self.worksheet is None:
             self._initialize_connection()
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=8),
-        retry=retry_if_exception_type((APIError, ConnectionError, TimeoutError))
-    )
+    def _mirror_cache_path(self) -> Optional[str]:
+        # Файл копии свой для каждого листа, сервисов может быть несколько (см. SheetRouter)
+        path = config.get('SHEET_MIRROR_PATH')
+        return f"{path}.{self.sheet.id}.{self.worksheet.id}" if path else None
+
+    @staticmethod
+    def _row_index_enabled() -> bool:
+        return (config.get('ROW_INDEX_ENABLED') or '').lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def _archive_enabled() -> bool:
+        return (config.get('ARCHIVE_ENABLED') or '').lower() in ('1', 'true', 'yes')
+
+    def _ensure_row_index(self):
+        """Перестраивает индекс строк по первому столбцу, если он отсутствует или устарел"""
+        if self.row_index.is_ready():
+            return
+        self.row_index.rebuild(self._call(READ, self.worksheet.col_values, 1))
+
+    def _reset_row_lookup(self):
+        """Сбрасывает кэш ключей и индекс строк после обнаруженного расхождения"""
+        self.clear_cache()
+        self._forget_grid_rows()
+        if self.row_index is not None:
+            self.row_index.invalidate()
+
+    def _sync_mirror(self):
+        """Сверяет локальную копию листа с таблицей, если она включена"""
+        if self.mirror is None:
+            return
+        self.mirror.ensure_fresh()
+        header = self._get_header()
+        if header != self.header:
+            self.header = header
+
+    def _commit_mirror(self, rows: list[tuple[int, list]]):
+        """Переносит успешно записанные строки в локальную копию листа"""
+        if self.mirror is None:
+            return
+        for row, values in rows:
+            self.mirror.set_row(row, values)
+        self.mirror.commit()
+
+    def _write_locked(self):
+        return self.write_lock if self.write_lock is not None else nullcontext()
+
+    @contextmanager
+    def _mirror_write(self):
+        """Запись в лист: если она упала, незафиксированная запись локальной копии отменяется"""
+        try:
+            yield
+        except BaseException:
+            if self.mirror is not None:
+                self.mirror.abort_write()
+            raise
+
+    @sheets_retry()
     def _find_first_empty_row(self) -> int:
         self._ensure_connection()
+        if self.row_index is not None:
+            self._ensure_row_index()
+            return self.row_index.next_row()
         try:
             col_values = self._get_cached_keys()  # Получаем значения первого столбца с кэшированием
             for line_number, value in enumerate(col_values, start=2):
@@ -67,17 +163,16 @@ class GoogleSheetsService:
             logger.error(f"{self.task_key} | Error finding empty row: {e}")
             raise
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=8),
-        retry=retry_if_exception_type((APIError, ConnectionError, TimeoutError))
-    )
+    @sheets_retry()
     def _find_task_row_by_prefix(self, prefix: str) -> Optional[int]:
         self._ensure_connection()
+        if self.mirror is not None:
+            return self.mirror.find_row(prefix)
+        if self.row_index is not None and self.row_index.is_ready():
+            return self.row_index.lookup([prefix]).get(prefix)
         try:
-            self._rate_limit()
             pattern = re.compile(f'{prefix}: .+', re.IGNORECASE)
-            cell = self.worksheet.find(pattern, in_column=1)
+            cell = self._call(READ, self.worksheet.find, pattern, in_column=1)
             if cell:
                 return cell.row
             return None
@@ -85,24 +180,15 @@ class GoogleSheetsService:
             logger.error(f"{self.task_key} | Error finding task row: {e}")
             return None
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=8),
-        retry=retry_if_exception_type((APIError, ConnectionError, TimeoutError))
-    )
+    @sheets_retry()
     def _get_header(self) -> Optional[list]:
         self._ensure_connection()
         try:
-            self._rate_limit()
-            headers = self.worksheet.row_values(1)
-            # Ищем ключ, который начинается с "Текущий спринт" значение может быть "Текущий спринт (461/1804)"
-            # Для того, что бы взять его индекс и заменить на "Текущий спринт"
-            sprint_index = next(
-                (i for i, header in enumerate(headers) if header.startswith("Текущий спринт")),
-                None  # если не найдено
-            )
-            headers[sprint_index] = "Текущий спринт"
-            return headers
+            if self.mirror is not None:
+                headers = self.mirror.header
+            else:
+                headers = self._call(READ, self.worksheet.row_values, 1)
+            return self._normalize_header(headers)
         except Exception as e:
             logger.error(f"{self.task_key} | Error finding header row: {e}")
             return None
@@ -111,10 +197,27 @@ class GoogleSheetsService:
         """
         Обычное сохранение задачи в Google Sheets.
         """
+        with self._write_locked(), self._mirror_write():
+            self._store_task(task)
+
+    def _store_task(self, task: TaskDTO):
+        if self._single_commit:
+            # Запись одной задачи - частный случай пачки, тоже один запрос на запись
+            self.task_key = task.key
+            self.store_tasks_batch([task])
+            return
         try:
             self.task_key = task.key
+            self._start_batch()
             self._ensure_connection()
+            self._sync_mirror()
             row = self._find_task_row_by_prefix(task.key)
+            if row is None and self.archive is not None and self.archive.archived_keys([task.key]):
+                # Задача в архиве: обновление архива или перенос обратно - в пакетном пути
+                self.store_tasks_batch([task])
+                return
+            if self.archive is not None:
+                self.archive.track([task])
             if row is not None:
                 self.update_task(task, row)
                 logger.info(f"{self.task_key} | Updated task {task.key} at row {row}")
@@ -136,16 +239,35 @@ class GoogleSheetsService:
         Пакетное сохранение задач в Google Sheets.
         Обновляет существующие задачи и добавляет новые за одну операцию.
         """
+        with self._write_locked(), self._mirror_write():
+            self._store_tasks_batch(tasks)
+
+    def _store_tasks_batch(self, tasks: list[TaskDTO]):
+        self._start_batch()
         self._ensure_connection()
-        # Получаем все значения первого столбца (ключи задач) с кэшированием
-        all_keys = self._get_cached_keys()
-        # Сопоставляем ключ -> номер строки
-        key_to_row = {}
-        # Ставим start=1, чтобы строки начинались с 1 (в google sheets строки начинаются с 1)
-        for idx, value in enumerate(all_keys, start=1):
-            if value:
-                prefix = value.split(":")[0]
-                key_to_row[prefix] = idx
+        self._sync_mirror()
+        if self.archive is not None:
+            self.archive.track(tasks)
+        task_keys = [task.key for task in tasks]
+        key_to_row, first_empty_row = self._resolve_rows(task_keys)
+
+        # Читаем все обновляемые строки заранее, одним запросом на пачку строк. В тот же запрос входят
+        # строки, куда будут дописаны новые задачи: первая свободная строка из индекса или кэша ключей
+        # может устареть (строки добавили вручную), тогда они не пустые и номера строк пересобираются
+        append_count = len(set(task_keys) - set(key_to_row))
+        existing_rows = self._get_rows(list(key_to_row.values()), (first_empty_row, append_count))
+        if (self._has_row_drift(key_to_row, existing_rows)
+                or self._has_append_drift(first_empty_row, append_count, existing_rows)):
+            logger.warning("Task rows moved in the worksheet, rebuilding row lookup")
+            self._reset_row_lookup()
+            key_to_row, first_empty_row = self._resolve_rows(task_keys)
+            append_count = len(set(task_keys) - set(key_to_row))
+            existing_rows = self._get_rows(list(key_to_row.values()), (first_empty_row, append_count))
+
+        # Строки без ключа в первом столбце не видны ни индексу, ни чтению ключей: дописываем ниже них
+        while self._has_append_drift(first_empty_row, append_count, existing_rows):
+            first_empty_row = self._skip_taken_rows(first_empty_row, existing_rows)
+            existing_rows.update(self._get_rows([], (first_empty_row, append_count)))
 
         # Готовим данные для обновления и создания
         updates = []
@@ -153,84 +275,243 @@ class GoogleSheetsService:
         for task in tasks:
             row = key_to_row.get(task.key)
             if row:
-                try:
-                    old_task_list = self.worksheet.get(f"A{row}:AM{row}")[0]
-                except Exception:
-                    old_task_list = ['' for _ in range(50)]
+                old_task_list = existing_rows.get(row) or ['' for _ in range(50)]
                 task_list = self.mapping(task, old_task_list)
-                updates.append((task.key, row, task_list))
+                updates.append((task.key, row, task_list, old_task_list))
             else:
                 creates.append((task.key, task))
 
-        # Пакетное обновление существующих задач
-        if updates:
-            self._batch_update_rows(updates)
-
-        # Пакетное создание новых задач (в конец таблицы)
-        if creates:
-            first_empty_row = len(all_keys) + 1
-            self._batch_create_rows(creates, first_empty_row)
+        # Задачи, которых нет в рабочем листе, могут быть в архиве
+        previous_rows = {}
+        if creates and self.archive is not None:
+            creates, previous_rows = self._split_archived(creates)
+
+        if self._single_commit:
+            self._commit_batch(updates, creates, first_empty_row, previous_rows)
+        else:
+            # Пакетное обновление существующих задач
+            if updates:
+                self._batch_update_rows(updates)
+
+            # Пакетное создание новых задач (в конец таблицы)
+            if creates:
+                self._batch_create_rows(creates, first_empty_row, previous_rows)
+        # Переоткрытые задачи уже в рабочем листе, убираем их из архива
+        if previous_rows:
+            self.archive.remove(list(previous_rows))
         
         # Очищаем кэш после успешного обновления, чтобы данные были актуальными
         if updates or creates:
             self.clear_cache()
 
-    def _batch_create_rows(self, creates: list[tuple[str, TaskDTO]], first_empty_row: int):
+    def _resolve_rows(self, task_keys: list[str]) -> tuple[dict[str, int], int]:
+        """
+        Сопоставляет ключи задач с номерами строк.
+        Возвращает (ключ -> номер строки для найденных задач, первая свободная строка для новых).
+        """
+        if self.row_index is not None:
+            self._ensure_row_index()
+            return self.row_index.lookup(task_keys), self.row_index.next_row()
+
+        # Получаем все значения первого столбца (ключи задач) с кэшированием
+        all_keys = self._get_cached_keys()
+        # Сопоставляем ключ -> номер строки
+        all_rows = {}
+        # Ставим start=1, чтобы строки начинались с 1 (в google sheets строки начинаются с 1)
+        for idx, value in enumerate(all_keys, start=1):
+            prefix = extract_task_key(value)
+            if prefix:
+                all_rows[prefix] = idx
+        key_to_row = {key: all_rows[key] for key in task_keys if key in all_rows}
+        return key_to_row, len(all_keys) + 1
+
+    def _split_archived(self, creates: list[tuple[str, TaskDTO]]) -> tuple[list[tuple[str, TaskDTO]], dict]:
+        """
+        Разбирает новые для рабочего листа задачи, которые уже в архиве.
+        Завершённые обновляются прямо в архиве, переоткрытые создаются в рабочем листе со старыми
+        значениями строки (комментарий сохраняется). Возвращает (задачи для создания, ключ -> старая строка).
+        """
+        archived = self.archive.archived_keys([key for key, _ in creates])
+        if not archived:
+            return creates, {}
+        done = [task for key, task in creates if key in archived and self.archive.is_terminal(task.status)]
+        missing = {task.key for task in self.archive.update(done)} if done else set()
+        reopened = [key for key, task in creates if key in archived and not self.archive.is_terminal(task.status)]
+        previous_rows = self.archive.restore(reopened) if reopened else {}
+        if reopened:
+            logger.info("Reactivating %d archived tasks", len(reopened))
+        creates = [(key, task) for key, task in creates
+                   if key not in archived or key in missing or key in previous_rows]
+        return creates, previous_rows
+
+    @sheets_retry()
+    def _get_rows(self, rows: list[int], append_span: Optional[tuple[int, int]] = None) -> dict[int, list]:
+        """
+        Читает несколько строк через batch_get.
+        Возвращает словарь номер строки -> значения (пустой список, если строка пустая).
+        append_span - (первая строка, число строк): блок строк под дозапись, читается одним диапазоном
+        в первом же batch_get; в результат попадают только непустые строки блока.
+        """
+        rows = sorted(set(rows))
+        first, count = append_span or (0, 0)
+        result = {}
+        if self.mirror is not None:
+            for row in range(first, first + count):
+                values = self.mirror.get_row(row)
+                if any(value not in (None, '') for value in values):
+                    result[row] = values
+            result.update({row: self.mirror.get_row(row) for row in rows})
+            return result
+
+        for start in range(0, max(len(rows), 1), self._batch_get_chunk_size):
+            chunk = rows[start:start + self._batch_get_chunk_size]
+            ranges = [self._row_range(row) for row in chunk]
+            if start == 0 and count:
+                ranges.append(self._row_range(first, first + count - 1))
+            if not ranges:
+                break
+            value_ranges = self._call(READ, self.worksheet.batch_get, ranges,
+                                      value_render_option=ValueRenderOption.formula)
+            if start == 0 and count:
+                for row, values in enumerate(value_ranges[-1], start=first):
+                    if any(value not in (None, '') for value in values):
+                        result[row] = list(values)
+            for row, value_range in zip(chunk, value_ranges):
+                result[row] = list(value_range[0]) if value_range else []
+        return result
+
+    def _batch_create_rows(self, creates: list[tuple[str, TaskDTO]], first_empty_row: int,
+                           previous_rows: Optional[dict[str, list]] = None):
         """
         Пакетное добавление строк в Google Sheets.
         creates: список кортежей (task_key, task_dto)
+        previous_rows: прежние строки задач, возвращаемых из архива
         """
 
         create_rows = []
         for task_key, task in creates:
-            task_list = self.mapping(task)
+            task_list = self.mapping(task, (previous_rows or {}).get(task_key))
             create_rows.append(task_list)
         
-        self._rate_limit()
-        self.worksheet.update(f"A{first_empty_row}", create_rows, value_input_option=ValueInputOption.user_entered)
+        self._call(WRITE, self.worksheet.update, f"A{first_empty_row}", create_rows,
+                   value_input_option=ValueInputOption.user_entered)
+        self._commit_mirror(list(enumerate(create_rows, start=first_empty_row)))
+        if self.row_index is not None:
+            self.row_index.set_rows(
+                {task_key: row for row, (task_key, _) in enumerate(creates, start=first_empty_row)},
+                first_empty_row + len(creates),
+            )
 
-        row = first_empty_row
-        for task_key, _ in creates:
-            logger.info(f"{task_key} | Created new task {task_key} at row {row}" )
-            row += 1
+        logger.info("Created %d tasks at rows %d-%d", len(creates), first_empty_row,
+                    first_empty_row + len(creates) - 1)
+        if logger.isEnabledFor(logging.DEBUG):
+            for row, (task_key, _) in enumerate(creates, start=first_empty_row):
+                logger.debug("%s | Created new task at row %d", task_key, row)
 
-    def _batch_update_rows(self, updates: list[tuple[str, int, list]]):
+    def _batch_update_rows(self, updates: list[tuple[str, int, list, list]]):
         """
         Пакетное обновление строк в Google Sheets.
-        updates: список кортежей (task_key, row_number, values_list)
+        updates: список кортежей (task_key, row_number, values_list, old_values_list)
         """
         requests = []
-        for _, row, values in updates:
-            range_a1 = f"A{row}"
-            requests.append({
-                "range": range_a1,
-                "values": [values]
-            })
-        
-        self._rate_limit()
-        self.worksheet.batch_update(requests, value_input_option=ValueInputOption.user_entered)
-
-        for task_key, row, _ in updates:
-            logger.info(f"{task_key} | Updated task {task_key} at row {row}")
+        changed = []
+        for task_key, row, values, old_values in updates:
+            row_requests = self._row_update_requests(row, values, old_values)
+            if row_requests:
+                requests.extend(row_requests)
+                changed.append((task_key, row, values))
+
+        skipped = len(updates) - len(changed)
+        if not requests:
+            logger.info("Skipped %d unchanged rows", skipped)
+            return
+
+        self._call(WRITE, self.worksheet.batch_update, requests, value_input_option=ValueInputOption.user_entered)
+        self._commit_mirror([(row, values) for _, row, values in changed])
+
+        logger.info("Updated %d tasks (%d cell ranges), skipped %d unchanged rows", len(changed), len(requests),
+                    skipped)
+        if logger.isEnabledFor(logging.DEBUG):
+            for task_key, row, _ in changed:
+                logger.debug("%s | Updated task at row %d", task_key, row)
+
+    def _commit_batch(self, updates: list[tuple[str, int, list, list]], creates: list[tuple[str, TaskDTO]],
+                      first_empty_row: int, previous_rows: dict[str, list]):
+        """
+        Записывает изменения и новые строки пачки одним spreadsheets.batchUpdate (всё или ничего).
+        Сетка листа при нехватке строк расширяется в том же запросе.
+        """
+        commit = BatchCommit(self.worksheet.id, self._get_grid_rows(), self._date_columns(), self.locale)
+        changed = []
+        for task_key, row, values, old_values in updates:
+            values = commit.typed_row(values)
+            changes = self._row_changes(values, old_values)
+            for start, chunk in changes:
+                commit.write(row, chunk, start)
+            if changes:
+                changed.append((task_key, row, values))
+
+        create_rows = [commit.typed_row(self.mapping(task, previous_rows.get(task_key)))
+                       for task_key, task in creates]
+        for row, values in enumerate(create_rows, start=first_empty_row):
+            commit.write(row, values)
+
+        skipped = len(updates) - len(changed)
+        if not commit:
+            logger.info("Skipped %d unchanged rows", skipped)
+            return
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=8),
-        retry=retry_if_exception_type((APIError, ConnectionError, TimeoutError))
-    )
+        try:
+            self._call(WRITE, self.sheet.batch_update, commit.body())
+        except APIError:
+            self._forget_grid_rows()
+            raise
+        self._grid_rows = commit.grid_rows_after
+
+        self._commit_mirror([(row, values) for _, row, values in changed]
+                            + list(enumerate(create_rows, start=first_empty_row)))
+        if self.row_index is not None and creates:
+            self.row_index.set_rows(
+                {task_key: row for row, (task_key, _) in enumerate(creates, start=first_empty_row)},
+                first_empty_row + len(creates),
+            )
+        logger.info("Committed %d updated and %d created tasks in one request, skipped %d unchanged rows",
+                    len(changed), len(creates), skipped)
+        if logger.isEnabledFor(logging.DEBUG):
+            for task_key, row, _ in changed:
+                logger.debug("%s | Updated task at row %d", task_key, row)
+            for row, (task_key, _) in enumerate(creates, start=first_empty_row):
+                logger.debug("%s | Created new task at row %d", task_key, row)
+
+    def _get_grid_rows(self) -> int:
+        if self._grid_rows is None:
+            # Свойства листа (в том числе размер сетки) приходят вместе с метаданными таблицы
+            self.worksheet = self._call(READ, self.sheet.worksheet, self.worksheet_title)
+            self._grid_rows = self.worksheet.row_count
+        return self._grid_rows
+
+    @sheets_retry()
     def create_task(self, task: TaskDTO):
         self._ensure_connection()
         row = self._find_first_empty_row()
+        taken = self._get_rows([], (row, 1))
+        if self.row_index is not None and self._has_append_drift(row, 1, taken):
+            # Первая свободная строка из индекса устарела (строки добавили вне сервиса)
+            logger.warning(f"{self.task_key} | Row {row} is not empty, rebuilding row index")
+            self._reset_row_lookup()
+            row = self._find_first_empty_row()
+            taken = self._get_rows([], (row, 1))
+        while self._has_append_drift(row, 1, taken):
+            row = self._skip_taken_rows(row, taken)
+            taken.update(self._get_rows([], (row, 1)))
         task_list = self.mapping(task)
-        self._rate_limit()
-        self.worksheet.update([task_list], f"A{row}",
-                              value_input_option=ValueInputOption.user_entered)
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=8),
-        retry=retry_if_exception_type((APIError, ConnectionError, TimeoutError))
-    )
+        self._call(WRITE, self.worksheet.update, [task_list], f"A{row}",
+                   value_input_option=ValueInputOption.user_entered)
+        self._commit_mirror([(row, task_list)])
+        if self.row_index is not None:
+            self.row_index.set_rows({task.key: row}, row + 1)
+
+    @sheets_retry()
     def update_task(self, task: TaskDTO, row=None):
         self._ensure_connection()
         if row is None:
@@ -238,90 +519,56 @@ class GoogleSheetsService:
             if row is None:
                 raise ValueError(f"{self.task_key} | Task {task.key} not found")
 
-        try:
-            self._rate_limit()
-            old_task_list = self.worksheet.get(f"A{row}:AM{row}")[0]
-        except IndexError:
-            # Если строка пустая, создаем пустой список
-            old_task_list = ['' for _ in range(12)]
+        if self.mirror is not None:
+            old_task_list = self.mirror.get_row(row)
+        else:
+            try:
+                old_task_list = self._call(READ, self.worksheet.get, self._row_range(row),
+                                           value_render_option=ValueRenderOption.formula)[0]
+            except IndexError:
+                # Если строка пустая, создаем пустой список
+                old_task_list = ['' for _ in range(12)]
+
+            # Строку искали по индексу, проверяем, что задача всё ещё в ней (после сброса индекса ищем через find)
+            if (self.row_index is not None and self.row_index.is_ready()
+                    and self._has_row_drift({task.key: row}, {row: old_task_list})):
+                logger.warning(f"{self.task_key} | Task {task.key} is not at row {row}, rebuilding row index")
+                self._reset_row_lookup()
+                return self.update_task(task)
 
         task_list = self.mapping(task, old_task_list)
-        self._rate_limit()
-        self.worksheet.update([task_list], f"A{row}",
-                              value_input_option=ValueInputOption.user_entered)
-
-    def mapping(self, task: TaskDTO, old_task_list=None) -> list[dict[str, Any]]:
-        max_columns_count = 50
-        if old_task_list is None:
-            old_task_list = ['' for _ in range(max_columns_count)]
-
-        # Убеждаемся, что список достаточно длинный
-        while len(old_task_list) < max_columns_count:
-            old_task_list.append('')
-
-        old_task_list = self.add_columns_keys(old_task_list)
-        task_list = self.add_columns_keys(['' for _ in range(max_columns_count)])
-
-        sprint = self.is_current_date_in_sprint(task.sprint)
-
-        task_list[ColumnEnum.name.value] = task.hyperlink
-        task_list[ColumnEnum.assignee.value] = task.assignee
-        task_list[ColumnEnum.type.value] = task.type or ""
-        task_list[ColumnEnum.sprint.value] = sprint
-        task_list[ColumnEnum.status.value] = task.status or ""
-        task_list[ColumnEnum.stage_deadline.value] = task.stage_deadline or ""
-        task_list[ColumnEnum.due_date.value] = task.due_date or ""
-        task_list[ColumnEnum.deadline_fact.value] = task.deadline_fact or ""
-        task_list[ColumnEnum.project.value] = task.project or ""
-        task_list[ColumnEnum.priority.value] = task.priority or ""
-        task_list[ColumnEnum.off_the_plan.value] = task.off_the_plan
-        task_list[ColumnEnum.outside_of_the_sprint_plan.value] = task.outside_sprint
-        task_list[ColumnEnum.moving_on_to_the_next_sprint.value] = task.moving_next_sprint
-        task_list[ColumnEnum.comment.value] = old_task_list[ColumnEnum.comment.value] or ""
-
-        if task.dev != "" and task.sp_development != "":
-            task_list[task.dev] = task.sp_development
-
-        if task.qa_engineer != "" and task.sp_testing != "":
-            task_list[task.qa_engineer] = task.sp_testing
-
-        return list(task_list.values())
-
-    def add_columns_keys(self, data: list[Any]) -> dict[str, Any]:
-        result = {}
-        for i, value in enumerate(data):
-            key = self.header[i] if i < len(self.header) else str(i)
-            result[key] = value
-        return result
-
-    @staticmethod
-    def is_current_date_in_sprint(sprint: str) -> bool:
-        dates = extract_dates(sprint)
-        if not dates:
-            return False
-
-        start_date, end_date = dates
-        today = datetime.now().date()
-        return start_date <= today <= end_date
-
-    def _rate_limit(self):
-        """Ограничивает частоту запросов к API"""
-        current_time = time.time()
-        time_since_last_request = current_time - self._last_request_time
-        if time_since_last_request < self._min_request_interval:
-            sleep_time = self._min_request_interval - time_since_last_request
-            logger.debug(f"Rate limiting: sleeping for {sleep_time:.2f} seconds")
-            time.sleep(sleep_time)
-        self._last_request_time = time.time()
+        requests = self._row_update_requests(row, task_list, old_task_list)
+        if not requests:
+            logger.info(f"{self.task_key} | Task {task.key} at row {row} is unchanged, skipping")
+            return
+
+        self._call(WRITE, self.worksheet.batch_update, requests, value_input_option=ValueInputOption.user_entered)
+        self._commit_mirror([(row, task_list)])
+
+    def _call(self, kind: str, func, *args, **kwargs):
+        """Выполняет запрос к API, получив слот у планировщика квоты и сообщив ему о 429"""
+        if kind == WRITE and self.mirror is not None:
+            # Версия документа до своей записи: по ней копия отличит чужие правки от своих
+            self.mirror.begin_write()
+        self.quota.acquire(kind)
+        try:
+            with track_api_call(func.__name__):
+                return func(*args, **kwargs)
+        except APIError as e:
+            if is_quota_error(e):
+                self.quota.report_throttled(kind, retry_after_seconds(e))
+            raise
 
     def _get_cached_keys(self):
         """Получает ключи с кэшированием"""
+        if self.mirror is not None:
+            return self.mirror.keys()
+
         current_time = time.time()
         if (self._cached_keys is None or 
             current_time - self._cache_timestamp > self._cache_duration):
             
-            self._rate_limit()
-            self._cached_keys = self.worksheet.col_values(1)
+            self._cached_keys = self._call(READ, self.worksheet.col_values, 1)
             self._cache_timestamp = current_time
             logger.debug("Refreshed cached keys from Google Sheets")
         
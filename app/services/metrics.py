@@ -0,0 +1,99 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# Метрики пайплайна синхронизации. В вебе (gunicorn с несколькими воркерами) метрики собираются со всех
+# процессов через каталог PROMETHEUS_MULTIPROC_DIR (задаётся в gunicorn_config), воркер очереди отдаёт
+# метрики на отдельном порту.
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_LAG_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+WEBHOOK_REQUESTS = Counter(
+    "sheets_sync_webhook_requests_total", "Webhook requests by endpoint and response status",
+    ["endpoint", "status"],
+)
+WEBHOOK_LATENCY = Histogram(
+    "sheets_sync_webhook_latency_seconds", "Webhook handling time", ["endpoint"], buckets=_LATENCY_BUCKETS,
+)
+
+QUEUE_DEPTH = Gauge(
+    "sheets_sync_queue_depth", "Tasks waiting in Redis and in the worker write buffer", ["queue"],
+    multiprocess_mode="livesum",
+)
+QUEUE_OLDEST_AGE = Gauge(
+    "sheets_sync_queue_oldest_age_seconds", "Age of the oldest task not yet written to the sheet",
+    multiprocess_mode="livemax",
+)
+LANE_DEPTH = Gauge(
+    "sheets_sync_lane_depth", "Tasks waiting in the worker write buffer by priority lane", ["lane"],
+    multiprocess_mode="livesum",
+)
+LANE_OLDEST_AGE = Gauge(
+    "sheets_sync_lane_oldest_age_seconds", "Age of the oldest buffered task by priority lane", ["lane"],
+    multiprocess_mode="livemax",
+)
+LANE_LAG = Histogram(
+    "sheets_sync_lane_lag_seconds", "Time from webhook receipt to the sheet write by priority lane", ["lane"],
+    buckets=_LAG_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "sheets_sync_batch_size", "Tasks written per buffer flush",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+MAPPING_SECONDS = Histogram(
+    "sheets_sync_mapping_seconds", "Time to map one task to a sheet row",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+END_TO_END_LAG = Histogram(
+    "sheets_sync_end_to_end_lag_seconds", "Time from webhook receipt to the sheet write", buckets=_LAG_BUCKETS,
+)
+
+SHEETS_API_CALLS = Counter(
+    "sheets_sync_api_calls_total", "Google Sheets API calls by operation and result", ["operation", "status"],
+)
+SHEETS_API_LATENCY = Histogram(
+    "sheets_sync_api_latency_seconds", "Google Sheets API call latency", ["operation"], buckets=_LATENCY_BUCKETS,
+)
+QUOTA_WAIT_SECONDS = Histogram(
+    "sheets_sync_quota_wait_seconds", "Time spent waiting for a quota slot", ["kind"], buckets=_LATENCY_BUCKETS,
+)
+QUOTA_THROTTLED = Counter(
+    "sheets_sync_quota_throttled_total", "429 / Quota exceeded responses", ["kind"],
+)
+RETRIES = Counter(
+    "sheets_sync_retries_total", "Retried Google Sheets calls", ["operation"],
+)
+
+
+@contextmanager
+def track_api_call(operation: str):
+    """Считает вызов API и его длительность, статус - код ошибки или ok"""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception as e:
+        status = str(getattr(e, "code", None) or getattr(e, "status_code", None) or "error")
+        raise
+    finally:
+        SHEETS_API_CALLS.labels(operation, status).inc()
+        SHEETS_API_LATENCY.labels(operation).observe(time.perf_counter() - started)
+
+
+def count_retry(retry_state):
+    """before_sleep для tenacity: учитывает повтор вызова"""
+    RETRIES.labels(getattr(retry_state.fn, "__name__", "unknown")).inc()
+
+
+def render() -> tuple[bytes, str]:
+    """Метрики в текстовом формате Prometheus (со всех процессов в multiprocess-режиме)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,235 @@
+import logging
+import os
+import time
+from datetime import date, timedelta
+from typing import Callable, Optional
+
+import yaml
+
+from app.services.write_buffer import BufferedTask, WriteBehindBuffer
+from app.task_dto import TaskDTO
+
+logger = logging.getLogger(__name__)
+
+# Поле payload, которым /gh/bulk помечает пакетные задачи (правило sources: [bulk])
+SOURCE_FIELD = "_source"
+
+
+class Lane:
+    """
+    Полоса очереди: свой буфер со своими порогами сброса, для фонового трафика - лимит задач в минуту.
+    max_buffered - сколько задач полоса держит в буфере (по умолчанию две пачки), остальные ждут в Redis.
+    """
+
+    def __init__(self, name: str, buffer: WriteBehindBuffer, rate_per_minute: Optional[float] = None,
+                 priorities=(), statuses=(), types=(), sources=(), due_within_days: Optional[float] = None,
+                 max_buffered: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.buffer = buffer
+        self.rate_per_minute = rate_per_minute
+        self.max_buffered = max_buffered or buffer.max_size * 2
+        self.priorities = frozenset(str(value).lower() for value in priorities)
+        self.statuses = frozenset(str(value).lower() for value in statuses)
+        self.types = frozenset(str(value).lower() for value in types)
+        self.sources = frozenset(str(value).lower() for value in sources)
+        self.due_within_days = due_within_days
+        self.clock = clock
+        # Токены на запись задач для полосы с ограничением скорости, копятся не больше чем на одну пачку
+        self._tokens = float(buffer.max_size)
+        self._refilled_at = clock()
+
+    def matches(self, task: TaskDTO, source: Optional[str], today: date) -> bool:
+        """Подходит ли задача хотя бы под одно правило полосы"""
+        if self.sources and (source or "").lower() in self.sources:
+            return True
+        if self.priorities and (task.priority or "").lower() in self.priorities:
+            return True
+        if self.statuses and (task.status or "").lower() in self.statuses:
+            return True
+        if self.types and (task.type or "").lower() in self.types:
+            return True
+        if self.due_within_days is not None:
+            limit = today + timedelta(days=self.due_within_days)
+            for value in (task.due_date, task.stage_deadline):
+                due = _parse_date(value)
+                if due is not None and due <= limit:
+                    return True
+        return False
+
+    def free(self) -> int:
+        """Сколько ещё задач поместится в буфер полосы"""
+        return max(0, self.max_buffered - len(self.buffer))
+
+    def available(self) -> Optional[int]:
+        """Сколько задач полосе можно записать сейчас (None - без ограничения)"""
+        if not self.rate_per_minute:
+            return None
+        now = self.clock()
+        self._tokens = min(float(self.buffer.max_size),
+                           self._tokens + (now - self._refilled_at) * self.rate_per_minute / 60)
+        self._refilled_at = now
+        return int(self._tokens)
+
+    def spend(self, count: int):
+        if self.rate_per_minute:
+            self._tokens -= count
+
+    def seconds_until_available(self) -> float:
+        """Через сколько секунд полоса с ограничением скорости сможет записать полную пачку (или весь буфер)"""
+        available = self.available()
+        needed = min(len(self.buffer), self.buffer.max_size)
+        if available is None or available >= needed:
+            return 0.0
+        return (needed - self._tokens) * 60 / self.rate_per_minute
+
+
+class PriorityLanes:
+    """
+    Буферы отложенной записи по полосам из lanes.yaml: задача попадает в первую подходящую полосу,
+    полосы сбрасываются в порядке объявления. Без файла - одна полоса с порогами FLUSH_*.
+    """
+
+    def __init__(self, lanes: list[Lane], default: str):
+        self.lanes = lanes
+        self.default = default
+        self._by_name = {lane.name: lane for lane in lanes}
+        self._rank = {lane.name: rank for rank, lane in enumerate(lanes)}
+        self.max_size = sum(lane.buffer.max_size for lane in lanes)
+
+    @classmethod
+    def from_file(cls, path: str = 'lanes.yaml', max_size: int = 500, debounce: float = 2.0,
+                  max_latency: float = 10.0) -> "PriorityLanes":
+        def buffer(rule: dict) -> WriteBehindBuffer:
+            return WriteBehindBuffer(
+                max_size=int(rule.get('max_batch') or max_size),
+                debounce=float(rule.get('debounce_seconds', debounce)),
+                max_latency=float(rule.get('max_latency_seconds', max_latency)),
+            )
+
+        if not os.path.exists(path):
+            return cls([Lane("normal", buffer({}))], "normal")
+
+        with open(path, 'r', encoding='utf-8') as file:
+            data = yaml.safe_load(file) or {}
+
+        lanes = []
+        for i, rule in enumerate(data.get('lanes', []) or []):
+            lanes.append(Lane(
+                rule.get('name') or f"lane-{i}",
+                buffer(rule),
+                rate_per_minute=float(rule['rate_per_minute']) if rule.get('rate_per_minute') else None,
+                priorities=rule.get('priorities', []) or [],
+                statuses=rule.get('statuses', []) or [],
+                types=rule.get('types', []) or [],
+                sources=rule.get('sources', []) or [],
+                due_within_days=rule.get('due_within_days'),
+                max_buffered=int(rule['max_buffered']) if rule.get('max_buffered') else None,
+            ))
+        default = data.get('default') or "normal"
+        if default not in {lane.name for lane in lanes}:
+            lanes.append(Lane(default, buffer({})))
+
+        logger.info("Loaded %s priority lanes from %s", len(lanes), path)
+        return cls(lanes, default)
+
+    @property
+    def names(self) -> list[str]:
+        return [lane.name for lane in self.lanes]
+
+    def classify(self, task: TaskDTO, source: Optional[str] = None) -> str:
+        today = date.today()
+        for lane in self.lanes:
+            if lane.name != self.default and lane.matches(task, source, today):
+                return lane.name
+        return self.default
+
+    def __len__(self) -> int:
+        return sum(len(lane.buffer) for lane in self.lanes)
+
+    def __contains__(self, task_key: str) -> bool:
+        return any(task_key in lane.buffer for lane in self.lanes)
+
+    def depths(self) -> dict[str, int]:
+        return {lane.name: len(lane.buffer) for lane in self.lanes}
+
+    def items(self) -> list[BufferedTask]:
+        return [item for lane in self.lanes for item in lane.buffer.items()]
+
+    def free_slots(self) -> int:
+        """
+        Сколько задач можно дочитать из очереди: место в самой свободной полосе.
+        Задачи полной полосы при чтении остаются в Redis (см. has_room).
+        """
+        return max(lane.free() for lane in self.lanes)
+
+    def room(self) -> dict[str, int]:
+        """Свободное место по полосам"""
+        return {lane.name: lane.free() for lane in self.lanes}
+
+    def has_room(self, lane: str, task_key: Optional[str] = None) -> bool:
+        """Поместится ли задача в полосу: обновление уже ждущей в буфере задачи места не занимает"""
+        if task_key is not None and task_key in self:
+            return True
+        return self._by_name.get(lane, self._by_name[self.default]).free() > 0
+
+    def add(self, item: BufferedTask):
+        """
+        Добавляет задачу в её полосу (item.lane, иначе полоса по умолчанию).
+        Если задача уже ждёт в другой полосе, состояния схлопываются в более срочной из двух.
+        """
+        lane_name = item.lane if item.lane in self._by_name else self.default
+        for lane in self.lanes:
+            if lane.name == lane_name:
+                continue
+            previous = lane.buffer.pop(item.task.key)
+            if previous is None:
+                continue
+            if self._rank[lane.name] < self._rank[lane_name]:
+                lane_name = lane.name
+            item = item._replace(entry_ids=previous.entry_ids + item.entry_ids,
+                                 received_at=min(previous.received_at, item.received_at))
+        self._by_name[lane_name].buffer.add(item._replace(lane=lane_name))
+
+    def flush_reason(self) -> Optional[tuple[str, str]]:
+        """(полоса, причина) первой по срочности полосы, которую пора сбросить, или None"""
+        for lane in self.lanes:
+            reason = lane.buffer.flush_reason()
+            if reason and lane.seconds_until_available() == 0:
+                return lane.name, reason
+        return None
+
+    def full_lanes(self) -> list[str]:
+        """Полосы, набравшие полную пачку, которые можно сбросить сейчас, в порядке срочности"""
+        return [lane.name for lane in self.lanes
+                if lane.buffer.flush_reason() == "size" and lane.seconds_until_available() == 0]
+
+    def time_until_flush(self) -> Optional[float]:
+        waits = []
+        for lane in self.lanes:
+            wait = lane.buffer.time_until_flush()
+            if wait is not None:
+                waits.append(max(wait, lane.seconds_until_available()))
+        return min(waits) if waits else None
+
+    def oldest_received_at(self, lane: Optional[str] = None) -> Optional[float]:
+        lanes = [self._by_name[lane]] if lane else self.lanes
+        oldest = [value for value in (item.buffer.oldest_received_at() for item in lanes) if value is not None]
+        return min(oldest) if oldest else None
+
+    def drain(self, lane: Optional[str] = None) -> list[BufferedTask]:
+        """Забирает задачи полосы (с учётом ограничения скорости) или всех полос, если lane не указана"""
+        if lane is None:
+            return [item for each in self.lanes for item in each.buffer.drain()]
+        each = self._by_name[lane]
+        items = each.buffer.drain(each.available())
+        each.spend(len(items))
+        return items
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return None
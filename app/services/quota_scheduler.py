@@ -0,0 +1,275 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+import redis
+from gspread.exceptions import APIError
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+
+from app.services.metrics import QUOTA_THROTTLED, QUOTA_WAIT_SECONDS, count_retry
+from app.services.task_queue import QUEUE_PREFIX
+from config import config
+
+logger = logging.getLogger(__name__)
+
+READ = "read"
+WRITE = "write"
+
+# Через сколько секунд без обращений участник считается ушедшим и удаляется из очереди ожидания квоты
+FAIR_QUEUE_STALE_SECONDS = 30
+
+# Локальные бакеты общие для всех планировщиков процесса с одним namespace: квота у учётных данных одна
+_local_buckets: dict[tuple[str, str], "_LocalBucket"] = {}
+_local_buckets_lock = threading.Lock()
+
+# Token bucket на класс квоты. Время берётся у Redis, чтобы процессы на разных хостах считали одинаково.
+# После 429 скорость бакета снижается и затем линейно восстанавливается до лимита.
+# Если передан участник (ARGV[4], например имя маршрута), слоты при нехватке выдаются участникам по очереди:
+# не получивший слот встаёт в очередь ожидания (KEYS[3]), и пока она не пуста, слот достаётся только её голове,
+# а получивший слот уходит в конец. Участник, не обращавшийся дольше ARGV[5] секунд (KEYS[4]), из очереди удаляется.
+# Возвращает 0, если слот выдан, иначе сколько секунд подождать (строкой, чтобы не терять дробную часть).
+_ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local max_rate = tonumber(ARGV[2])
+local recovery = tonumber(ARGV[3])
+local tenant = ARGV[4]
+
+local head = nil
+if tenant ~= '' then
+    local stale_before = now - tonumber(ARGV[5])
+    redis.call('HSET', KEYS[4], tenant, tostring(now))
+    redis.call('EXPIRE', KEYS[4], 3600)
+    for _, member in ipairs(redis.call('ZRANGE', KEYS[3], 0, -1)) do
+        if tonumber(redis.call('HGET', KEYS[4], member) or '0') < stale_before then
+            redis.call('ZREM', KEYS[3], member)
+        elseif head == nil then
+            head = member
+        end
+    end
+end
+
+local blocked_until = tonumber(redis.call('GET', KEYS[2]) or '0')
+if blocked_until > now then
+    if tenant ~= '' then
+        redis.call('ZADD', KEYS[3], 'NX', tostring(now), tenant)
+        redis.call('EXPIRE', KEYS[3], 3600)
+    end
+    return tostring(blocked_until - now)
+end
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+local rate = tonumber(bucket[3]) or max_rate
+local elapsed = math.max(0, now - ts)
+
+rate = math.min(max_rate, rate + elapsed * recovery)
+tokens = math.min(capacity, tokens + elapsed * rate)
+
+local wait = 0
+if tokens >= 1 and (head == nil or head == tenant) then
+    tokens = tokens - 1
+    if tenant ~= '' then
+        redis.call('ZREM', KEYS[3], tenant)
+    end
+else
+    -- слот есть, но он достаётся голове очереди: повторить не раньше появления следующего
+    if tokens >= 1 then
+        wait = 1 / rate
+    else
+        wait = (1 - tokens) / rate
+    end
+    if tenant ~= '' then
+        redis.call('ZADD', KEYS[3], 'NX', tostring(now), tenant)
+        redis.call('EXPIRE', KEYS[3], 3600)
+    end
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Блокирует выдачу слотов на retry_after секунд и вдвое снижает скорость бакета
+_THROTTLED_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local retry_after = tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local max_rate = tonumber(ARGV[3])
+
+local blocked_until = tonumber(redis.call('GET', KEYS[2]) or '0')
+if now + retry_after > blocked_until then
+    redis.call('SET', KEYS[2], tostring(now + retry_after), 'EX', math.ceil(retry_after) + 1)
+end
+
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or max_rate
+redis.call('HSET', KEYS[1], 'rate', tostring(math.max(min_rate, rate / 2)), 'tokens', '0', 'ts', tostring(now))
+return 1
+"""
+
+
+class _LocalBucket:
+    """Тот же алгоритм в памяти процесса, если Redis не передан"""
+
+    def __init__(self, capacity: float, max_rate: float, recovery: float):
+        self.capacity = capacity
+        self.max_rate = max_rate
+        self.recovery = recovery
+        self.tokens = capacity
+        self.rate = max_rate
+        self.ts = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting: dict[str, float] = {}  # очередь участников, не получивших слот: участник -> последнее обращение
+        self.lock = threading.Lock()
+
+    def reserve(self, tenant: Optional[str] = None) -> float:
+        with self.lock:
+            now = time.monotonic()
+            head = None
+            if tenant:
+                for member, seen_at in list(self.waiting.items()):
+                    if member != tenant and seen_at < now - FAIR_QUEUE_STALE_SECONDS:
+                        del self.waiting[member]
+                if tenant in self.waiting:
+                    self.waiting[tenant] = now
+                head = next(iter(self.waiting), None)
+            if self.blocked_until > now:
+                if tenant:
+                    self.waiting.setdefault(tenant, now)
+                return self.blocked_until - now
+            elapsed = max(0.0, now - self.ts)
+            self.rate = min(self.max_rate, self.rate + elapsed * self.recovery)
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.ts = now
+            if self.tokens >= 1 and head in (None, tenant):
+                self.tokens -= 1
+                self.waiting.pop(tenant, None)
+                return 0.0
+            if tenant:
+                self.waiting.setdefault(tenant, now)
+            return (1 if self.tokens >= 1 else 1 - self.tokens) / self.rate
+
+    def throttled(self, retry_after: float, min_rate: float):
+        with self.lock:
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.rate = max(min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.ts = now
+
+
+class QuotaScheduler:
+    """
+    Планировщик квоты Google Sheets API.
+    На каждый класс квоты (чтение/запись) - token bucket с лимитом запросов в минуту.
+    С Redis бакеты общие для всех процессов с одним namespace (например, одними учётными данными),
+    без Redis - для всех планировщиков процесса с одним namespace. Ответы 429 блокируют выдачу слотов
+    на Retry-After и временно снижают скорость.
+
+    Несколько листов одних учётных данных делят один бакет: лимит Sheets API считается на проект,
+    а не на таблицу. Чтобы очередь одного листа не забирала всю квоту, планировщик листа передаёт
+    участника (tenant), и при нехватке слоты выдаются участникам по очереди.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = None, namespace: str = "default",
+                 read_per_minute: int = 60, write_per_minute: int = 60, recovery_seconds: int = 300,
+                 tenant: Optional[str] = None):
+        self.redis = redis_client
+        self.namespace = namespace
+        self.tenant = tenant
+        self.limits = {READ: read_per_minute, WRITE: write_per_minute}
+        self.recovery_seconds = recovery_seconds
+        if self.redis is not None:
+            self._acquire_script = self.redis.register_script(_ACQUIRE_SCRIPT)
+            self._throttled_script = self.redis.register_script(_THROTTLED_SCRIPT)
+
+    @classmethod
+    def from_config(cls, redis_client: Optional[redis.Redis] = None, namespace: Optional[str] = None,
+                    tenant: Optional[str] = None):
+        return cls(
+            redis_client,
+            namespace=namespace or config.get('QUOTA_NAMESPACE') or "default",
+            read_per_minute=int(config.get('SHEETS_READ_QUOTA_PER_MINUTE') or 60),
+            write_per_minute=int(config.get('SHEETS_WRITE_QUOTA_PER_MINUTE') or 60),
+            tenant=tenant,
+        )
+
+    def acquire(self, kind: str):
+        """Блокирует поток до получения слота на запрос"""
+        started = time.perf_counter()
+        while True:
+            wait = self.reserve(kind)
+            if wait <= 0:
+                QUOTA_WAIT_SECONDS.labels(kind).observe(time.perf_counter() - started)
+                return
+            logger.debug("Quota %s/%s: waiting %.2f seconds", self.namespace, kind, wait)
+            time.sleep(wait)
+
+    def reserve(self, kind: str) -> float:
+        """Пытается получить слот: 0 - слот выдан, иначе через сколько секунд повторить"""
+        capacity, max_rate, recovery = self._bucket_params(kind)
+        if self.redis is None:
+            return self._local_bucket(kind).reserve(self.tenant)
+        return float(self._acquire_script(keys=self._keys(kind), args=[capacity, max_rate, recovery,
+                                                                       self.tenant or "", FAIR_QUEUE_STALE_SECONDS]))
+
+    def report_throttled(self, kind: str, retry_after: Optional[float] = None):
+        """Учитывает ответ 429: пауза на Retry-After (или 10 секунд) и снижение скорости"""
+        retry_after = retry_after or 10.0
+        QUOTA_THROTTLED.labels(kind).inc()
+        _, max_rate, _ = self._bucket_params(kind)
+        min_rate = max_rate / 10
+        logger.warning("Quota %s/%s exceeded, pausing for %.0f seconds", self.namespace, kind, retry_after)
+        if self.redis is None:
+            self._local_bucket(kind).throttled(retry_after, min_rate)
+            return
+        self._throttled_script(keys=self._keys(kind), args=[retry_after, min_rate, max_rate])
+
+    def _bucket_params(self, kind: str) -> tuple[float, float, float]:
+        per_minute = self.limits[kind]
+        max_rate = per_minute / 60
+        return per_minute, max_rate, max_rate / self.recovery_seconds
+
+    def _keys(self, kind: str) -> list[str]:
+        prefix = f"{QUEUE_PREFIX}quota:{self.namespace}:{kind}"
+        return [prefix, f"{prefix}:blocked", f"{prefix}:waiting", f"{prefix}:seen"]
+
+    def _local_bucket(self, kind: str) -> _LocalBucket:
+        with _local_buckets_lock:
+            key = (self.namespace, kind)
+            if key not in _local_buckets:
+                _local_buckets[key] = _LocalBucket(*self._bucket_params(kind))
+            return _local_buckets[key]
+
+
+def is_quota_error(exception: BaseException) -> bool:
+    """Ответ 429 / Quota exceeded от Google Sheets API"""
+    if isinstance(exception, APIError):
+        return getattr(exception, "code", None) == 429 or "Quota exceeded" in str(exception)
+    return getattr(exception, "status_code", None) == 429
+
+
+def retry_after_seconds(exception: BaseException) -> Optional[float]:
+    """Значение заголовка Retry-After из ответа API, если оно есть"""
+    retry_after = getattr(exception, "retry_after", None)
+    if retry_after is None:
+        response = getattr(exception, "response", None)
+        retry_after = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+def sheets_retry(attempts: int = 3, min_wait: int = 2, max_wait: int = 8):
+    """Общая политика повторов запросов к Google Sheets"""
+    return retry(
+        stop=stop_after_attempt(attempts),
+        wait=wait_exponential(multiplier=1, min=min_wait, max=max_wait),
+        retry=retry_if_exception_type((APIError, ConnectionError, TimeoutError)),
+        before_sleep=count_retry,
+    )
@@ -0,0 +1,66 @@
+import logging
+import time
+from typing import Optional
+
+import redis
+
+from app.helpers.string_helper import extract_task_key
+from app.services.task_queue import QUEUE_PREFIX
+
+logger = logging.getLogger(__name__)
+
+
+class RowIndex:
+    """
+    Индекс ключ задачи -> номер строки листа, хранящийся в Redis.
+    Поддерживается инкрементально при создании строк и перестраивается по первому столбцу
+    только при обнаружении расхождения или по истечении rebuild_interval.
+    """
+
+    def __init__(self, redis_client: redis.Redis, namespace: str, rebuild_interval: int = 3600):
+        self.redis = redis_client
+        self.rows_key = f"{QUEUE_PREFIX}row_index:{namespace}"
+        self.meta_key = f"{QUEUE_PREFIX}row_index:{namespace}:meta"
+        self.rebuild_interval = rebuild_interval
+
+    def is_ready(self) -> bool:
+        built_at = self.redis.hget(self.meta_key, "built_at")
+        return built_at is not None and time.time() - float(built_at) < self.rebuild_interval
+
+    def lookup(self, task_keys: list[str]) -> dict[str, int]:
+        if not task_keys:
+            return {}
+        rows = self.redis.hmget(self.rows_key, task_keys)
+        return {key: int(row) for key, row in zip(task_keys, rows) if row is not None}
+
+    def next_row(self) -> Optional[int]:
+        row = self.redis.hget(self.meta_key, "next_row")
+        return int(row) if row is not None else None
+
+    def rebuild(self, column_values: list[str]):
+        """Перестраивает индекс по значениям первого столбца (строка 1 - заголовок)"""
+        mapping = {}
+        for row, value in enumerate(column_values[1:], start=2):
+            key = extract_task_key(value)
+            if key:
+                mapping[key] = row
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(self.rows_key)
+        if mapping:
+            pipe.hset(self.rows_key, mapping=mapping)
+        pipe.hset(self.meta_key, mapping={"next_row": len(column_values) + 1, "built_at": time.time()})
+        pipe.execute()
+        logger.info("Rebuilt row index %s: %s tasks", self.rows_key, len(mapping))
+
+    def set_rows(self, rows: dict[str, int], next_row: int):
+        """Добавляет в индекс новые строки после успешной записи в таблицу"""
+        if not rows:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self.rows_key, mapping=rows)
+        pipe.hset(self.meta_key, "next_row", next_row)
+        pipe.execute()
+
+    def invalidate(self):
+        self.redis.delete(self.meta_key)
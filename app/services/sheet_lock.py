@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Optional
+
+import redis
+
+from app.services.task_queue import QUEUE_PREFIX
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Снимает блокировку, только если она всё ещё наша: после истечения TTL её мог взять другой процесс
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Продлевает блокировку, только если она всё ещё наша
+_EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class SheetLockTimeout(Exception):
+    pass
+
+
+class SheetLock:
+    """
+    Блокировка записи в лист между процессами и репликами: номера строк определяются и пишутся под ней.
+    Пока взята, продлевается фоновым потоком; в одном потоке повторно входимая.
+    """
+
+    def __init__(self, redis_client: redis.Redis, sheet_key: str, worksheet_title: str, ttl: float = 60,
+                 wait: float = 120):
+        self.redis = redis_client
+        self.key = f"{QUEUE_PREFIX}sheet_lock:{sheet_key}:{worksheet_title}"
+        self.ttl = ttl
+        self.wait = wait
+        self._token: Optional[str] = None
+        self._owner: Optional[int] = None
+        self._depth = 0
+        self._stop: Optional[threading.Event] = None
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+        self._extend = self.redis.register_script(_EXTEND_SCRIPT)
+
+    @classmethod
+    def from_config(cls, redis_client: redis.Redis, sheet_key: str, worksheet_title: str) -> "SheetLock":
+        return cls(
+            redis_client,
+            sheet_key,
+            worksheet_title,
+            ttl=float(config.get('SHEET_LOCK_TTL_SECONDS') or 60),
+            wait=float(config.get('SHEET_LOCK_WAIT_SECONDS') or 120),
+        )
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Берёт блокировку; blocking=True - ждёт не дольше wait секунд. Возвращает, удалось ли взять."""
+        if self._depth and self._owner == threading.get_ident():
+            self._depth += 1
+            return True
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait
+        delay = 0.05
+        while not self.redis.set(self.key, token, nx=True, px=int(self.ttl * 1000)):
+            if not blocking or time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        self._token = token
+        self._owner = threading.get_ident()
+        self._depth = 1
+        self._stop = threading.Event()
+        threading.Thread(target=self._keep_alive, args=(token, self._stop), daemon=True,
+                         name="sheet-lock").start()
+        return True
+
+    def release(self):
+        if not self._depth:
+            return
+        self._depth -= 1
+        if self._depth:
+            return
+        self._stop.set()
+        if not self._release(keys=[self.key], args=[self._token]):
+            logger.warning("Sheet lock %s expired before release", self.key)
+        self._token = None
+        self._owner = None
+
+    def __enter__(self) -> "SheetLock":
+        if not self.acquire():
+            raise SheetLockTimeout(f"Sheet lock {self.key} is held elsewhere for more than {self.wait:.0f} seconds")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def _keep_alive(self, token: str, stop: threading.Event):
+        while not stop.wait(self.ttl / 3):
+            try:
+                if not self._extend(keys=[self.key], args=[token, int(self.ttl * 1000)]):
+                    logger.warning("Sheet lock %s was lost", self.key)
+                    return
+            except redis.RedisError as e:
+                logger.warning("Failed to extend sheet lock %s: %s", self.key, e)
@@ -0,0 +1,95 @@
+import logging
+import os
+from typing import NamedTuple, Optional
+
+import yaml
+
+from app.task_dto import TaskDTO
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class SheetTarget(NamedTuple):
+    name: str
+    sheet_key: str
+    worksheet: str
+
+
+class _Route(NamedTuple):
+    target: SheetTarget
+    queues: frozenset
+    projects: frozenset
+
+
+class SheetRouter:
+    """
+    Распределяет задачи по таблицам/листам по правилам из routing.yaml:
+    по очереди трекера (префикс ключа задачи до "-") или по проекту.
+    Правила проверяются по порядку, задачи без совпадений уходят в default
+    (по умолчанию - GOOGLE_SHEET_KEY / GOOGLE_SHEET_WORKSHEET из .env).
+    """
+
+    def __init__(self, routes: list[_Route], default: Optional[SheetTarget]):
+        self.routes = routes
+        self.default = default
+
+    @classmethod
+    def from_file(cls, path: str = 'routing.yaml') -> "SheetRouter":
+        default = None
+        if config.get('GOOGLE_SHEET_KEY') and config.get('GOOGLE_SHEET_WORKSHEET'):
+            default = SheetTarget("default", config.get('GOOGLE_SHEET_KEY'), config.get('GOOGLE_SHEET_WORKSHEET'))
+
+        if not os.path.exists(path):
+            return cls([], default)
+
+        with open(path, 'r', encoding='utf-8') as file:
+            data = yaml.safe_load(file) or {}
+
+        routes = []
+        for i, rule in enumerate(data.get('routes', []) or []):
+            target = SheetTarget(
+                rule.get('name') or f"route-{i}",
+                rule.get('sheet_key') or config.get('GOOGLE_SHEET_KEY'),
+                rule['worksheet'],
+            )
+            routes.append(_Route(
+                target,
+                frozenset(str(queue).upper() for queue in rule.get('queues', []) or []),
+                frozenset(rule.get('projects', []) or []),
+            ))
+
+        if data.get('default'):
+            rule = data['default']
+            default = SheetTarget("default", rule.get('sheet_key') or config.get('GOOGLE_SHEET_KEY'),
+                                  rule['worksheet'])
+
+        logger.info("Loaded %s sheet routes from %s", len(routes), path)
+        return cls(routes, default)
+
+    @property
+    def targets(self) -> list[SheetTarget]:
+        targets = [route.target for route in self.routes]
+        if self.default is not None:
+            targets.append(self.default)
+        return list(dict.fromkeys(targets))
+
+    def route(self, task: TaskDTO) -> Optional[SheetTarget]:
+        queue = task.key.split("-")[0].upper()
+        for route in self.routes:
+            if queue in route.queues or task.project in route.projects:
+                return route.target
+        return self.default
+
+    def group(self, tasks: list[TaskDTO]) -> tuple[dict[SheetTarget, list[TaskDTO]], list[TaskDTO]]:
+        """Группирует задачи по листам. Возвращает группы и задачи без маршрута (их вызывающий не теряет)"""
+        groups: dict[SheetTarget, list[TaskDTO]] = {}
+        unrouted = []
+        for task in tasks:
+            target = self.route(task)
+            if target is None:
+                logger.error("%s | No sheet route for task", task.key)
+                unrouted.append(task)
+                continue
+            groups.setdefault(target, []).append(task)
+        return groups, unrouted
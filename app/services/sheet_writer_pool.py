@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from app.services.async_google_sheets_service import AsyncGoogleSheetsService, run_sync
+from app.services.google_sheets_service import GoogleSheetsService
+from app.services.quota_scheduler import is_quota_error
+from app.services.sheet_lock import SheetLockTimeout
+from app.services.sheet_router import SheetRouter, SheetTarget
+from app.task_dto import TaskDTO
+from config import config
+from logging_config import logger
+
+
+class SubmitResult(NamedTuple):
+    busy: list[TaskDTO]  # задачи листов, писатель которых занят (вернуть в очередь, повторить позже)
+    unrouted: list[TaskDTO]  # задачи без маршрута в routing.yaml (повтор не поможет)
+
+
+class WriteResult(NamedTuple):
+    target: SheetTarget
+    tasks: list[TaskDTO]  # тот же список, что был отправлен писателю листа
+    error: Optional[BaseException]
+
+
+class SheetWriterPool:
+    """
+    Пул писателей: у каждого листа свой поток записи и свой сервис, submit() не ждёт записи.
+    Квота у всех листов общая, лист в ней - отдельный участник, слоты при нехватке выдаются по очереди.
+    """
+
+    def __init__(self, router: SheetRouter, redis_client=None, use_async: bool = False,
+                 max_pending: Optional[int] = None, error_backoff: Optional[float] = None):
+        self.router = router
+        self.redis_client = redis_client
+        self.use_async = use_async
+        self.max_pending = max_pending or int(config.get('WRITER_MAX_PENDING_BATCHES') or 2)
+        self.error_backoff = (error_backoff if error_backoff is not None
+                              else float(config.get('WRITER_ERROR_BACKOFF_SECONDS') or 30))
+        self._services = {}
+        self._writers: dict[SheetTarget, ThreadPoolExecutor] = {}
+        self._pending: dict[SheetTarget, int] = {}
+        self._retry_at: dict[SheetTarget, float] = {}
+        self._completed: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._http_client = None
+
+    def submit(self, tasks: list[TaskDTO]) -> SubmitResult:
+        """Отдаёт задачи писателям их листов, не дожидаясь записи"""
+        groups, unrouted = self.router.group(tasks)
+        busy = []
+        for target, group in groups.items():
+            if not self._reserve(target):
+                busy.extend(group)
+                continue
+            self._writer(target).submit(self._run, target, group)
+        return SubmitResult(busy, unrouted)
+
+    def accepts(self, task: TaskDTO) -> bool:
+        """Примет ли сейчас писатель листа задачи (без маршрута - да, их обработает вызывающий)"""
+        target = self.router.route(task)
+        return target is None or self.has_room(target)
+
+    def has_room(self, target: SheetTarget) -> bool:
+        with self._lock:
+            return self._has_room(target)
+
+    def completed(self) -> list[WriteResult]:
+        """Результаты записи, завершившейся с прошлого вызова"""
+        results = []
+        while True:
+            try:
+                results.append(self._completed.get_nowait())
+            except queue.Empty:
+                return results
+
+    def pending(self) -> int:
+        """Сколько пачек сейчас пишется или ждёт писателя"""
+        with self._lock:
+            return sum(self._pending.values())
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт окончания записи всех отправленных пачек. Возвращает False по таймауту."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not any(self._pending.values()), timeout)
+
+    def archive_completed(self):
+        """Ставит перенос завершённых задач в очередь писателя каждого листа: строки не сдвигаются посреди записи"""
+        if self.use_async:
+            logger.warning("Task archiving is supported only by the synchronous Sheets client")
+            return
+        for target in self.router.targets:
+            self._writer(target).submit(self._archive, target)
+
+    def _reserve(self, target: SheetTarget) -> bool:
+        with self._lock:
+            if not self._has_room(target):
+                return False
+            self._pending[target] = self._pending.get(target, 0) + 1
+            return True
+
+    def _has_room(self, target: SheetTarget) -> bool:
+        if self._pending.get(target, 0) >= self.max_pending:
+            return False
+        return time.monotonic() >= self._retry_at.get(target, 0.0)
+
+    def _run(self, target: SheetTarget, tasks: list[TaskDTO]):
+        error = None
+        try:
+            self._store(target, tasks)
+        except Exception as e:
+            error = e
+            logger.error("Failed to store %s tasks to %s: %s", len(tasks), target.name, e)
+        with self._idle:
+            self._pending[target] -= 1
+            if error is not None and not is_quota_error(error) and not isinstance(error, SheetLockTimeout):
+                # Лист недоступен (API, сеть): не отдаём ему задачи какое-то время, остальные листы пишутся
+                self._retry_at[target] = time.monotonic() + self.error_backoff
+            self._idle.notify_all()
+        self._completed.put(WriteResult(target, tasks, error))
+
+    def _store(self, target: SheetTarget, tasks: list[TaskDTO]):
+        service = self._get_service(target)
+        if self.use_async:
+            run_sync(service.store_tasks_batch(tasks))
+        else:
+            service.store_tasks_batch(tasks)
+
+    def _archive(self, target: SheetTarget):
+        try:
+            service = self._get_service(target)
+            if service.archive is not None:
+                service.archive.archive_completed()
+        except Exception as e:
+            logger.error("Failed to archive completed tasks of %s: %s", target.name, e)
+
+    def _writer(self, target: SheetTarget) -> ThreadPoolExecutor:
+        # Один поток на лист: пачки одного листа пишутся по порядку, сервис листа не делится между потоками
+        with self._lock:
+            writer = self._writers.get(target)
+            if writer is None:
+                writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sheet-writer-{target.name}")
+                self._writers[target] = writer
+            return writer
+
+    def _get_service(self, target: SheetTarget):
+        with self._lock:
+            service = self._services.get(target)
+        if service is not None:
+            return service
+
+        if self.use_async:
+            with self._lock:
+                if self._http_client is None:
+                    self._http_client = AsyncGoogleSheetsService.create_client()
+            service = AsyncGoogleSheetsService(target.sheet_key, target.worksheet, client=self._http_client,
+                                               redis_client=self.redis_client, quota_tenant=target.name)
+        else:
+            service = GoogleSheetsService(self.redis_client, target.sheet_key, target.worksheet,
+                                          quota_tenant=target.name)
+        with self._lock:
+            return self._services.setdefault(target, service)
@@ -0,0 +1,233 @@
+import time
+from typing import Optional
+
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import ValueInputOption, ValueRenderOption
+
+from app.enums.column_enum import ColumnEnum
+from app.helpers.string_helper import extract_task_key
+from app.services.quota_scheduler import READ, WRITE
+from app.services.task_queue import QUEUE_PREFIX
+from app.task_dto import TaskDTO
+from config import config
+from logging_config import logger
+
+DEFAULT_TERMINAL_STATUSES = "Закрыт,Закрыта,Решен,Решена,Отменен,Отменена,Closed,Resolved,Cancelled"
+
+
+class TaskArchive:
+    """Архивный лист: давно завершённые задачи переносятся туда, рабочий лист не растёт вместе с историей"""
+
+    def __init__(self, service, redis_client, worksheet_title: str, archive_after_days: float = 14,
+                 terminal_statuses: Optional[set[str]] = None):
+        self.service = service
+        self.redis = redis_client
+        self.worksheet_title = worksheet_title
+        self.archive_after = archive_after_days * 86400
+        self.terminal_statuses = terminal_statuses or _parse_statuses(DEFAULT_TERMINAL_STATUSES)
+        self.worksheet = None
+        namespace = f"{service.sheet.id}:{service.worksheet.id}"
+        self.terminal_key = f"{QUEUE_PREFIX}archive:{namespace}:terminal_since"
+        self.archived_key = f"{QUEUE_PREFIX}archive:{namespace}:archived"
+
+    @classmethod
+    def from_config(cls, service, redis_client) -> "TaskArchive":
+        return cls(
+            service,
+            redis_client,
+            config.get('ARCHIVE_WORKSHEET') or f"{service.worksheet_title} (архив)",
+            archive_after_days=float(config.get('ARCHIVE_AFTER_DAYS') or 14),
+            terminal_statuses=_parse_statuses(config.get('ARCHIVE_STATUSES') or DEFAULT_TERMINAL_STATUSES),
+        )
+
+    def is_terminal(self, status: Optional[str]) -> bool:
+        return (status or "").strip().lower() in self.terminal_statuses
+
+    def track(self, tasks: list[TaskDTO]):
+        """Запоминает, с какого момента задачи в терминальном статусе; переоткрытые забывает"""
+        if not tasks:
+            return
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for task in tasks:
+            if self.is_terminal(task.status):
+                pipe.hsetnx(self.terminal_key, task.key, now)
+            else:
+                pipe.hdel(self.terminal_key, task.key)
+        pipe.execute()
+
+    def archived_keys(self, task_keys: list[str]) -> set[str]:
+        if not task_keys:
+            return set()
+        flags = self.redis.hmget(self.archived_key, task_keys)
+        return {key for key, flag in zip(task_keys, flags) if flag is not None}
+
+    def restore(self, task_keys: list[str]) -> dict[str, list]:
+        """Строки переоткрытых задач из архива: ключ -> значения (пустой список, если строки нет). Удаляет их remove()"""
+        rows = self._locate(task_keys)
+        values = self._read_rows(list(rows.values()))
+        return {key: values.get(rows[key]) or [] if key in rows else [] for key in task_keys}
+
+    def remove(self, task_keys: list[str]):
+        """Удаляет из архива строки задач, перенесённых обратно в рабочий лист"""
+        rows = list(self._locate(task_keys).values())
+        if rows:
+            self._delete_rows(self._archive_worksheet(), rows)
+        self.redis.hdel(self.archived_key, *task_keys)
+
+    def update(self, tasks: list[TaskDTO]) -> list[TaskDTO]:
+        """Обновляет архивные строки завершённых задач. Возвращает задачи, строк которых в архиве нет."""
+        rows = self._locate([task.key for task in tasks])
+        old_rows = self._read_rows(list(rows.values()))
+        requests = []
+        missing = []
+        for task in tasks:
+            row = rows.get(task.key)
+            if row is None:
+                missing.append(task)
+                continue
+            old_values = old_rows.get(row) or []
+            requests.extend(self.service._row_update_requests(row, self.service.mapping(task, old_values),
+                                                              old_values))
+        if requests:
+            self.service._call(WRITE, self._archive_worksheet().batch_update, requests,
+                               value_input_option=ValueInputOption.user_entered)
+        if rows:
+            # Задачи не в рабочем листе, отсчёт времени в терминальном статусе для них не нужен
+            self.redis.hdel(self.terminal_key, *rows)
+        if missing:
+            self.redis.hdel(self.archived_key, *[task.key for task in missing])
+        logger.info("Updated %s archived tasks in %s", len(rows), self.worksheet_title)
+        return missing
+
+    def archive_completed(self) -> int:
+        """
+        Переносит в архив задачи, завершённые раньше archive_after. Возвращает число перенесённых строк.
+        Идёт под блокировкой записи листа; если лист сейчас пишется, перенос откладывается.
+        """
+        lock = self.service.write_lock
+        if not lock.acquire(blocking=False):
+            logger.info("%s is being written elsewhere, archiving postponed", self.service.worksheet_title)
+            return 0
+        try:
+            with self.service._mirror_write():
+                return self._archive_completed()
+        finally:
+            lock.release()
+
+    def _archive_completed(self) -> int:
+        service = self.service
+        service._ensure_connection()
+        service._sync_mirror()
+        if service.mirror is not None:
+            values = [list(row) for row in service.mirror.rows]
+        else:
+            values = service._call(READ, service.worksheet.get_all_values,
+                                   value_render_option=ValueRenderOption.formula)
+        status_index = service._get_layout().columns[ColumnEnum.status]
+
+        terminal = {}
+        for row, row_values in enumerate(values[1:], start=2):
+            key = extract_task_key(row_values[0] if row_values else None)
+            status = row_values[status_index] if status_index < len(row_values) else None
+            if key and self.is_terminal(status):
+                terminal[key] = (row, row_values)
+        if not terminal:
+            return 0
+
+        now = time.time()
+        keys = list(terminal)
+        since = dict(zip(keys, self.redis.hmget(self.terminal_key, keys)))
+        # Задачи, завершённые до включения архива: отсчёт начинается с первого прохода
+        untracked = {key: now for key, value in since.items() if value is None}
+        if untracked:
+            self.redis.hset(self.terminal_key, mapping=untracked)
+        expired = [key for key, value in since.items()
+                   if value is not None and now - float(value) >= self.archive_after]
+        if not expired:
+            return 0
+
+        # Прерванный проход мог дописать строки в архив, не успев отметить их в Redis: повторно не дописываем
+        in_archive = self._locate(expired)
+        to_append = [terminal[key][1] for key in expired if key not in in_archive]
+        if to_append:
+            self.service._call(WRITE, self._archive_worksheet().append_rows, to_append,
+                               value_input_option=ValueInputOption.user_entered, table_range="A1")
+        self.redis.hset(self.archived_key, mapping={key: now for key in expired})
+
+        rows = [terminal[key][0] for key in expired]
+        self._delete_rows(service.worksheet, rows)
+        self.redis.hdel(self.terminal_key, *expired)
+
+        # Номера строк ниже удалённых сдвинулись: сбрасываем кэш ключей, индекс строк и правим локальную копию
+        service._reset_row_lookup()
+        if service.mirror is not None:
+            service.mirror.delete_rows(rows)
+            service.mirror.commit()
+        logger.info("Archived %s completed tasks from %s to %s",
+                    len(expired), service.worksheet_title, self.worksheet_title)
+        return len(expired)
+
+    def _delete_rows(self, worksheet, rows: list[int]):
+        """Удаляет строки одним batchUpdate: подряд идущие строки - одним диапазоном, снизу вверх"""
+        requests = [
+            {"deleteDimension": {"range": {
+                "sheetId": worksheet.id, "dimension": "ROWS", "startIndex": start - 1, "endIndex": end,
+            }}}
+            for start, end in reversed(_row_runs(rows))
+        ]
+        self.service._call(WRITE, self.service.sheet.batch_update, {"requests": requests})
+
+    def _locate(self, task_keys: list[str]) -> dict[str, int]:
+        """Номера строк задач в архиве (первый столбец архива читается одним запросом)"""
+        if not task_keys:
+            return {}
+        wanted = set(task_keys)
+        rows = {}
+        column = self.service._call(READ, self._archive_worksheet().col_values, 1)
+        for row, value in enumerate(column, start=1):
+            key = extract_task_key(value)
+            if key in wanted:
+                rows[key] = row
+        return rows
+
+    def _read_rows(self, rows: list[int]) -> dict[int, list]:
+        if not rows:
+            return {}
+        rows = sorted(rows)
+        value_ranges = self.service._call(READ, self._archive_worksheet().batch_get,
+                                          [self.service._row_range(row) for row in rows],
+                                          value_render_option=ValueRenderOption.formula)
+        return {row: list(value_range[0]) if value_range else [] for row, value_range in zip(rows, value_ranges)}
+
+    def _archive_worksheet(self):
+        if self.worksheet is not None:
+            return self.worksheet
+        sheet = self.service.sheet
+        try:
+            self.worksheet = sheet.worksheet(self.worksheet_title)
+        except WorksheetNotFound:
+            # Новый архив получает ту же строку заголовков, что и рабочий лист
+            header = self.service._call(READ, self.service.worksheet.row_values, 1,
+                                        value_render_option=ValueRenderOption.formula)
+            self.worksheet = self.service._call(WRITE, sheet.add_worksheet, self.worksheet_title,
+                                                rows=1000, cols=max(len(header), 1))
+            self.service._call(WRITE, self.worksheet.update, "A1", [header],
+                               value_input_option=ValueInputOption.user_entered)
+            logger.info("Created archive worksheet %s", self.worksheet_title)
+        return self.worksheet
+
+
+def _parse_statuses(value: str) -> set[str]:
+    return {status.strip().lower() for status in value.split(",") if status.strip()}
+
+
+def _row_runs(rows: list[int]) -> list[tuple[int, int]]:
+    """Отсортированные диапазоны подряд идущих строк: [(первая, последняя), ...]"""
+    runs = []
+    for row in sorted(set(rows)):
+        if runs and runs[-1][1] == row - 1:
+            runs[-1] = (runs[-1][0], row)
+        else:
+            runs.append((row, row))
+    return runs
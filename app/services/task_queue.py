@@ -0,0 +1,370 @@
+import json
+import logging
+import socket
+import time
+from typing import Callable, Iterator, Optional
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Служебные ключи сервиса, не являются задачами
+QUEUE_PREFIX = "sync:"
+STREAM_KEY = f"{QUEUE_PREFIX}tasks:stream"
+PAYLOADS_KEY = f"{QUEUE_PREFIX}tasks:payloads"
+CONSUMER_GROUP = "sheets-writers"
+# Журнал забранных, но ещё не записанных задач (режим keys): хэш task_key -> payload на воркер
+INFLIGHT_PREFIX = f"{QUEUE_PREFIX}inflight:"
+# Аренда воркера: пока ключ жив, его журнал не возвращается в очередь
+LEASE_PREFIX = f"{QUEUE_PREFIX}lease:"
+# Задачи, которые нельзя записать без вмешательства (нет маршрута в routing.yaml): хэш task_key -> payload
+DEAD_LETTER_KEY = f"{QUEUE_PREFIX}tasks:dead"
+# Поле payload со временем приёма вебхука (unix), от него считается задержка до записи в таблицу
+RECEIVED_AT_FIELD = "_received_at"
+
+# Удаляет поле из хэша только если в нём всё ещё записанное нами значение,
+# иначе за время записи пришла более новая версия задачи и её нужно сохранить
+_DELETE_IF_UNCHANGED_SCRIPT = """
+local deleted = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        deleted = deleted + redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return deleted
+"""
+
+# Атомарно забирает строковые ключи задач (GET + DEL) и записывает их в журнал воркера KEYS[1]
+_CLAIM_KEYS_SCRIPT = """
+local result = {}
+for i = 2, #KEYS do
+    local key = KEYS[i]
+    if redis.call('TYPE', key).ok == 'string' then
+        local value = redis.call('GET', key)
+        redis.call('HSET', KEYS[1], key, value)
+        redis.call('DEL', key)
+        result[i - 1] = value
+    else
+        result[i - 1] = false
+    end
+end
+return result
+"""
+
+# Возвращает задачи из журнала KEYS[1] в очередь, если аренда KEYS[2] истекла (или ARGV[1] == '1').
+# Пришедшие за это время новые версии задач не затираются (SET NX).
+_RECLAIM_SCRIPT = """
+if ARGV[1] ~= '1' and redis.call('EXISTS', KEYS[2]) == 1 then
+    return -1
+end
+local entries = redis.call('HGETALL', KEYS[1])
+for i = 1, #entries, 2 do
+    redis.call('SET', entries[i], entries[i + 1], 'NX')
+end
+redis.call('DEL', KEYS[1])
+return #entries / 2
+"""
+
+
+class KeysQueue:
+    """
+    Очередь задач в виде отдельного ключа на задачу (значение - последний вебхук по задаче).
+    Ключи перебираются через SCAN и забираются пачками ограниченного размера
+    одним Lua-скриптом, т.е. за один запрос к Redis на пачку.
+    Забранные задачи лежат в журнале воркера до подтверждения записи (ack), журнал воркера
+    с истёкшей арендой (упал, убит по памяти) возвращается в очередь через reclaim().
+    """
+
+    def __init__(self, redis_client: redis.Redis, batch_size: int = 500, worker_id: Optional[str] = None,
+                 lease_seconds: int = 300):
+        self.redis = redis_client
+        self.batch_size = batch_size
+        # Имя воркера должно быть уникальным среди реплик и переживать перезапуск
+        self.worker_id = worker_id or socket.gethostname()
+        self.lease_seconds = lease_seconds
+        self.inflight_key = f"{INFLIGHT_PREFIX}{self.worker_id}"
+        self._claim = self.redis.register_script(_CLAIM_KEYS_SCRIPT)
+        self._reclaim = self.redis.register_script(_RECLAIM_SCRIPT)
+        self._delete_if_unchanged = self.redis.register_script(_DELETE_IF_UNCHANGED_SCRIPT)
+
+    def drain(self, room: Optional[Callable[[], int]] = None,
+              select: Optional[Callable[[list[tuple[str, str]]], list[str]]] = None,
+              ) -> Iterator[list[tuple[str, str]]]:
+        """
+        Отдаёт пачки (task_key, payload) не больше batch_size.
+        room() - сколько задач воркер готов принять сейчас; перед каждой пачкой размер пачки
+        ограничивается им, а при нуле задачи больше не забираются (остаются в очереди).
+        select(items) - какие из прочитанных (MGET, без забора) задач пачки забрать; остальные остаются
+        в очереди (например, задачи заполненной полосы приоритета).
+        """
+        limit = self._room(room)
+        if limit <= 0:
+            return
+        batch = {}
+        for key in self.redis.scan_iter(count=self.batch_size):
+            # Служебные ключи сервиса задачами не являются
+            if key.startswith(QUEUE_PREFIX):
+                continue
+            batch[key] = None
+            if len(batch) >= limit:
+                claimed = self._claim_selected(list(batch), select)
+                if claimed:
+                    yield claimed
+                batch = {}
+                limit = self._room(room)
+                if limit <= 0:
+                    return
+        if batch:
+            claimed = self._claim_selected(list(batch), select)
+            if claimed:
+                yield claimed
+
+    def claim(self, keys: list[str]) -> list[tuple[str, str]]:
+        # Разбор большой очереди может идти дольше аренды, продлеваем её перед каждой пачкой
+        self.heartbeat()
+        values = self._claim(keys=[self.inflight_key, *keys])
+        # SCAN может вернуть ключ, который уже забран, для него значение пустое
+        return [(key, value) for key, value in zip(keys, values) if value]
+
+    def _claim_selected(self, keys: list[str], select) -> list[tuple[str, str]]:
+        if select is not None:
+            keys = select(self._peek(keys))
+            if not keys:
+                return []
+        return self.claim(keys)
+
+    def _peek(self, keys: list[str]) -> list[tuple[str, str]]:
+        """Задачи (task_key, payload) из keys, которые ещё в очереди, без забора"""
+        # MGET вернёт None для ключей, которые уже забраны, и для нестроковых ключей
+        values = self.redis.mget(keys)
+        return [(key, value) for key, value in zip(keys, values) if value is not None]
+
+    def _room(self, room: Optional[Callable[[], int]]) -> int:
+        return self.batch_size if room is None else min(self.batch_size, room())
+
+    def ack(self, items: list[tuple[str, str]]):
+        """Удаляет записанные задачи из журнала, если за это время их не перезабрали в более новой версии"""
+        if not items:
+            return
+        args = []
+        for key, value in items:
+            args.extend([key, value])
+        self._delete_if_unchanged(keys=[self.inflight_key], args=args)
+
+    def requeue(self, items: list[tuple[str, str]]):
+        """Возвращает незаписанные задачи в очередь, не затирая пришедшие за это время новые версии"""
+        if not items:
+            return
+        pipe = self.redis.pipeline()
+        for key, value in items:
+            pipe.set(key, value, nx=True)
+        pipe.execute()
+        self.ack(items)
+
+    def stats(self) -> tuple[int, Optional[float]]:
+        """
+        Число задач в очереди (SCAN) и в журналах воркеров и время (unix) приёма самой старой из них.
+        Проходит всю очередь, поэтому вызывается не на каждой итерации воркера.
+        """
+        depth = 0
+        oldest = None
+
+        def count(payloads):
+            nonlocal depth, oldest
+            for payload in payloads:
+                depth += 1
+                stamp = received_at(payload)
+                if stamp is not None and (oldest is None or stamp < oldest):
+                    oldest = stamp
+
+        batch = []
+        for key in self.redis.scan_iter(count=self.batch_size):
+            if key.startswith(QUEUE_PREFIX):
+                continue
+            batch.append(key)
+            if len(batch) >= self.batch_size:
+                count(payload for _, payload in self._peek(batch))
+                batch = []
+        if batch:
+            count(payload for _, payload in self._peek(batch))
+        for inflight_key in self.redis.scan_iter(match=f"{INFLIGHT_PREFIX}*", count=self.batch_size):
+            count(self.redis.hvals(inflight_key))
+        return depth, oldest
+
+    def heartbeat(self):
+        """Продлевает аренду воркера"""
+        self.redis.set(f"{LEASE_PREFIX}{self.worker_id}", "1", ex=self.lease_seconds)
+
+    def reclaim(self, own: bool = False) -> int:
+        """
+        Возвращает в очередь журналы воркеров с истёкшей арендой.
+        own=True - также свой журнал (при запуске: всё, что в нём, осталось от упавшего процесса).
+        """
+        reclaimed = 0
+        for inflight_key in self.redis.scan_iter(match=f"{INFLIGHT_PREFIX}*", count=self.batch_size):
+            worker_id = inflight_key[len(INFLIGHT_PREFIX):]
+            force = own and worker_id == self.worker_id
+            count = self._reclaim(keys=[inflight_key, f"{LEASE_PREFIX}{worker_id}"], args=["1" if force else "0"])
+            if count > 0:
+                logger.warning("Requeued %s in-flight tasks of worker %s", count, worker_id)
+                reclaimed += count
+        return reclaimed
+
+
+class TaskQueue:
+    """
+    Очередь задач на Redis Stream.
+    В стриме лежат только ключи задач, последнее состояние задачи - в хэше PAYLOADS_KEY,
+    поэтому повторные вебхуки по одной задаче схлопываются в одну запись в таблицу.
+    Запись подтверждается (XACK) только после успешной записи в таблицу.
+    """
+
+    def __init__(self, redis_client: redis.Redis, consumer: Optional[str] = None, max_length: int = 100000):
+        self.redis = redis_client
+        # Имя потребителя должно переживать перезапуск, иначе его неподтверждённые записи зависнут
+        self.consumer = consumer or socket.gethostname()
+        self.max_length = max_length
+        self._group_ready = False
+        self._pending_from: Optional[str] = "0"
+        self._delete_if_unchanged = self.redis.register_script(_DELETE_IF_UNCHANGED_SCRIPT)
+
+    def enqueue(self, task_key: str, payload: str):
+        pipe = self.redis.pipeline()
+        queue_commands(pipe, task_key, payload, self.max_length)
+        pipe.execute()
+
+    def ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.redis.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def read(self, count: int, block_ms: int) -> list[tuple[str, Optional[str]]]:
+        """
+        Возвращает список (entry_id, task_key).
+        После запуска и после retry_pending() сначала отдаёт свои неподтверждённые записи
+        (например, после неудачной записи в таблицу), затем блокирующе ждёт новые.
+        Записи, прочитанные, но ещё не подтверждённые (лежащие в буфере воркера), повторно не отдаются.
+        """
+        self.ensure_group()
+        if self._pending_from is not None:
+            entries = self._read_group(self._pending_from, count, None)
+            if entries:
+                self._pending_from = entries[-1][0]
+                return entries
+            self._pending_from = None
+        return self._read_group(">", count, block_ms)
+
+    def retry_pending(self):
+        """Перечитать свои неподтверждённые записи при следующем read()"""
+        self._pending_from = "0"
+
+    def reclaim(self, min_idle_ms: int) -> int:
+        """
+        Забирает себе неподтверждённые записи других потребителей, простаивающие дольше min_idle_ms
+        (их воркер упал или завис), и перечитывает их при следующем read()
+        """
+        self.ensure_group()
+        reclaimed = 0
+        start_id = "0-0"
+        while True:
+            # Без JUSTID: с ним redis-py не возвращает курсор для следующего вызова
+            response = self.redis.xautoclaim(STREAM_KEY, CONSUMER_GROUP, self.consumer, min_idle_ms,
+                                             start_id=start_id, count=1000)
+            previous_id, start_id, entries = start_id, response[0], response[1]
+            reclaimed += len(entries)
+            # Курсор 0-0 - список неподтверждённых записей просмотрен целиком; не продвинулся - защита от зацикливания
+            if start_id in ("0-0", b"0-0") or start_id == previous_id:
+                break
+        if reclaimed:
+            logger.warning("Reclaimed %s pending stream entries of other consumers", reclaimed)
+            self.retry_pending()
+        return reclaimed
+
+    def touch(self, entry_ids: list[str]):
+        """
+        Сбрасывает время простоя своих неподтверждённых записей (XCLAIM JUSTID на себя): записи,
+        которые ещё лежат в буфере или записываются в таблицу, reclaim() других реплик не заберёт
+        """
+        for start in range(0, len(entry_ids), 1000):
+            self.redis.xclaim(STREAM_KEY, CONSUMER_GROUP, self.consumer, 0, entry_ids[start:start + 1000],
+                              justid=True)
+
+    def stats(self) -> tuple[int, Optional[float]]:
+        """Число записей в стриме и время (unix) самой старой из них - записи удаляются после подтверждения"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xlen(STREAM_KEY)
+        pipe.xrange(STREAM_KEY, count=1)
+        length, first = pipe.execute()
+        return length, entry_timestamp(first[0][0]) if first else None
+
+    def fetch_payloads(self, task_keys: list[str]) -> dict[str, str]:
+        if not task_keys:
+            return {}
+        values = self.redis.hmget(PAYLOADS_KEY, task_keys)
+        return {key: value for key, value in zip(task_keys, values) if value is not None}
+
+    def ack(self, entry_ids: list[str], written: dict[str, str]):
+        """Подтверждает записи стрима и удаляет из хэша те состояния задач, что уже записаны"""
+        if written:
+            args = []
+            for task_key, payload in written.items():
+                args.extend([task_key, payload])
+            self._delete_if_unchanged(keys=[PAYLOADS_KEY], args=args)
+        if entry_ids:
+            pipe = self.redis.pipeline()
+            pipe.xack(STREAM_KEY, CONSUMER_GROUP, *entry_ids)
+            pipe.xdel(STREAM_KEY, *entry_ids)
+            pipe.execute()
+
+    def _read_group(self, stream_id: str, count: int, block_ms: Optional[int]) -> list[tuple[str, Optional[str]]]:
+        response = self.redis.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {STREAM_KEY: stream_id}, count=count, block=block_ms
+        )
+        entries = []
+        for _, stream_entries in response or []:
+            for entry_id, fields in stream_entries:
+                # Запись могла быть удалена из стрима обрезкой, тогда fields пустой
+                entries.append((entry_id, (fields or {}).get("key")))
+        logger.debug("Read %s entries from %s starting at %s", len(entries), STREAM_KEY, stream_id)
+        return entries
+
+
+def entry_timestamp(entry_id: str) -> float:
+    """Время добавления записи стрима (unix) по её id вида <миллисекунды>-<номер>"""
+    return int(entry_id.split("-")[0]) / 1000
+
+
+def dead_letter(redis_client: redis.Redis, items: list[tuple[str, str]]):
+    """
+    Откладывает задачи (task_key, payload) в DEAD_LETTER_KEY, чтобы подтвердить их в очереди, не потеряв.
+    После исправления routing.yaml их можно вернуть в очередь.
+    """
+    if items:
+        redis_client.hset(DEAD_LETTER_KEY, mapping=dict(items))
+
+
+def stamp_received(payload: dict) -> dict:
+    """Отмечает в payload время приёма вебхука"""
+    payload[RECEIVED_AT_FIELD] = round(time.time(), 3)
+    return payload
+
+
+def received_at(payload: str) -> Optional[float]:
+    """Время приёма вебхука из payload (None для payload без отметки)"""
+    try:
+        value = json.loads(payload).get(RECEIVED_AT_FIELD)
+        return float(value) if value is not None else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def queue_commands(pipe, task_key: str, payload: str, max_length: int = 100000):
+    """Добавляет в pipeline команды постановки задачи в очередь"""
+    pipe.hset(PAYLOADS_KEY, task_key, payload)
+    pipe.xadd(STREAM_KEY, {"key": task_key}, maxlen=max_length, approximate=True)
+    return pipe
@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from gspread.utils import ValueRenderOption
+
+from app.helpers.string_helper import extract_task_key
+from app.services.metrics import track_api_call
+from app.services.quota_scheduler import READ, QuotaScheduler
+from logging_config import logger
+
+# Версии документа после записей этого процесса, по id документа: версия -> версия перед записью.
+# get_lastUpdateTime общий для всех листов документа, по цепочке своих версий копия листа
+# отличает записи писателей соседних листов от чужих правок.
+_own_versions: dict[str, dict[str, str]] = {}
+_own_versions_lock = threading.Lock()
+# Сколько последних своих версий помнить на документ
+OWN_VERSIONS_LIMIT = 256
+
+
+class WorksheetMirror:
+    """
+    Локальная копия листа Google Sheets.
+    Загружается один раз, обновляется на месте после каждой успешной записи
+    и сверяется с таблицей только по интервалу или при смене версии документа.
+
+    Перед собственной записью запоминается версия документа (begin_write). Если она уже не совпадает
+    с версией копии и не получена из неё записями этого процесса (в том числе в соседние листы),
+    документ меняли вне сервиса, и commit() не принимает новую версию как свою, а сбрасывает копию:
+    она перечитается при следующей сверке. Упавшая запись отменяется abort_write(),
+    иначе следующая запись продолжила бы её серию со старой версией до записи.
+    """
+
+    def __init__(self, sheet, worksheet, sync_interval: int = 600, cache_path: Optional[str] = None,
+                 quota: Optional[QuotaScheduler] = None):
+        self.sheet = sheet
+        self.quota = quota
+        self.worksheet = worksheet
+        self.sync_interval = sync_interval
+        self.cache_path = cache_path
+        self.rows: list[list[Any]] = []  # rows[0] - строка заголовков (строка 1 в таблице)
+        self._header: list[str] = []
+        self.version = None
+        self._synced_at = 0
+        self._key_to_row: dict[str, int] = {}
+        self._version_before_write = None
+        self._writing = False
+        self._load_from_disk()
+
+    def ensure_fresh(self):
+        """Перечитывает лист, если истёк интервал сверки или документ изменён вне сервиса"""
+        if not self.rows or time.time() - self._synced_at > self.sync_interval:
+            self.reload()
+            return
+
+        version = self._fetch_version()
+        if self._own_change(self.version, version):
+            self.version = version
+        else:
+            logger.info("Worksheet version changed (%s -> %s), reloading mirror", self.version, version)
+            self.reload(version)
+
+    def reload(self, version: Optional[str] = None):
+        """Полностью перечитывает лист: данные и строку заголовков"""
+        self.version = version or self._fetch_version()
+        self._writing = False
+        if self.quota is not None:
+            self.quota.acquire(READ)
+        # Формулы читаем как формулы, чтобы копия совпадала с тем, что мы сами пишем в таблицу
+        with track_api_call("get_all_values"):
+            values = self.worksheet.get_all_values(value_render_option=ValueRenderOption.formula)
+        self.rows = [list(row) for row in values]
+        # Заголовки могут быть формулами, поэтому их читаем в отображаемом виде
+        if self.quota is not None:
+            self.quota.acquire(READ)
+        with track_api_call("row_values"):
+            self._header = self.worksheet.row_values(1)
+        self._synced_at = time.time()
+        self._rebuild_index()
+        self._save_to_disk()
+        logger.debug("Loaded worksheet mirror: %s rows", len(self.rows))
+
+    def invalidate(self):
+        """Сбрасывает копию, следующая сверка перечитает лист целиком"""
+        self.rows = []
+        self._header = []
+        self._key_to_row = {}
+        self._synced_at = 0
+
+    @property
+    def header(self) -> list:
+        return list(self._header)
+
+    def keys(self) -> list:
+        """Значения первого столбца, как их вернул бы col_values(1)"""
+        keys = [row[0] if row else '' for row in self.rows]
+        while keys and not keys[-1]:
+            keys.pop()
+        return keys
+
+    def find_row(self, task_key: str) -> Optional[int]:
+        return self._key_to_row.get(task_key)
+
+    def get_row(self, row: int) -> list:
+        if 0 < row <= len(self.rows):
+            return list(self.rows[row - 1])
+        return []
+
+    def set_row(self, row: int, values: list):
+        """Записывает строку в копию после успешной записи в таблицу"""
+        while len(self.rows) < row:
+            self.rows.append([])
+        self.rows[row - 1] = list(values)
+        key = extract_task_key(values[0] if values else None)
+        if key:
+            self._key_to_row[key] = row
+
+    def delete_rows(self, rows: list[int]):
+        """Удаляет строки из копии вслед за удалением в таблице, строки ниже сдвигаются вверх"""
+        for row in sorted(set(rows), reverse=True):
+            if 0 < row <= len(self.rows):
+                del self.rows[row - 1]
+        self._rebuild_index()
+
+    def begin_write(self):
+        """Запоминает версию документа перед первой из серии собственных записей"""
+        if not self._writing:
+            self._version_before_write = self._fetch_version()
+            self._writing = True
+
+    def commit(self):
+        """Фиксирует версию документа после собственной записи"""
+        before, self._writing = self._version_before_write, False
+        if before is None or not self._own_change(self.version, before):
+            logger.warning("Worksheet changed outside the service before our write (%s -> %s), "
+                           "mirror will be reloaded", self.version, before)
+            self.invalidate()
+            return
+        self.version = self._fetch_version()
+        self._remember_own_version(before, self.version)
+        self._save_to_disk()
+
+    def abort_write(self):
+        """
+        Отменяет начатую запись после ошибки. Версия копии не меняется: если упавший запрос всё же
+        применился, версия документа разойдётся с ней, и следующая сверка перечитает лист.
+        """
+        self._writing = False
+        self._version_before_write = None
+
+    def _rebuild_index(self):
+        self._key_to_row = {}
+        for idx, row in enumerate(self.rows[1:], start=2):
+            key = extract_task_key(row[0] if row else None)
+            if key:
+                self._key_to_row[key] = idx
+
+    def _own_change(self, start: Optional[str], version: Optional[str]) -> bool:
+        """Получена ли версия version из start только записями этого процесса (в том числе в соседние листы)"""
+        with _own_versions_lock:
+            previous = _own_versions.get(self.sheet.id, {})
+            seen = set()
+            while version != start:
+                if version in seen or version not in previous:
+                    return False
+                seen.add(version)
+                version = previous[version]
+        return True
+
+    def _remember_own_version(self, before: str, after: Optional[str]):
+        if after is None or after == before:
+            return
+        with _own_versions_lock:
+            versions = _own_versions.setdefault(self.sheet.id, {})
+            versions[after] = before
+            while len(versions) > OWN_VERSIONS_LIMIT:
+                versions.pop(next(iter(versions)))
+
+    def _fetch_version(self) -> Optional[str]:
+        # Время последнего изменения берём из Drive API, это не расходует квоту чтения Sheets
+        try:
+            with track_api_call("get_lastUpdateTime"):
+                return self.sheet.get_lastUpdateTime()
+        except Exception as e:
+            logger.warning("Failed to fetch worksheet version: %s", e)
+            return None
+
+    def _load_from_disk(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('worksheet_id') != self.worksheet.id:
+                return
+            self.rows = data.get('rows', [])
+            self._header = data.get('header', [])
+            self.version = data.get('version')
+            self._synced_at = data.get('synced_at', 0)
+            self._rebuild_index()
+            logger.info("Loaded worksheet mirror from %s: %s rows", self.cache_path, len(self.rows))
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load worksheet mirror from disk: %s", e)
+
+    def _save_to_disk(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({
+                    'worksheet_id': self.worksheet.id,
+                    'version': self.version,
+                    'synced_at': self._synced_at,
+                    'header': self._header,
+                    'rows': self.rows,
+                }, file, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Failed to save worksheet mirror to disk: %s", e)
@@ -0,0 +1,99 @@
+import time
+from typing import Callable, NamedTuple, Optional
+
+from app.task_dto import TaskDTO
+
+
+class BufferedTask(NamedTuple):
+    task: TaskDTO
+    payload: str
+    entry_ids: tuple = ()  # записи Redis Stream, которые подтверждаются после записи задачи
+    received_at: float = 0.0  # когда задача попала в очередь (unix time), для метрики задержки
+    lane: str = ""  # полоса приоритета (см. PriorityLanes)
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи с адаптивным сбросом.
+    Повторные обновления одной задачи схлопываются до последнего состояния.
+    Сбрасывается сразу при max_size задач, после debounce секунд тишины и не позже max_latency
+    секунд после появления первой задачи в буфере.
+    """
+
+    def __init__(self, max_size: int = 500, debounce: float = 2.0, max_latency: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.debounce = debounce
+        self.max_latency = max_latency
+        self.clock = clock
+        self._items: dict[str, BufferedTask] = {}
+        self._first_at: Optional[float] = None
+        self._last_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, task_key: str) -> bool:
+        return task_key in self._items
+
+    def add(self, item: BufferedTask):
+        now = self.clock()
+        previous = self._items.pop(item.task.key, None)
+        if previous is not None:
+            item = item._replace(entry_ids=previous.entry_ids + item.entry_ids,
+                                 received_at=min(previous.received_at, item.received_at))
+        self._items[item.task.key] = item
+        if self._first_at is None:
+            self._first_at = now
+        self._last_at = now
+
+    def flush_reason(self) -> Optional[str]:
+        """Причина сбросить буфер сейчас или None, если можно ещё копить"""
+        if not self._items:
+            return None
+        if len(self._items) >= self.max_size:
+            return "size"
+        now = self.clock()
+        if now - self._first_at >= self.max_latency:
+            return "deadline"
+        if now - self._last_at >= self.debounce:
+            return "debounce"
+        return None
+
+    def time_until_flush(self) -> Optional[float]:
+        """Сколько секунд осталось до сброса по времени, None для пустого буфера"""
+        if not self._items:
+            return None
+        now = self.clock()
+        deadline = min(self._first_at + self.max_latency, self._last_at + self.debounce)
+        return max(0.0, deadline - now)
+
+    def oldest_received_at(self) -> Optional[float]:
+        if not self._items:
+            return None
+        return min(item.received_at for item in self._items.values())
+
+    def items(self) -> list[BufferedTask]:
+        return list(self._items.values())
+
+    def pop(self, task_key: str) -> Optional[BufferedTask]:
+        """Убирает задачу из буфера (например, при переходе в другую полосу)"""
+        item = self._items.pop(task_key, None)
+        if not self._items:
+            self._first_at = None
+            self._last_at = None
+        return item
+
+    def drain(self, limit: Optional[int] = None) -> list[BufferedTask]:
+        """
+        Забирает задачи из буфера: все или первые limit (дольше всех не обновлявшиеся).
+        У оставшихся сохраняется время появления, поэтому они сбрасываются при первой возможности.
+        """
+        if limit is not None and limit < len(self._items):
+            keys = list(self._items)[:limit]
+            return [self._items.pop(key) for key in keys]
+        items = list(self._items.values())
+        self._items = {}
+        self._first_at = None
+        self._last_at = None
+        return items
@@ -1,11 +1,34 @@
 import logging
+import re
+from typing import Any
 
-import yaml
+from app.services.assignee_mapping import assignee_mapping
 
 logger = logging.getLogger(__name__)
 
+# Ключ задачи трекера вида QUEUE-123, попадает в формулу HYPERLINK и в индекс строк
+_task_key_pattern = re.compile(r"[A-Za-z][A-Za-z0-9_]*-\d+")
+
+_STRING_FIELDS = (
+    "summary", "stageDeadline", "type", "assignee", "status", "dueDate", "sprint", "priority",
+    "updatedBy", "updatedAt", "project", "deadlineFact", "dev", "qaEngineer", "analyst",
+)
+_BOOL_FIELDS = ("offThePlan", "movingOnToTheNextSprint", "outsideOfTheSprintPlan")
+_NUMBER_FIELDS = ("spDevelopment", "spTesting")
+
+
+class TaskValidationError(ValueError):
+    pass
+
 
 class TaskDTO:
+    __slots__ = (
+        "id", "key", "_summary", "stage_deadline", "type", "_assignee", "status", "due_date",
+        "_off_the_plan", "_moving_on_to_the_next_sprint", "sp_development", "sprint", "priority",
+        "updated_by", "updated_at", "_outside_of_the_sprint_plan", "project", "deadline_fact",
+        "sp_testing", "_dev", "_qa_engineer", "_analyst",
+    )
+
     def __init__(self, **kwargs):
         self.id = kwargs.get("id")
         self.key = kwargs.get("key")
@@ -30,21 +53,28 @@ class TaskDTO:
         self._qa_engineer = kwargs.get("qaEngineer")
         self._analyst = kwargs.get("analyst")
 
-        self._load_mapping_assignee()
-
-    def _load_mapping_assignee(self):
-        """Загружает маппинги из YAML файла"""
-        # TODO обработать ошибку табуляции в файле YAML
-        try:
-            with open('mapping.yaml', 'r', encoding='utf-8') as file:
-                data = yaml.safe_load(file)
-                self.mapping_assignee = data.get('assignee', {})
-        except FileNotFoundError:
-            logger.error("Mapping file not found, using empty mapping")
-            self.mapping_assignee = {}
-        except yaml.YAMLError as e:
-            logger.error(f"Error parsing mapping file: {e}")
-            raise
+    @classmethod
+    def from_payload(cls, data: Any) -> "TaskDTO":
+        """
+        Создаёт задачу из JSON вебхука, проверяя и нормализуя поля за один проход.
+        Бросает TaskValidationError, если payload некорректен.
+        """
+        if not isinstance(data, dict):
+            raise TaskValidationError("Task payload must be a JSON object")
+
+        key = data.get("key")
+        if not isinstance(key, str) or not _task_key_pattern.fullmatch(key):
+            raise TaskValidationError(f"Invalid task key: {key!r}")
+
+        fields = {"id": data.get("id"), "key": key}
+        for name in _STRING_FIELDS:
+            fields[name] = _normalize_string(name, data.get(name))
+        for name in _BOOL_FIELDS:
+            fields[name] = _normalize_bool(name, data.get(name))
+        for name in _NUMBER_FIELDS:
+            fields[name] = _normalize_number(name, data.get(name))
+
+        return cls(**fields)
 
     @property
     def off_the_plan(self):
@@ -63,7 +93,11 @@ class TaskDTO:
 
     @property
     def hyperlink(self) -> str:
-        return f'=HYPERLINK("{self.url()}"; "{self.name()}")'
+        return self.hyperlink_formula()
+
+    def hyperlink_formula(self, separator: str = ";") -> str:
+        # Разделитель аргументов зависит от локали листа (см. cell_helper.formula_separator)
+        return f'=HYPERLINK("{self.url()}"{separator} "{self.name()}")'
 
     @property
     def outside_sprint(self):
@@ -71,22 +105,57 @@ class TaskDTO:
 
     @property
     def assignee(self):
-        return self.mapping_assignee.get(self._assignee, self._assignee)
+        return assignee_mapping.get(self._assignee)
 
     @property
     def dev(self):
-        return self.mapping_assignee.get(self._dev, self._dev)
+        return assignee_mapping.get(self._dev)
 
     @property
     def qa_engineer(self):
-        return self.mapping_assignee.get(self._qa_engineer, self._qa_engineer)
+        return assignee_mapping.get(self._qa_engineer)
 
     @property
     def analyst(self):
-        return self.mapping_assignee.get(self._analyst, self._analyst)
+        return assignee_mapping.get(self._analyst)
 
     def url(self) -> str:
         return f"https://tracker.yandex.ru/{self.key}"
 
     def name(self) -> str:
         return f"{self.key}: {self.summary}"
+
+
+def _normalize_string(name: str, value: Any) -> str | None:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TaskValidationError(f"Field {name} must be a string, got {type(value).__name__}")
+
+
+def _normalize_bool(name: str, value: Any) -> bool:
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str) and value.strip().lower() in ("", "0", "false", "no", "нет"):
+        return False
+    if isinstance(value, str) and value.strip().lower() in ("1", "true", "yes", "да"):
+        return True
+    raise TaskValidationError(f"Field {name} must be a boolean, got {value!r}")
+
+
+def _normalize_number(name: str, value: Any) -> int | float | str:
+    # Пустое значение - пустая ячейка, в mapping() такие оценки не пишутся
+    if value is None or value == "":
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        try:
+            number = float(value.replace(",", "."))
+        except ValueError:
+            raise TaskValidationError(f"Field {name} must be a number, got {value!r}")
+        return int(number) if number.is_integer() else number
+    raise TaskValidationError(f"Field {name} must be a number, got {type(value).__name__}")
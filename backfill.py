@@ -0,0 +1,104 @@
+import argparse
+import sys
+
+import redis
+
+from app.services.bulk_ingest import PayloadStreamParser
+from app.services.google_sheets_service import GoogleSheetsService
+from app.services.row_index import RowIndex
+from app.services.sheet_router import SheetRouter, SheetTarget
+from app.task_dto import TaskDTO, TaskValidationError
+from config import config
+from logging_config import listener, logger
+
+# Сверка листа с выгрузкой трекера: python backfill.py export.ndjson [--target NAME] [--chunk-size 1000]
+# Выгрузка - JSON-массив или NDJSON с теми же объектами, что приходят в вебхуке /gh.
+
+redis_client = redis.StrictRedis(
+    host=config.get('REDIS_HOST'),
+    port=config.get('REDIS_PORT'),
+    db=config.get('REDIS_DB'),
+    password=config.get('REDIS_PASSWORD'),
+    decode_responses=True
+)
+
+
+def read_export(path: str) -> dict[str, TaskDTO]:
+    """Потоково читает выгрузку, по каждой задаче остаётся последнее состояние"""
+    parser = PayloadStreamParser()
+    tasks: dict[str, TaskDTO] = {}
+    rejected = 0
+
+    def collect(items):
+        nonlocal rejected
+        for index, payload in items:
+            try:
+                if isinstance(payload, ValueError):
+                    raise payload
+                task = TaskDTO.from_payload(payload)
+            except (TaskValidationError, ValueError) as e:
+                logger.error("Export item %s skipped: %s", index, e)
+                rejected += 1
+                continue
+            tasks[task.key] = task
+
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            collect(parser.feed(chunk))
+    collect(parser.close())
+    logger.info("Read %s tasks from %s, %s items skipped", len(tasks), path, rejected)
+    return tasks
+
+
+def backfill_target(target: SheetTarget, tasks: list[TaskDTO], chunk_size: int):
+    """
+    Приводит лист к состоянию из выгрузки.
+    Лист читается один раз целиком в локальную копию (WorksheetMirror), строки сравниваются в памяти
+    (даты - серийными числами, как их хранит таблица), и на каждую пачку уходит один batch_update
+    изменившихся ячеек и одна дозапись новых строк.
+    """
+    service = GoogleSheetsService(redis_client, target.sheet_key, target.worksheet,
+                                  quota_tenant=target.name, mirror=True, diff_writes=True)
+
+    existing = sum(1 for task in tasks if service.mirror.find_row(task.key) is not None)
+    logger.info("%s: %s tasks to reconcile, %s to create", target.name, existing, len(tasks) - existing)
+    row_index = RowIndex(redis_client, f"{service.sheet.id}:{service.worksheet.id}")
+    for start in range(0, len(tasks), chunk_size):
+        # Пачка пишется под блокировкой листа, как и у воркера, и под ней же сбрасывается индекс строк
+        # воркера: новые строки дописаны в обход индекса, и воркер между пачками не должен писать
+        # по устаревшей первой свободной строке
+        with service.write_lock:
+            service.store_tasks_batch(tasks[start:start + chunk_size])
+            row_index.invalidate()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile Google Sheets with a tracker export")
+    parser.add_argument("path", help="JSON array or NDJSON file with task payloads")
+    parser.add_argument("--target", help="only reconcile this routing target")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="tasks per batched write")
+    args = parser.parse_args(argv)
+
+    tasks = read_export(args.path)
+    router = SheetRouter.from_file(config.get('SHEET_ROUTING_PATH') or 'routing.yaml')
+    groups, unrouted = router.group(list(tasks.values()))
+    failed = 0
+    if unrouted and not args.target:
+        logger.error("%s tasks have no sheet route and were not reconciled", len(unrouted))
+        failed += 1
+    for target, group in groups.items():
+        if args.target and target.name != args.target:
+            continue
+        try:
+            backfill_target(target, group, args.chunk_size)
+        except Exception as e:
+            logger.error("%s: backfill failed: %s", target.name, e)
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    finally:
+        listener.stop()
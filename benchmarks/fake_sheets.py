@@ -0,0 +1,280 @@
+import json
+import re
+import time
+from collections import deque
+from typing import Optional
+
+import requests
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+_HYPERLINK_PATTERN = re.compile(r'^=HYPERLINK\(".*?";\s*"(.*)"\)$')
+
+
+class Cell:
+    def __init__(self, row: int, col: int, value):
+        self.row = row
+        self.col = col
+        self.value = value
+
+
+class FakeBackend:
+    """
+    Общие для листа настройки имитации API: задержка ответа, лимит запросов в минуту (ответ 429)
+    и счётчик вызовов по операциям.
+    """
+
+    def __init__(self, latency: float = 0.0, requests_per_minute: Optional[int] = None, retry_after: int = 1):
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.retry_after = retry_after
+        self.calls: dict[str, int] = {}
+        self.throttled = 0
+        self.version = 0  # меняется при каждой записи, как modifiedTime файла в Drive
+        self._history = deque()
+
+    def call(self, operation: str):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.requests_per_minute is None:
+            return
+        now = time.monotonic()
+        while self._history and now - self._history[0] > 60:
+            self._history.popleft()
+        if len(self._history) >= self.requests_per_minute:
+            self.throttled += 1
+            raise quota_error(self.retry_after)
+        self._history.append(now)
+
+    def reset(self):
+        self.calls = {}
+        self.throttled = 0
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+
+def quota_error(retry_after: int) -> APIError:
+    """APIError в том виде, в каком gspread отдаёт ответ 429"""
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    response._content = json.dumps({"error": {
+        "code": 429,
+        "message": "Quota exceeded for quota metric 'Read requests'",
+        "status": "RESOURCE_EXHAUSTED",
+    }}).encode()
+    return APIError(response)
+
+
+class FakeWorksheet:
+    """
+    Лист в памяти с подмножеством API gspread.Worksheet, которым пользуется проект.
+    Хранит значения так, как их прислали (формулы остаются формулами), при чтении
+    без FORMULA отдаёт отображаемые значения: текст ссылки HYPERLINK, TRUE/FALSE.
+    """
+
+    def __init__(self, rows: list[list], backend: Optional[FakeBackend] = None, title: str = "Tasks",
+                 sheet_id: int = 0, grid_rows: int = 1000):
+        self.rows = [list(row) for row in rows]
+        self.backend = backend or FakeBackend()
+        self.title = title
+        self.id = sheet_id
+        self.grid_rows = max(grid_rows, len(self.rows))
+
+    @property
+    def row_count(self) -> int:
+        return self.grid_rows
+
+    def row_values(self, row: int, **kwargs) -> list:
+        self.backend.call("row_values")
+        values = self.rows[row - 1] if row <= len(self.rows) else []
+        return self._trim([self._display(value) for value in values])
+
+    def col_values(self, col: int, **kwargs) -> list:
+        self.backend.call("col_values")
+        return self._trim([self._display(row[col - 1]) if len(row) >= col else '' for row in self.rows])
+
+    def find(self, query, in_column: Optional[int] = None, **kwargs) -> Optional[Cell]:
+        self.backend.call("find")
+        for row_number, row in enumerate(self.rows, start=1):
+            columns = [in_column - 1] if in_column else range(len(row))
+            for col in columns:
+                if col >= len(row):
+                    continue
+                value = self._display(row[col])
+                if query.match(value) if isinstance(query, re.Pattern) else value == query:
+                    return Cell(row_number, col + 1, value)
+        return None
+
+    def get(self, range_name: str, value_render_option=None, **kwargs) -> list[list]:
+        self.backend.call("get")
+        return self._read(range_name, self._is_formula(value_render_option))
+
+    def batch_get(self, ranges: list[str], value_render_option=None, **kwargs) -> list[list[list]]:
+        self.backend.call("batch_get")
+        return [self._read(range_name, self._is_formula(value_render_option)) for range_name in ranges]
+
+    def get_all_values(self, value_render_option=None, **kwargs) -> list[list]:
+        self.backend.call("get_all_values")
+        formula = self._is_formula(value_render_option)
+        return [[value if formula else self._display(value) for value in row] for row in self.rows]
+
+    def update(self, range_name, values=None, value_input_option=None, **kwargs):
+        self.backend.call("update")
+        # gspread 6 принимает и update(range, values), и update(values, range)
+        if not isinstance(range_name, str):
+            range_name, values = values, range_name
+        self._write(range_name, values)
+        self.backend.version += 1
+
+    def batch_update(self, data: list[dict], value_input_option=None, **kwargs):
+        self.backend.call("batch_update")
+        for request in data:
+            self._write(request["range"], request["values"])
+        self.backend.version += 1
+
+    def append_rows(self, values: list[list], value_input_option=None, table_range=None, **kwargs):
+        self.backend.call("append_rows")
+        # Как values.append: строки дописываются после последней непустой строки таблицы
+        last = max((number for number, row in enumerate(self.rows, start=1) if any(row)), default=0)
+        del self.rows[last:]
+        self.rows.extend(list(row) for row in values)
+        self.grid_rows = max(self.grid_rows, len(self.rows))
+        self.backend.version += 1
+
+    def apply_request(self, request: dict):
+        """Запрос spreadsheets.batchUpdate: updateCells, appendDimension или deleteDimension"""
+        if "appendDimension" in request:
+            self.grid_rows += request["appendDimension"]["length"]
+        elif "deleteDimension" in request:
+            deleted = request["deleteDimension"]["range"]
+            del self.rows[deleted["startIndex"]:deleted["endIndex"]]
+            self.grid_rows -= deleted["endIndex"] - deleted["startIndex"]
+        elif "updateCells" in request and "userEnteredValue" in request["updateCells"]["fields"]:
+            update = request["updateCells"]
+            start = update["start"]
+            if start["rowIndex"] + len(update["rows"]) > self.grid_rows:
+                raise ValueError("Range exceeds grid limits")
+            for offset, row in enumerate(update["rows"]):
+                self._write(rowcol_to_a1(start["rowIndex"] + offset + 1, start["columnIndex"] + 1),
+                            [[_cell_value(cell) for cell in row["values"]]])
+
+    def _read(self, range_name: str, formula: bool) -> list[list]:
+        first_row, first_col, last_row, last_col = self._parse_range(range_name)
+        result = []
+        for row in range(first_row, last_row + 1):
+            values = self.rows[row - 1] if row <= len(self.rows) else []
+            result.append(self._trim([value if formula else self._display(value)
+                                      for value in values[first_col - 1:last_col]]))
+        while result and not result[-1]:
+            result.pop()
+        return result
+
+    def _write(self, range_name: str, values: list[list]):
+        first_row, first_col, _, _ = self._parse_range(range_name)
+        for offset, row_values in enumerate(values):
+            while len(self.rows) < first_row + offset:
+                self.rows.append([])
+            row = self.rows[first_row + offset - 1]
+            if len(row) < first_col - 1 + len(row_values):
+                row.extend([''] * (first_col - 1 + len(row_values) - len(row)))
+            row[first_col - 1:first_col - 1 + len(row_values)] = row_values
+
+    @staticmethod
+    def _parse_range(range_name: str) -> tuple[int, int, int, int]:
+        range_name = range_name.split("!")[-1]
+        start, _, end = range_name.partition(":")
+        first_row, first_col = a1_to_rowcol(start)
+        last_row, last_col = a1_to_rowcol(end) if end else (first_row, first_col)
+        return first_row, first_col, last_row, last_col
+
+    @staticmethod
+    def _is_formula(value_render_option) -> bool:
+        return value_render_option is not None and "FORMULA" in str(value_render_option)
+
+    @staticmethod
+    def _display(value) -> str:
+        if isinstance(value, bool):
+            return "TRUE" if value else "FALSE"
+        if value is None:
+            return ""
+        if isinstance(value, str):
+            match = _HYPERLINK_PATTERN.match(value)
+            if match:
+                return match.group(1)
+            return value
+        return str(value)
+
+    @staticmethod
+    def _trim(values: list) -> list:
+        while values and values[-1] in ('', None):
+            values.pop()
+        return values
+
+
+def _cell_value(cell: dict):
+    value = cell.get("userEnteredValue", {})
+    for kind in ("formulaValue", "stringValue", "boolValue", "numberValue"):
+        if kind in value:
+            return value[kind]
+    return ""
+
+
+def _request_sheet_id(request: dict) -> int:
+    kind, body = next(iter(request.items()))
+    if kind == "updateCells":
+        return body["start"]["sheetId"]
+    if kind == "deleteDimension":
+        return body["range"]["sheetId"]
+    return body["sheetId"]
+
+
+class FakeSpreadsheet:
+    id = "fake-spreadsheet"
+    locale = "ru_RU"
+
+    def __init__(self, worksheet: FakeWorksheet):
+        self.backend = worksheet.backend
+        self.worksheets = {worksheet.title: worksheet}
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.backend.call("fetch_sheet_metadata")
+        if title not in self.worksheets:
+            raise WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 26, **kwargs) -> FakeWorksheet:
+        self.backend.call("add_worksheet")
+        worksheet = FakeWorksheet([], self.backend, title, sheet_id=len(self.worksheets))
+        self.worksheets[title] = worksheet
+        return worksheet
+
+    def batch_update(self, body: dict):
+        """spreadsheets.batchUpdate: запросы применяются все или ни одного"""
+        self.backend.call("spreadsheet_batch_update")
+        by_id = {worksheet.id: worksheet for worksheet in self.worksheets.values()}
+        snapshot = {worksheet: ([list(row) for row in worksheet.rows], worksheet.grid_rows)
+                    for worksheet in by_id.values()}
+        try:
+            for request in body["requests"]:
+                by_id[_request_sheet_id(request)].apply_request(request)
+        except Exception:
+            for worksheet, (rows, grid_rows) in snapshot.items():
+                worksheet.rows, worksheet.grid_rows = rows, grid_rows
+            raise
+        self.backend.version += 1
+
+    def get_lastUpdateTime(self) -> str:
+        self.backend.call("get_lastUpdateTime")
+        return str(self.backend.version)
+
+
+class FakeClient:
+    def __init__(self, spreadsheet: FakeSpreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        return self.spreadsheet
@@ -0,0 +1,254 @@
+"""
+Бенчмарки записи в Google Sheets на локальном фейковом листе (benchmarks/fake_sheets.py).
+
+Запуск из корня репозитория:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 10 1000 --batch-sizes 50 --modes diff mirror --latency 0.05
+
+Для каждого размера листа, режима сервиса и размера пачки меряется число вызовов API, время
+и пиковая память store_tasks_batch и store_task, а также сквозная пропускная способность
+redis_worker на fakeredis (постановка вебхуков в очередь -> буфер -> запись в лист).
+Нужен fakeredis с поддержкой Lua (воркер выполняет Lua-скрипты забора задач и квоты), он входит
+в requirements-dev.txt:
+    pip install -r requirements-dev.txt
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import time
+import tracemalloc
+from typing import Callable, Optional
+
+import fakeredis
+import gspread
+import redis
+
+from app.enums.column_enum import ColumnEnum
+from app.services.base_sheets_service import BaseSheetsService
+from app.task_dto import TaskDTO
+from benchmarks.fake_sheets import FakeBackend, FakeClient, FakeSpreadsheet, FakeWorksheet
+from config import config
+
+# Режимы сервиса: переменные .env, с которыми создаётся GoogleSheetsService
+MODES = {
+    "default": {},
+    "diff": {"SHEET_DIFF_WRITES": "true"},
+    "mirror": {"SHEET_MIRROR_ENABLED": "true", "SHEET_DIFF_WRITES": "true"},
+    "row_index": {"ROW_INDEX_ENABLED": "true", "SHEET_DIFF_WRITES": "true"},
+    "batch_commit": {"ROW_INDEX_ENABLED": "true", "SHEET_DIFF_WRITES": "true", "SHEET_BATCH_COMMIT": "true"},
+}
+
+BASE_CONFIG = {
+    "GOOGLE_SHEET_KEY": "benchmark",
+    "GOOGLE_SHEET_WORKSHEET": "Tasks",
+    # Планировщик квоты не должен ограничивать фейковый лист, если не включена имитация 429
+    "SHEETS_READ_QUOTA_PER_MINUTE": "1000000",
+    "SHEETS_WRITE_QUOTA_PER_MINUTE": "1000000",
+    "SHEET_ROUTING_PATH": os.devnull,
+}
+
+SPRINT = "Спринт 42 (01.10 – 14.10)"
+HEADER = [column.value for column in ColumnEnum] + ["Иванов И.", "Петров П."]
+HEADER[HEADER.index(ColumnEnum.sprint.value)] = "Текущий спринт (42)"
+
+
+def task_payload(number: int, status: str = "Open") -> dict:
+    return {
+        "key": f"BENCH-{number}",
+        "summary": f"Benchmark task {number}",
+        "type": "Task",
+        "status": status,
+        "sprint": SPRINT,
+        "priority": "Normal",
+        "project": "Benchmarks",
+        "dev": "Иванов И.",
+        "spDevelopment": number % 8,
+        "qaEngineer": "Петров П.",
+        "spTesting": number % 3,
+    }
+
+
+def make_rows(size: int) -> list[list]:
+    """Строки листа в том же виде, в каком их записал бы сервис"""
+    service = BaseSheetsService()
+    service.header = BaseSheetsService._normalize_header(list(HEADER))
+    rows = [list(HEADER)]
+    for number in range(1, size + 1):
+        rows.append(service.mapping(TaskDTO.from_payload(task_payload(number))))
+    return rows
+
+
+def make_tasks(size: int, count: int, revision: str = "In progress") -> list[TaskDTO]:
+    """Половина пачки - изменения существующих задач, половина - новые задачи"""
+    updates = min(size, count // 2)
+    existing = list(range(1, size + 1, max(1, size // updates)))[:updates] if updates else []
+    created = range(size + 1, size + 1 + count - len(existing))
+    return [TaskDTO.from_payload(task_payload(number, revision)) for number in [*existing, *created]]
+
+
+def setup_sheet(size: int, mode: str, latency: float, requests_per_minute, rows_cache: dict) -> FakeWorksheet:
+    if size not in rows_cache:
+        rows_cache[size] = make_rows(size)
+    backend = FakeBackend(latency=latency, requests_per_minute=requests_per_minute)
+    worksheet = FakeWorksheet(rows_cache[size], backend)
+    gspread.service_account = lambda filename=None: FakeClient(FakeSpreadsheet(worksheet))
+    config.clear()
+    config.update(BASE_CONFIG)
+    config.update(MODES[mode])
+    return worksheet
+
+
+def measure(func: Callable, trace_memory: bool = True) -> tuple[float, int, Optional[str]]:
+    """
+    Время выполнения, пиковая память (байты, через tracemalloc - он же замедляет выполнение)
+    и ошибка, если прогон упал (например, 429 при имитации квоты исчерпал повторы).
+    """
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    error = None
+    try:
+        func()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+        if trace_memory:
+            tracemalloc.stop()
+    return elapsed, peak, error
+
+
+def bench_service(size: int, mode: str, batch_size: int, args, rows_cache: dict) -> list[dict]:
+    from app.services.google_sheets_service import GoogleSheetsService
+
+    results = []
+    for operation in ("store_tasks_batch", "store_task"):
+        worksheet = setup_sheet(size, mode, args.latency, args.requests_per_minute, rows_cache)
+        redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+        service = GoogleSheetsService(redis_client)
+        count = batch_size if operation == "store_tasks_batch" else min(batch_size, args.single_limit)
+        tasks = make_tasks(size, count)
+        worksheet.backend.reset()
+
+        if operation == "store_tasks_batch":
+            elapsed, peak, error = measure(lambda: service.store_tasks_batch(tasks), args.memory)
+        else:
+            elapsed, peak, error = measure(lambda: [service.store_task(task) for task in tasks], args.memory)
+        results.append({
+            "benchmark": operation,
+            "rows": size,
+            "mode": mode,
+            "tasks": len(tasks),
+            "api_calls": worksheet.backend.total_calls,
+            "calls": dict(worksheet.backend.calls),
+            "throttled": worksheet.backend.throttled,
+            "seconds": round(elapsed, 4),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+            "tasks_per_second": round(len(tasks) / elapsed, 1) if elapsed else None,
+            "error": error,
+        })
+    return results
+
+
+def bench_worker(size: int, mode: str, queue_mode: str, args, rows_cache: dict) -> dict:
+    """Сквозной прогон redis_worker: вебхуки в fakeredis -> буфер -> запись в фейковый лист"""
+    worksheet = setup_sheet(size, mode, args.latency, args.requests_per_minute, rows_cache)
+    config.update({"QUEUE_MODE": queue_mode, "QUEUE_BATCH_SIZE": str(args.worker_batch)})
+    redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    redis.StrictRedis = lambda **kwargs: redis_client
+
+    import redis_worker
+    redis_worker = importlib.reload(redis_worker)
+
+    # Каждая задача приходит дважды, в буфере остаётся последнее состояние
+    for revision in ("Open", "In progress"):
+        pipe = redis_client.pipeline(transaction=False)
+        for task in make_tasks(size, args.worker_tasks, revision):
+            payload = json.dumps(task_payload(int(task.key.split("-")[1]), revision))
+            if queue_mode == "stream":
+                redis_worker.task_queue.enqueue(task.key, payload)
+            else:
+                pipe.set(task.key, payload)
+        pipe.execute()
+    worksheet.backend.reset()
+
+    def run():
+        while True:
+            if queue_mode == "stream":
+                redis_worker.collect_stream_queue(block_ms=1)
+            else:
+                redis_worker.collect_keys_queue()
+            if len(redis_worker.write_buffer):
+                redis_worker.flush_buffer("benchmark")
+            elif redis_worker.writer_pool.pending() or redis_worker.writing:
+                # Записи листов идут в потоках писателей, ждём их и подтверждаем записанное
+                redis_worker.writer_pool.wait()
+                redis_worker.handle_written()
+            else:
+                return
+
+    elapsed, peak, error = measure(run, args.memory)
+    return {
+        "benchmark": f"worker_{queue_mode}",
+        "rows": size,
+        "mode": mode,
+        "tasks": args.worker_tasks,
+        "api_calls": worksheet.backend.total_calls,
+        "calls": dict(worksheet.backend.calls),
+        "throttled": worksheet.backend.throttled,
+        "seconds": round(elapsed, 4),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "tasks_per_second": round(args.worker_tasks / elapsed, 1) if elapsed else None,
+        "error": error,
+    }
+
+
+def print_table(results: list[dict]):
+    columns = ("benchmark", "rows", "mode", "tasks", "api_calls", "throttled", "seconds", "peak_mb",
+               "tasks_per_second")
+    print("  ".join(f"{column:>17}" for column in columns))
+    for result in results:
+        print("  ".join(f"{str(result[column]):>17}" for column in columns))
+        if result["error"]:
+            print(f"{'':>17}  failed: {result['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Google Sheets sync benchmarks on a fake worksheet")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 20000], help="rows in the sheet")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 50, 500], help="tasks per batch")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--requests-per-minute", type=int, default=None,
+                        help="simulate 429 responses above this rate")
+    parser.add_argument("--single-limit", type=int, default=50, help="max tasks for the store_task benchmark")
+    parser.add_argument("--worker-tasks", type=int, default=2000, help="tasks pushed through redis_worker")
+    parser.add_argument("--worker-batch", type=int, default=500, help="QUEUE_BATCH_SIZE for redis_worker")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc to get undistorted wall time")
+    parser.add_argument("--json", dest="json_path", help="also write raw results to this file")
+    args = parser.parse_args(argv)
+
+    # Логи по каждой задаче искажают замеры
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rows_cache = {}
+    results = []
+    for size in args.sizes:
+        for mode in args.modes:
+            for batch_size in args.batch_sizes:
+                results.extend(bench_service(size, mode, batch_size, args, rows_cache))
+            for queue_mode in ("keys", "stream"):
+                results.append(bench_worker(size, mode, queue_mode, args, rows_cache))
+    print_table(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
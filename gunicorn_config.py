@@ -1,9 +1,13 @@
+import logging
 import multiprocessing
+import os
 
 # Основные настройки
 bind = "0.0.0.0:5555"
 workers = min(multiprocessing.cpu_count(), 4)  # Ограничиваем количество воркеров
 worker_class = "sync"
+# Асинхронный приём вебхуков (только /gh и /health) без Flask:
+# gunicorn -c gunicorn_config.py -k uvicorn.workers.UvicornWorker app.asgi:application
 
 # Таймауты
 timeout = 300  # Увеличиваем таймаут до 5 минут
@@ -14,8 +18,12 @@ graceful_timeout = 30
 max_requests = 1000  # Перезапуск воркера после 1000 запросов
 max_requests_jitter = 100  # Добавляем случайность
 worker_tmp_dir = "/dev/shm"  # Используем RAM для временных файлов
+# Метрики всех воркеров на /metrics: prometheus_client в multiprocess-режиме пишет значения в файлы
+# этого каталога (в RAM). Переменная задаётся до запуска воркеров, каталог очищается при старте мастера
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/dev/shm/prometheus_multiproc")
 
-# Логирование
+# Логирование (каталог logs/ не хранится в репозитории)
+os.makedirs("logs", exist_ok=True)
 accesslog = "logs/app.log"
 errorlog = "logs/error.log"
 loglevel = "info"
@@ -27,10 +35,31 @@ worker_connections = 1000
 
 # Мониторинг
 enable_stdio_inheritance = True
+# По этому файлу HealthMonitor находит мастер и его воркеров (GUNICORN_PID_FILE в .env)
+pidfile = "/tmp/gunicorn.pid"
+
+def on_starting(server):
+    # Файл лога приложения (logs/logger_app.gunicorn.log) ведёт только мастер, воркеры пересылают ему записи
+    # (post_fork), поэтому перезапущенные воркеры не создают новых файлов
+    import logging_config
+    logging_config.share_with_forked_workers()
+    # Файлы метрик прошлого запуска иначе суммировались бы с метриками новых воркеров
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        os.remove(os.path.join(metrics_dir, name))
 
 # Обработка сигналов для graceful restart
 def when_ready(server):
     server.log.info("Server is ready. Spawning workers")
+    # Монитор памяти работает в мастере: он переживает перезапуски воркеров и перезапускает их по одному.
+    # logging_config в мастере не подключается (его поток записи не переживает fork воркеров),
+    # записи монитора идут в errorlog gunicorn; воркеры при импорте приложения заменяют эти обработчики своими
+    root = logging.getLogger()
+    root.handlers = list(server.log.error_log.handlers)
+    root.setLevel(logging.INFO)
+    from app.health_monitor import HealthMonitor, restart_process
+    HealthMonitor(memory_threshold=85, restart_callback=restart_process, use_tracemalloc=False).start_monitoring()
 
 def worker_int(worker):
     worker.log.info("worker received INT or QUIT signal")
@@ -39,10 +68,21 @@ def pre_fork(server, worker):
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
 def post_fork(server, worker):
+    import logging_config
+    logging_config.forward_to_master()
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
 def post_worker_init(worker):
     worker.log.info("Worker initialized (pid: %s)", worker.pid)
+    # Рост аллокаций воркера (HEALTH_TRACEMALLOC=true) отслеживается в нём самом, перезапусками управляет мастер
+    from app.health_monitor import HealthMonitor, tracemalloc_enabled
+    if tracemalloc_enabled():
+        HealthMonitor(discover=False).start_monitoring()
+
+def child_exit(server, worker):
+    # Убираем live-метрики (gauge) завершившегося воркера из multiprocess-каталога prometheus_client
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
 
 def worker_abort(worker):
     worker.log.info("Worker aborted (pid: %s)", worker.pid)
\ No newline at end of file
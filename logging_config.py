@@ -1,25 +1,182 @@
 import logging.handlers
+import multiprocessing
+import os
 import queue
+import sys
+import threading
 from datetime import datetime
+from typing import Optional
 from zoneinfo import ZoneInfo
 
+from config import config
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+
 class MoscowFormatter(logging.Formatter):
+    """Время записей по Москве. Строка времени кэшируется на секунду: в пачке записей она одна и та же"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_second = None
+        self._cached_time = None
+
     def formatTime(self, record, datefmt=None):
-        dt = datetime.fromtimestamp(record.created, tz=ZoneInfo("Europe/Moscow"))
-        if datefmt:
-            return dt.strftime(datefmt)
-        return dt.isoformat()
+        if not datefmt:
+            return datetime.fromtimestamp(record.created, tz=MOSCOW_TZ).isoformat()
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_time = datetime.fromtimestamp(second, tz=MOSCOW_TZ).strftime(datefmt)
+            self._cached_second = second
+        return self._cached_time
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler с ограниченной очередью: при переполнении записи отбрасываются, а не копят память.
+    Когда очередь почти заполнена, сначала отбрасываются записи ниже WARNING, предупреждения и ошибки
+    теряются только при полностью заполненной очереди.
+    Число отброшенных записей попадает в лог отдельной записью, как только в очереди появится место.
+    Форматирование сообщения выполняется в потоке QueueListener, а не в вызывающем коде.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._pending_dropped = 0
+        self._high_watermark = int(log_queue.maxsize * 0.9) if log_queue.maxsize > 0 else 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Запись уходит в поток того же процесса, поэтому готовить её к сериализации не нужно
+        return record
+
+    def enqueue(self, record):
+        try:
+            if (self._high_watermark and record.levelno < logging.WARNING
+                    and self.queue.qsize() >= self._high_watermark):
+                raise queue.Full
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._pending_dropped += 1
+            return
+        if self._pending_dropped:
+            with self._lock:
+                dropped, self._pending_dropped = self._pending_dropped, 0
+            try:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": "logging_config", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "Log queue overflow: dropped %d records", "args": (dropped,),
+                }))
+            except queue.Full:
+                with self._lock:
+                    self._pending_dropped += dropped
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Ротация по времени (when/interval) и дополнительно при превышении max_bytes"""
+
+    def __init__(self, filename, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0 and self.stream is not None:
+            self.stream.seek(0, 2)
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def rotation_filename(self, default_name):
+        # При ротации по размеру за тот же период имя архива с датой уже занято, добавляем номер
+        name = super().rotation_filename(default_name)
+        candidate, number = name, 1
+        while os.path.exists(candidate):
+            candidate = f"{name}.{number}"
+            number += 1
+        return candidate
 
-log_queue = queue.Queue(-1)
-queue_handler = logging.handlers.QueueHandler(log_queue)
+
+def _int_config(name: str, default: int) -> int:
+    return int(config.get(name) or default)
+
+
+class ForwardHandler(logging.handlers.QueueHandler):
+    """
+    Отправляет записи в очередь multiprocessing.SimpleQueue, общую с мастером gunicorn. Вызывается из потока
+    QueueListener воркера: если мастер не успевает читать, ждёт поток записи, а не код приложения.
+    """
+
+    def enqueue(self, record):
+        self.queue.put(record)
+
+
+# Один файл на роль: {role} - имя запущенной программы (gunicorn, redis_worker, backfill...).
+# Воркеры gunicorn в свои файлы не пишут: файл роли ведёт мастер (см. share_with_forked_workers)
+LOG_FILE_TEMPLATE = config.get('LOG_FILE') or 'logs/logger_app.{role}.log'
+LOG_ROLE = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+LOG_FILE = LOG_FILE_TEMPLATE.format(role=LOG_ROLE)
+LOG_QUEUE_SIZE = _int_config('LOG_QUEUE_SIZE', 10000)
+os.makedirs(os.path.dirname(LOG_FILE) or '.', exist_ok=True)
+
+log_queue = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = BoundedQueueHandler(log_queue)
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger.setLevel(config.get('LOG_LEVEL') or logging.INFO)
 logger.handlers.clear()
 logger.addHandler(queue_handler)
 
-file_handler = logging.FileHandler('logs/logger_app.log', encoding='utf-8')
+file_handler = SizedTimedRotatingFileHandler(
+    LOG_FILE,
+    max_bytes=_int_config('LOG_MAX_BYTES', 50 * 1024 * 1024),
+    when=config.get('LOG_ROTATE_WHEN') or 'midnight',
+    backupCount=_int_config('LOG_BACKUP_COUNT', 7),
+    encoding='utf-8',
+    delay=True,
+)
 formatter = MoscowFormatter('%(asctime)s - %(process)d - %(levelname)s - %(message)s', datefmt='%d.%m.%Y %H:%M:%S')
 file_handler.setFormatter(formatter)
 
 listener = logging.handlers.QueueListener(log_queue, file_handler)
-listener.start()
\ No newline at end of file
+listener.start()
+
+
+# Очередь записей воркеров gunicorn для мастера (см. share_with_forked_workers)
+shared_queue: Optional[multiprocessing.SimpleQueue] = None
+
+
+def share_with_forked_workers():
+    """
+    Вызывается в мастере gunicorn до запуска воркеров: файл роли пишет и ротирует только мастер,
+    воркеры отправляют ему записи через общую очередь (forward_to_master в post_fork).
+    Перезапущенные воркеры (max_requests) пишут в тот же файл, а не создают новые.
+    """
+    global shared_queue
+    shared_queue = multiprocessing.SimpleQueue()
+    threading.Thread(target=_receive_forwarded, args=(shared_queue,), daemon=True, name="log-receiver").start()
+
+
+def _receive_forwarded(source: multiprocessing.SimpleQueue):
+    while True:
+        # Блокирующая вставка: если файл не успевает записываться, ждут потоки пересылки воркеров,
+        # а их ограниченные очереди отбрасывают лишнее
+        log_queue.put(source.get())
+
+
+def forward_to_master():
+    """
+    Вызывается в воркере gunicorn сразу после fork. Очередь и поток записи мастера в воркер не переходят,
+    поэтому воркер заводит свою ограниченную очередь, а её поток пересылает записи мастеру.
+    """
+    global log_queue, queue_handler, listener
+    if shared_queue is None:
+        return
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    logger.removeHandler(queue_handler)
+    queue_handler = BoundedQueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, ForwardHandler(shared_queue))
+    listener.start()
@@ -1,11 +1,25 @@
 import redis
-import json
+import signal
+import socket
 import time
-from app.services.google_sheets_service import GoogleSheetsService
+from typing import Optional
+from app.health_monitor import HealthMonitor, restart_process
+from app.helpers.json_helper import loads
+from app.services.assignee_mapping import assignee_mapping
+from app.services.metrics import (
+    BATCH_SIZE, END_TO_END_LAG, LANE_DEPTH, LANE_LAG, LANE_OLDEST_AGE, QUEUE_DEPTH, QUEUE_OLDEST_AGE,
+)
+from app.services.priority_lanes import SOURCE_FIELD, PriorityLanes
+from app.services.quota_scheduler import is_quota_error
+from app.services.sheet_router import SheetRouter
+from app.services.sheet_writer_pool import SheetWriterPool
+from app.services.task_queue import RECEIVED_AT_FIELD, KeysQueue, TaskQueue, dead_letter, entry_timestamp
+from app.services.write_buffer import BufferedTask
 from app.task_dto import TaskDTO
 from config import config
 from gspread.exceptions import APIError
 from logging_config import logger
+from prometheus_client import start_http_server
 
 redis_client = redis.StrictRedis(
     host=config.get('REDIS_HOST'),
@@ -15,49 +29,352 @@ redis_client = redis.StrictRedis(
     decode_responses=True
 )
 
-# Ленивая инициализация сервиса
-gs_service = None
+# Максимальный размер пачки задач, забираемой из Redis за один раз
+QUEUE_BATCH_SIZE = int(config.get('QUEUE_BATCH_SIZE') or 500)
+
+# Имя воркера: должно быть уникальным среди реплик и не меняться при перезапуске,
+# под ним хранятся забранные, но ещё не записанные задачи
+WORKER_ID = config.get('WORKER_ID') or socket.gethostname()
+# Если воркер не продлевал аренду столько секунд, его незаписанные задачи забирают другие реплики
+WORKER_LEASE_SECONDS = int(config.get('WORKER_LEASE_SECONDS') or 300)
+
+# В режиме stream задачи читаются из Redis Stream блокирующим XREADGROUP вместо опроса KEYS
+task_queue = TaskQueue(redis_client, consumer=WORKER_ID) if config.get('QUEUE_MODE') == 'stream' else None
+keys_queue = KeysQueue(redis_client, batch_size=QUEUE_BATCH_SIZE, worker_id=WORKER_ID,
+                       lease_seconds=WORKER_LEASE_SECONDS)
+STREAM_BLOCK_MS = int(config.get('STREAM_BLOCK_MS') or 1000)
+
+# SHEETS_CLIENT=async - запись через асинхронный клиент Sheets API с пулом соединений
+ASYNC_SHEETS_CLIENT = config.get('SHEETS_CLIENT') == 'async'
+
+# Задачи распределяются по таблицам/листам по правилам routing.yaml, каждый лист пишется своим сервисом
+writer_pool = SheetWriterPool(
+    SheetRouter.from_file(config.get('SHEET_ROUTING_PATH') or 'routing.yaml'),
+    redis_client=redis_client,
+    use_async=ASYNC_SHEETS_CLIENT,
+)
+
+# Буфер отложенной записи: копит задачи и сбрасывает их в таблицу пачкой.
+# Разбит на полосы приоритета из lanes.yaml, без файла - одна полоса с порогами FLUSH_*
+write_buffer = PriorityLanes.from_file(
+    config.get('LANES_PATH') or 'lanes.yaml',
+    max_size=int(config.get('FLUSH_MAX_BATCH') or QUEUE_BATCH_SIZE),
+    debounce=float(config.get('FLUSH_DEBOUNCE_SECONDS') or 2),
+    max_latency=float(config.get('FLUSH_MAX_LATENCY_SECONDS') or 10),
+)
+# Полосы, задачи которых не поместились в буфер и остались в Redis
+overflowed_lanes: set[str] = set()
+# Листы, задачи которых остались в Redis, пока их писатель занят
+busy_targets: set = set()
+# Как часто опрашивать Redis в режиме keys
+QUEUE_POLL_INTERVAL = float(config.get('QUEUE_POLL_INTERVAL') or 1)
+# Как часто считать глубину очереди в режиме keys (проход SCAN по всей очереди)
+QUEUE_STATS_INTERVAL = float(config.get('QUEUE_STATS_INTERVAL') or 30)
+
+# Перенос завершённых задач в архивный лист (ARCHIVE_ENABLED=true), раз в ARCHIVE_INTERVAL_SECONDS
+ARCHIVE_ENABLED = (config.get('ARCHIVE_ENABLED') or '').lower() in ('1', 'true', 'yes')
+ARCHIVE_INTERVAL_SECONDS = float(config.get('ARCHIVE_INTERVAL_SECONDS') or 3600)
+
+# Задачи, отданные писателям листов и ещё не записанные: id(задачи) -> задача из буфера
+writing: dict[int, BufferedTask] = {}
+
+def classify_payload(data_json: str) -> tuple[TaskDTO, dict, str]:
+    """Разбирает задачу из очереди: (задача, payload, полоса приоритета)"""
+    data = loads(data_json)
+    task = TaskDTO.from_payload(data)
+    return task, data, write_buffer.classify(task, data.get(SOURCE_FIELD))
+
+def buffer_task(data_json: str, entry_ids: tuple = (), received_at: float = 0.0) -> bool:
+    """
+    Разбирает задачу из очереди и кладёт её в буфер её полосы приоритета.
+    Возвращает False, если полоса задачи заполнена или писатель её листа занят: задача не берётся
+    в буфер и должна остаться в Redis.
+    Задержка считается от received_at (в режиме stream - время первой неподтверждённой записи стрима),
+    иначе от отметки приёма вебхука в payload, а для payload без отметки - от момента забора из очереди.
+    """
+    task, data, lane = classify_payload(data_json)
+    if not write_buffer.has_room(lane, task.key):
+        overflowed_lanes.add(lane)
+        return False
+    if not writer_pool.accepts(task):
+        busy_targets.add(writer_pool.router.route(task))
+        return False
+    received_at = received_at or _stamp(data.get(RECEIVED_AT_FIELD)) or time.time()
+    write_buffer.add(BufferedTask(task, data_json, entry_ids, received_at, lane))
+    return True
+
+def select_with_room(items: list[tuple[str, str]]) -> list[str]:
+    """
+    Ключи задач, для полос которых в буфере есть место, а писатель листа свободен (режим keys,
+    до забора из очереди). Остальные задачи остаются в очереди и не мешают забирать задачи других полос и листов.
+    """
+    room = write_buffer.room()
+    selected = []
+    for key, data_json in items:
+        try:
+            task, _, lane = classify_payload(data_json)
+        except ValueError:
+            # Некорректную задачу забираем, чтобы убрать её из очереди
+            selected.append(key)
+            continue
+        if not writer_pool.accepts(task):
+            continue
+        if key in write_buffer:
+            selected.append(key)
+        elif room.get(lane, 0) > 0:
+            room[lane] -= 1
+            selected.append(key)
+        else:
+            overflowed_lanes.add(lane)
+    return selected
+
+def _stamp(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def flush_full_lanes():
+    """Сбрасывает все полосы, набравшие полную пачку, - не только самую срочную из них"""
+    for lane in write_buffer.full_lanes():
+        flush_buffer("size", lane)
+
+def collect_keys_queue():
+    # Задачи заполненных полос не забираются: они ждут в Redis, а не в памяти воркера
+    for claimed in keys_queue.drain(room=write_buffer.free_slots, select=select_with_room):
+        malformed = []
+        overflow = []
+        for key, data_json in claimed:
+            try:
+                if not buffer_task(data_json):
+                    # Между чтением и забором задача обновилась или её полоса/писатель листа заполнились
+                    overflow.append((key, data_json))
+            except ValueError as e:
+                logger.error(f"{key} | Skipping malformed task payload: {e}")
+                malformed.append((key, data_json))
+        keys_queue.ack(malformed)
+        keys_queue.requeue(overflow)
+        # Большую очередь сбрасываем по мере чтения, чтобы не держать её целиком в памяти
+        flush_full_lanes()
+
+def collect_stream_queue(block_ms: int):
+    free_slots = write_buffer.free_slots()
+    if free_slots == 0:
+        # Все полосы полны и ждут записи: новые записи стрима не читаем, они ждут в Redis
+        time.sleep(block_ms / 1000)
+        return
+    entries = task_queue.read(count=free_slots, block_ms=block_ms)
+    if writing or len(write_buffer):
+        # Перечитанные неподтверждённые записи задач, которые уже в буфере или пишутся, второй раз не берём
+        taken = {entry_id for item in [*writing.values(), *write_buffer.items()] for entry_id in item.entry_ids}
+        entries = [(entry_id, task_key) for entry_id, task_key in entries if entry_id not in taken]
+    if not entries:
+        return
 
-def get_gs_service():
-    global gs_service
-    if gs_service is None:
-        gs_service = GoogleSheetsService()
-    return gs_service
+    entry_ids = {}
+    for entry_id, task_key in entries:
+        entry_ids.setdefault(task_key, []).append(entry_id)
+    # Если состояния задачи нет в хэше, значит оно уже записано при обработке более ранней записи
+    payloads = task_queue.fetch_payloads([task_key for task_key in entry_ids if task_key])
+
+    done_ids = []
+    malformed = {}
+    for task_key, ids in entry_ids.items():
+        data_json = payloads.get(task_key)
+        if data_json is None:
+            done_ids.extend(ids)
+            continue
+        try:
+            # Записи задачи заполненной полосы или занятого листа остаются неподтверждёнными: они перечитываются,
+            # когда место освободится (retry_pending), или их заберёт XAUTOCLAIM реплики, у которой есть место
+            buffer_task(data_json, tuple(ids), min(entry_timestamp(entry_id) for entry_id in ids))
+        except ValueError as e:
+            logger.error(f"{task_key} | Skipping malformed task payload: {e}")
+            done_ids.extend(ids)
+            malformed[task_key] = data_json
+    task_queue.ack(done_ids, malformed)
+    flush_full_lanes()
+
+def flush_buffer(reason: str, lane: Optional[str] = None):
+    """
+    Отдаёт задачи полосы lane (без неё - всех полос) писателям их листов, не дожидаясь записи:
+    подтверждаются задачи в handle_written(), отдельно по каждому листу
+    """
+    items = write_buffer.drain(lane)
+    release_overflow(lane)
+    if not items:
+        return
+    logger.info(f"Processing {len(items)} tasks from Redis queue (flush: {reason}, lane: {lane or 'all'})")
+    BATCH_SIZE.observe(len(items))
+    for item in items:
+        writing[id(item.task)] = item
+    try:
+        result = writer_pool.submit([item.task for item in items])
+    except Exception:
+        for item in items:
+            writing.pop(id(item.task), None)
+        requeue_failed(items)
+        raise
+    busy = [writing.pop(id(task)) for task in result.busy]
+    unrouted = [writing.pop(id(task)) for task in result.unrouted]
+    if busy:
+        # Писатель листа занят прошлыми пачками или после ошибки: задачи ждут его в Redis, а не в памяти
+        logger.info(f"Sheet writers are busy, returning {len(busy)} tasks to the queue")
+        busy_targets.update(writer_pool.router.route(item.task) for item in busy)
+        if task_queue is None:
+            keys_queue.requeue([(item.task.key, item.payload) for item in busy])
+    if unrouted:
+        # Задачи без маршрута откладываем и подтверждаем: повторная запись без правки routing.yaml не поможет
+        dead_letter(redis_client, [(item.task.key, item.payload) for item in unrouted])
+        ack_items(unrouted)
+
+def handle_written():
+    """Подтверждает задачи листов, запись в которые завершилась, и возвращает в очередь незаписанные"""
+    for result in writer_pool.completed():
+        items = [writing.pop(id(task)) for task in result.tasks]
+        if result.error is not None:
+            requeue_failed(items)
+            continue
+        ack_items(items)
+        written_at = time.time()
+        for item in items:
+            END_TO_END_LAG.observe(max(0.0, written_at - item.received_at))
+            LANE_LAG.labels(item.lane).observe(max(0.0, written_at - item.received_at))
+        logger.info(f"Successfully processed {len(items)} tasks to {result.target.name}")
+    # Писатели освободились: перечитываем задачи, оставленные для них в Redis
+    released = {target for target in busy_targets if writer_pool.has_room(target)}
+    if released:
+        busy_targets.difference_update(released)
+        if task_queue is not None:
+            task_queue.retry_pending()
+
+def ack_items(items):
+    """Подтверждает записанные (или отложенные) задачи в очереди"""
+    if task_queue is not None:
+        task_queue.ack(
+            [entry_id for item in items for entry_id in item.entry_ids],
+            {item.task.key: item.payload for item in items},
+        )
+    else:
+        keys_queue.ack([(item.task.key, item.payload) for item in items])
+
+def release_overflow(lane: Optional[str]):
+    """
+    В полосе освободилось место: в режиме stream перечитываем свои неподтверждённые записи,
+    среди них записи задач, не поместившихся в полосу (в режиме keys такие задачи и так в очереди)
+    """
+    released = set(overflowed_lanes) if lane is None else overflowed_lanes & {lane}
+    if not released:
+        return
+    overflowed_lanes.difference_update(released)
+    if task_queue is not None:
+        task_queue.retry_pending()
+
+_keys_stats = (0, None)
+_keys_stats_at: Optional[float] = None
+
+def update_queue_metrics():
+    global _keys_stats, _keys_stats_at
+    QUEUE_DEPTH.labels("buffer").set(len(write_buffer))
+    now = time.time()
+    for lane, depth in write_buffer.depths().items():
+        LANE_DEPTH.labels(lane).set(depth)
+        lane_oldest = write_buffer.oldest_received_at(lane)
+        LANE_OLDEST_AGE.labels(lane).set(max(0.0, now - lane_oldest) if lane_oldest is not None else 0)
+    oldest = write_buffer.oldest_received_at()
+    if task_queue is not None:
+        depth, redis_oldest = task_queue.stats()
+    else:
+        # Очередь ключей считается проходом SCAN (вместе с журналами воркеров), поэтому не чаще QUEUE_STATS_INTERVAL
+        if _keys_stats_at is None or time.monotonic() - _keys_stats_at >= QUEUE_STATS_INTERVAL:
+            _keys_stats = keys_queue.stats()
+            _keys_stats_at = time.monotonic()
+        depth, redis_oldest = _keys_stats
+    QUEUE_DEPTH.labels("redis").set(depth)
+    if redis_oldest is not None:
+        oldest = redis_oldest if oldest is None else min(oldest, redis_oldest)
+    QUEUE_OLDEST_AGE.set(max(0.0, time.time() - oldest) if oldest is not None else 0)
+
+def requeue_failed(items):
+    if not items:
+        return
+    if task_queue is not None:
+        task_queue.retry_pending()
+    else:
+        # Возвращаем в очередь задачи листов, запись в которые не удалась
+        keys_queue.requeue([(item.task.key, item.payload) for item in items])
+
+def keep_lease():
+    """
+    Продлевает аренду воркера. В режиме stream аренды нет: сбрасывается время простоя записей,
+    лежащих в буфере и записываемых сейчас, чтобы их не забрали другие реплики.
+    """
+    if task_queue is not None:
+        entry_ids = [entry_id for item in [*writing.values(), *write_buffer.items()] for entry_id in item.entry_ids]
+        task_queue.touch(entry_ids)
+    else:
+        keys_queue.heartbeat()
+
+def reclaim_dead_workers(startup: bool = False):
+    """Возвращает в работу задачи воркеров, не продлевавших аренду (упали, убиты по памяти)"""
+    if task_queue is not None:
+        task_queue.reclaim(min_idle_ms=WORKER_LEASE_SECONDS * 1000)
+    else:
+        # При запуске свой журнал тоже возвращается в очередь: он остался от предыдущего процесса
+        keys_queue.reclaim(own=startup)
+    keep_lease()
+
+def wait_seconds(idle: float) -> float:
+    """Сколько ждать новых задач: не дольше, чем до сброса буфера"""
+    until_flush = write_buffer.time_until_flush()
+    return idle if until_flush is None else min(idle, until_flush)
 
 def process_queue():
+    stream_mode = task_queue is not None
+    reclaim_dead_workers(startup=True)
+    reclaimed_at = time.monotonic()
+    archived_at = time.monotonic()
     while True:
         try:
-            keys = redis_client.keys()
-            if keys:
-                service = get_gs_service()
-                tasks = []
-                for key in keys:
-                    # Получаем данные из Redis и сразу удаляем, что бы избежать потери данных
-                    data_json = redis_client.get(key)
-                    redis_client.delete(key)
-                    # TODO сделать валидатор
-                    if data_json:
-                        data = json.loads(data_json)
-                        task = TaskDTO(**data)
-                        tasks.append(task)
-                
-                if tasks:
-                    logger.info(f"Processing {len(tasks)} tasks from Redis queue")
-                    service.store_tasks_batch(tasks)
-                    logger.info(f"Successfully processed {len(tasks)} tasks")
-            
-            time.sleep(30)  # Пауза между итерациями увеличена до 30 секунд
-            
-        except APIError as e:
-            if "429" in str(e) or "Quota exceeded" in str(e):
-                logger.warning(f"API quota exceeded, waiting 60 seconds before retry: {e}")
-                time.sleep(60)  # Ждем 60 секунд при превышении квоты
+            if time.monotonic() - reclaimed_at > WORKER_LEASE_SECONDS / 3:
+                reclaim_dead_workers()
+                reclaimed_at = time.monotonic()
+            # mapping.yaml перечитывается только если файл изменился
+            assignee_mapping.refresh()
+            update_queue_metrics()
+            handle_written()
+            if ARCHIVE_ENABLED and time.monotonic() - archived_at > ARCHIVE_INTERVAL_SECONDS:
+                # Перенос идёт в потоке записи каждого листа между его пачками, номера строк можно сдвигать
+                archived_at = time.monotonic()
+                writer_pool.archive_completed()
+            # Полосы проверяются по срочности: сначала сбрасывается самая срочная из готовых
+            ready = write_buffer.flush_reason()
+            if ready:
+                flush_buffer(ready[1], ready[0])
+            elif stream_mode:
+                # block=0 в XREADGROUP означает ждать бесконечно, поэтому минимум 1 мс
+                collect_stream_queue(max(1, int(wait_seconds(STREAM_BLOCK_MS / 1000) * 1000)))
             else:
+                collect_keys_queue()
+                if not write_buffer.flush_reason():
+                    time.sleep(wait_seconds(QUEUE_POLL_INTERVAL))
+
+        except Exception as e:
+            if is_quota_error(e):
+                # Паузу до Retry-After выдерживает планировщик квоты, следующие запросы будут ждать слота
+                logger.warning(f"API quota exceeded, retrying when the quota scheduler allows: {e}")
+            elif isinstance(e, APIError):
                 logger.error(f"Google Sheets API error: {e}")
                 time.sleep(30)
-        except Exception as e:
-            logger.error(f"Unexpected error in process_queue: {e}")
-            time.sleep(30)
+            else:
+                logger.error(f"Unexpected error in process_queue: {e}")
+                time.sleep(30)
 
 if __name__ == '__main__':
+    signal.signal(signal.SIGHUP, lambda signum, frame: assignee_mapping.request_reload())
+    # Метрики воркера для Prometheus на отдельном порту
+    start_http_server(int(config.get('WORKER_METRICS_PORT') or 5678))
+    # RSS воркера отслеживается всегда: монитор веб-приложения не видит процессы другого контейнера.
+    # Рост аллокаций (tracemalloc) - только при HEALTH_TRACEMALLOC=true
+    HealthMonitor(discover=False, role='worker', restart_callback=restart_process).start_monitoring()
     process_queue()
\ No newline at end of file
@@ -0,0 +1,53 @@
+import fakeredis
+import gspread
+import pytest
+
+from app.enums.column_enum import ColumnEnum
+from app.task_dto import TaskDTO
+from benchmarks.fake_sheets import FakeClient, FakeSpreadsheet, FakeWorksheet
+from config import config
+
+HEADER = [column.value for column in ColumnEnum]
+
+# Планировщик квоты не должен ограничивать фейковый лист
+SHEETS_CONFIG = {
+    "GOOGLE_SHEET_KEY": "fake-key",
+    "GOOGLE_SHEET_WORKSHEET": "Tasks",
+    "SHEETS_READ_QUOTA_PER_MINUTE": "1000000",
+    "SHEETS_WRITE_QUOTA_PER_MINUTE": "1000000",
+}
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+@pytest.fixture
+def make_task():
+    def make(key: str, **fields) -> TaskDTO:
+        payload = {"key": key, "summary": "Task", "type": "Task", "status": "Open", "sprint": ""}
+        payload.update(fields)
+        return TaskDTO.from_payload(payload)
+    return make
+
+
+@pytest.fixture
+def worksheet(monkeypatch) -> FakeWorksheet:
+    """Рабочий лист в памяти со строкой заголовков, gspread открывает его вместо таблицы"""
+    worksheet = FakeWorksheet([list(HEADER)])
+    spreadsheet = FakeSpreadsheet(worksheet)
+    monkeypatch.setattr(gspread, "service_account", lambda filename=None: FakeClient(spreadsheet))
+    return worksheet
+
+
+@pytest.fixture
+def make_service(worksheet, redis_client, monkeypatch):
+    """GoogleSheetsService над листом worksheet; настройки - переменные .env поверх SHEETS_CONFIG"""
+    from app.services.google_sheets_service import GoogleSheetsService
+
+    def make(**settings):
+        for name, value in {**SHEETS_CONFIG, **settings}.items():
+            monkeypatch.setitem(config, name, value)
+        return GoogleSheetsService(redis_client)
+    return make
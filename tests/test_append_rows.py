@@ -0,0 +1,43 @@
+import pytest
+
+from app.helpers.string_helper import extract_task_key
+
+MANUAL_ROW = ['', 'Иванов — manual row']
+
+MODES = [
+    {},
+    {"ROW_INDEX_ENABLED": "true"},
+    {"SHEET_BATCH_COMMIT": "true"},
+    {"SHEET_MIRROR_ENABLED": "true"},
+]
+
+
+def add_manual_rows(worksheet, *rows):
+    worksheet.rows.extend(list(row) for row in rows)
+    # Правка вручную меняет версию документа, как и любая запись
+    worksheet.backend.version += 1
+
+
+@pytest.mark.parametrize("settings", MODES)
+def test_new_task_does_not_overwrite_manual_row(settings, make_service, worksheet, make_task):
+    service = make_service(**settings)
+    service.store_tasks_batch([make_task("TEST-1")])
+    # Строку без ключа в первом столбце добавили вручную, кэш ключей и индекс строк о ней не знают
+    add_manual_rows(worksheet, MANUAL_ROW)
+
+    service.store_tasks_batch([make_task("TEST-2"), make_task("TEST-3")])
+
+    assert worksheet.rows[2] == MANUAL_ROW
+    assert [extract_task_key(row[0]) for row in worksheet.rows[3:]] == ["TEST-2", "TEST-3"]
+
+
+@pytest.mark.parametrize("settings", MODES)
+def test_single_task_does_not_overwrite_manual_row(settings, make_service, worksheet, make_task):
+    service = make_service(**settings)
+    service.store_tasks_batch([make_task("TEST-1")])
+    add_manual_rows(worksheet, MANUAL_ROW, ['', '', 'ещё одна'])
+
+    service.store_task(make_task("TEST-2"))
+
+    assert worksheet.rows[2] == MANUAL_ROW
+    assert extract_task_key(worksheet.rows[4][0]) == "TEST-2"
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import re
+from urllib.parse import unquote
+
+import httpx
+
+from app.enums.column_enum import ColumnEnum
+from app.services import async_google_sheets_service
+from app.services.async_google_sheets_service import AsyncGoogleSheetsService
+from app.services.base_sheets_service import GRID_HEADROOM
+
+TITLE = "Команда #1"
+
+
+class FakeSheetsAPI:
+    """Лист в памяти за Sheets REST API: строки по номеру, размер сетки, пути запросов"""
+
+    def __init__(self, rows: dict[int, list], grid_rows: int):
+        self.rows = rows
+        self.grid_rows = grid_rows
+        self.paths = []
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.raw_path.decode().split("?")[0].split("/fake-key", 1)[1]
+        self.paths.append(path)
+        if path == "":
+            return httpx.Response(200, json={"sheets": [{"properties": {
+                "sheetId": 7, "title": TITLE, "gridProperties": {"rowCount": self.grid_rows}}}]})
+        if path.startswith("/values/"):
+            range_a1 = unquote(path[len("/values/"):])
+            assert range_a1.startswith(f"'{TITLE}'!")
+            if range_a1.endswith("1:1"):
+                return httpx.Response(200, json={"values": [self.rows[1]]})
+            last = max(row for row, values in self.rows.items() if values and values[0])
+            return httpx.Response(200, json={"values": [self.rows.get(row, [])[:1] for row in range(1, last + 1)]})
+        if path == "/values:batchGet":
+            value_ranges = []
+            for range_a1 in request.url.params.get_list("ranges"):
+                first, last = map(int, re.findall(r"[A-Z]+(\d+)", range_a1.split("!")[1]))
+                value_ranges.append({"values": [self.rows.get(row, []) for row in range(first, last + 1)]})
+            return httpx.Response(200, json={"valueRanges": value_ranges})
+        body = json.loads(request.content)
+        if path == ":batchUpdate":
+            self.grid_rows += body["requests"][0]["appendDimension"]["length"]
+            return httpx.Response(200, json={})
+        for data in body["data"]:
+            row = int(re.search(r"![A-Z]+(\d+)", data["range"]).group(1))
+            if row > self.grid_rows:
+                return httpx.Response(400, json={"error": "exceeds grid limits"})
+            self.rows[row] = data["values"][0]
+        return httpx.Response(200, json={})
+
+
+def make_service(api: FakeSheetsAPI, monkeypatch) -> AsyncGoogleSheetsService:
+    monkeypatch.setattr(async_google_sheets_service.Credentials, "from_service_account_file",
+                        lambda *args, **kwargs: None)
+    client = httpx.AsyncClient(transport=httpx.MockTransport(api.handle))
+    service = AsyncGoogleSheetsService("fake-key", TITLE, client=client)
+
+    async def token():
+        return "token"
+    monkeypatch.setattr(service, "_get_token", token)
+    return service
+
+
+def test_new_rows_skip_rows_taken_by_other_writers_and_grow_grid(monkeypatch, make_task):
+    header = [column.value for column in ColumnEnum]
+    # Строка 3 занята, но первый столбец у неё пустой: чтение A:A её не видит
+    api = FakeSheetsAPI({1: header, 2: ["=HYPERLINK(\"u\"; \"TEST-1: Task\")"], 3: ["", "Иванов"]}, grid_rows=3)
+    service = make_service(api, monkeypatch)
+
+    asyncio.run(service.store_tasks_batch([make_task("TEST-2")]))
+
+    assert api.rows[3] == ["", "Иванов"]
+    assert api.rows[4][0].startswith('=HYPERLINK("https://tracker.yandex.ru/TEST-2";')
+    assert api.grid_rows == 4 + GRID_HEADROOM
+    assert f"/values/{TITLE}" not in "".join(api.paths)
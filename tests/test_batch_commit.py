@@ -0,0 +1,74 @@
+import pytest
+
+from app.enums.column_enum import ColumnEnum
+from app.helpers.string_helper import extract_task_key
+from app.services.base_sheets_service import BaseSheetsService
+from app.services.batch_commit import BatchCommit, to_cell_data
+
+
+def make_base_service(locale: str) -> BaseSheetsService:
+    service = BaseSheetsService(diff_writes=True)
+    service.header = [column.value for column in ColumnEnum]
+    service.locale = locale
+    return service
+
+
+def cell_value(cell: dict):
+    """Значение ячейки так, как его вернёт чтение с FORMULA"""
+    value = cell.get("userEnteredValue")
+    if value is None:
+        return ""
+    (value,) = value.values()
+    return value
+
+
+@pytest.mark.parametrize("locale", ["ru_RU", "en_US"])
+def test_batch_commit_writes_the_same_cells_as_user_entered(locale, make_task):
+    service = make_base_service(locale)
+    values = service.mapping(make_task("TEST-1", priority="2", dueDate="2024-05-20",
+                                       stageDeadline="2024-05-17T18:00:00"))
+    values[service._get_layout().columns[ColumnEnum.comment]] = "3"
+    commit = BatchCommit(0, 1000, service._date_columns(), locale)
+
+    # С USER_ENTERED Sheets разбирает строки сам, typed_row - то, что вернёт чтение записанной строки
+    user_entered = ["" if value is None else value for value in commit.typed_row(values)]
+    batch = [cell_value(to_cell_data(value, col in commit.date_columns, locale))
+             for col, value in enumerate(values)]
+
+    assert batch == user_entered
+    columns = service._get_layout().columns
+    assert user_entered[columns[ColumnEnum.priority]] == 2
+    assert user_entered[columns[ColumnEnum.stage_deadline]] == 45429.75
+    assert user_entered[columns[ColumnEnum.due_date]] == 45432
+
+
+@pytest.mark.parametrize("locale, formula", [
+    ("ru_RU", '=HYPERLINK("https://tracker.yandex.ru/TEST-1"; "TEST-1: Task")'),
+    ("en_US", '=HYPERLINK("https://tracker.yandex.ru/TEST-1", "TEST-1: Task")'),
+])
+def test_hyperlink_uses_sheet_locale_separator(locale, formula, make_task):
+    hyperlink = make_base_service(locale).mapping(make_task("TEST-1"))[0]
+
+    assert hyperlink == formula
+    assert extract_task_key(hyperlink) == "TEST-1"
+
+
+def test_decimal_numbers_follow_sheet_locale():
+    assert cell_value(to_cell_data("1,5", locale="ru_RU")) == 1.5
+    assert cell_value(to_cell_data("1.5", locale="en_US")) == 1.5
+    assert cell_value(to_cell_data("1.5", locale="ru_RU")) == "1.5"
+
+
+def test_batch_is_written_in_one_request_and_grows_the_grid(make_service, worksheet, make_task):
+    worksheet.grid_rows = 2
+    service = make_service(SHEET_BATCH_COMMIT="true", SHEET_DIFF_WRITES="true")
+    service.store_tasks_batch([make_task("TEST-1")])
+    worksheet.backend.reset()
+
+    service.store_tasks_batch([make_task("TEST-1", status="Closed"), make_task("TEST-2"), make_task("TEST-3")])
+
+    assert worksheet.backend.calls.get("spreadsheet_batch_update") == 1
+    assert "update" not in worksheet.backend.calls and "batch_update" not in worksheet.backend.calls
+    assert [extract_task_key(row[0]) for row in worksheet.rows[1:]] == ["TEST-1", "TEST-2", "TEST-3"]
+    assert worksheet.rows[1][service._get_layout().columns[ColumnEnum.status]] == "Closed"
+    assert worksheet.grid_rows >= 4
@@ -0,0 +1,58 @@
+import pytest
+
+from app.services.bulk_ingest import PayloadStreamParser
+
+
+def parse(*chunks: bytes, max_item_size: int = 1024) -> list:
+    parser = PayloadStreamParser(max_item_size=max_item_size)
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items + parser.close()
+
+
+def errors(items: list) -> list[str]:
+    return [str(value) for _, value in items if isinstance(value, ValueError)]
+
+
+def test_array_split_across_chunks():
+    items = parse(b'[{"key": "TEST-1"}, {"ke', b'y": "TEST-2"}', b'] \n')
+    assert items == [(0, {"key": "TEST-1"}), (1, {"key": "TEST-2"})]
+
+
+def test_multibyte_character_split_across_chunks():
+    body = '[{"summary": "Задача"}]'.encode()
+    items = parse(body[:15], body[15:])
+    assert items == [(0, {"summary": "Задача"})]
+
+
+def test_ndjson_lines():
+    items = parse(b'{"key": "TEST-1"}\n\n{"key": "TEST-2"', b'}\nnot json\n')
+    assert items[:2] == [(0, {"key": "TEST-1"}), (1, {"key": "TEST-2"})]
+    assert errors(items) == [str(items[2][1])] and items[2][0] == 2
+
+
+def test_empty_array():
+    assert parse(b" [ ] ") == []
+
+
+@pytest.mark.parametrize("tail", [b"x", b", {}", b"[]", b"]"])
+def test_data_after_array_is_rejected(tail):
+    items = parse(b'[{"key": "TEST-1"}]', b" " + tail)
+    assert items[0] == (0, {"key": "TEST-1"})
+    assert errors(items) == ["Unexpected data after JSON array"]
+
+
+def test_unterminated_array_is_rejected():
+    assert errors(parse(b'[{"key": "TEST-1"}')) == ["Unexpected end of JSON array"]
+
+
+def test_missing_comma_stops_parsing():
+    items = parse(b'[{"key": "TEST-1"} {"key": "TEST-2"}]')
+    assert items[0] == (0, {"key": "TEST-1"})
+    assert errors(items) == ["Expected ',' or ']' at item 1"]
+
+
+def test_oversized_item_is_rejected():
+    items = parse(b'[{"summary": "' + b"x" * 2048, b'"}]', max_item_size=1024)
+    assert len(items) == 1 and isinstance(items[0][1], ValueError)
@@ -0,0 +1,85 @@
+from app.services.priority_lanes import Lane, PriorityLanes
+from app.services.write_buffer import BufferedTask, WriteBehindBuffer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_lanes(clock: Clock, low_rate=None) -> PriorityLanes:
+    def buffer(max_size: int) -> WriteBehindBuffer:
+        return WriteBehindBuffer(max_size=max_size, debounce=1, max_latency=5, clock=clock)
+
+    return PriorityLanes([
+        Lane("high", buffer(2), priorities=["Блокер"], clock=clock),
+        Lane("normal", buffer(2), clock=clock),
+        Lane("low", buffer(2), rate_per_minute=low_rate, sources=["bulk"], max_buffered=3, clock=clock),
+    ], "normal")
+
+
+def item(make_task, key: str, lane: str, received_at: float = 0.0, **fields) -> BufferedTask:
+    return BufferedTask(make_task(key, **fields), "{}", (), received_at, lane)
+
+
+def test_tasks_are_classified_by_rules(make_task):
+    lanes = make_lanes(Clock())
+
+    assert lanes.classify(make_task("TEST-1", priority="Блокер")) == "high"
+    assert lanes.classify(make_task("TEST-2"), source="bulk") == "low"
+    assert lanes.classify(make_task("TEST-3")) == "normal"
+
+
+def test_full_lane_keeps_room_in_other_lanes(make_task):
+    lanes = make_lanes(Clock())
+    for number in range(3):
+        lanes.add(item(make_task, f"TEST-{number}", "low"))
+
+    assert not lanes.has_room("low", "TEST-9")
+    # Обновление уже ждущей задачи места не занимает
+    assert lanes.has_room("low", "TEST-1")
+    assert lanes.has_room("high", "TEST-9")
+    assert lanes.free_slots() == 4
+
+
+def test_all_full_lanes_are_flushed_in_urgency_order(make_task):
+    lanes = make_lanes(Clock())
+    for number in range(2):
+        lanes.add(item(make_task, f"TEST-1{number}", "normal"))
+        lanes.add(item(make_task, f"TEST-2{number}", "high"))
+
+    assert lanes.full_lanes() == ["high", "normal"]
+    assert lanes.flush_reason() == ("high", "size")
+    assert [queued.task.key for queued in lanes.drain("high")] == ["TEST-20", "TEST-21"]
+    assert lanes.full_lanes() == ["normal"]
+
+
+def test_task_moving_between_lanes_is_coalesced_into_more_urgent(make_task):
+    lanes = make_lanes(Clock())
+    lanes.add(item(make_task, "TEST-1", "high", received_at=10.0))
+    lanes.add(item(make_task, "TEST-1", "normal", received_at=20.0, summary="Renamed"))
+
+    assert lanes.depths() == {"high": 1, "normal": 0, "low": 0}
+    queued = lanes.drain("high")[0]
+    assert queued.task.summary == "Renamed"
+    assert queued.received_at == 10.0
+
+
+def test_rate_limited_lane_waits_for_full_batch_of_tokens(make_task):
+    clock = Clock()
+    lanes = make_lanes(clock, low_rate=6)
+    for number in range(3):
+        lanes.add(item(make_task, f"TEST-{number}", "low"))
+
+    assert len(lanes.drain("low")) == 2
+    # Токен на оставшуюся задачу накопится только через 10 секунд, хотя дедлайн буфера уже наступил
+    clock.now = 5
+    assert lanes.flush_reason() is None
+    assert lanes.time_until_flush() == 5.0
+
+    clock.now = 10
+    assert lanes.flush_reason() == ("low", "deadline")
+    assert len(lanes.drain("low")) == 1
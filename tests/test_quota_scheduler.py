@@ -0,0 +1,79 @@
+import time
+import uuid
+
+import pytest
+
+from app.services.quota_scheduler import READ, WRITE, QuotaScheduler
+
+
+@pytest.fixture(params=["redis", "local"])
+def make_scheduler(request, redis_client):
+    """Планировщики с общим namespace: на бакетах в Redis или в памяти процесса"""
+    namespace = uuid.uuid4().hex
+    client = redis_client if request.param == "redis" else None
+
+    def make(per_minute: int = 3, tenant=None) -> QuotaScheduler:
+        return QuotaScheduler(client, namespace, read_per_minute=per_minute, write_per_minute=per_minute,
+                              tenant=tenant)
+    return make
+
+
+def refill(scheduler: QuotaScheduler, kind: str, tokens: int):
+    if scheduler.redis is not None:
+        scheduler.redis.hset(scheduler._keys(kind)[0], "tokens", tokens)
+    else:
+        scheduler._local_bucket(kind).tokens = tokens
+
+
+def test_bucket_allows_burst_up_to_limit_then_waits(make_scheduler):
+    scheduler = make_scheduler(per_minute=3)
+
+    assert [scheduler.reserve(READ) for _ in range(3)] == [0, 0, 0]
+    # Следующий токен - через минуту / 3
+    assert 19 < scheduler.reserve(READ) <= 20
+    assert scheduler.reserve(WRITE) == 0
+
+
+def test_schedulers_of_one_namespace_share_the_bucket(make_scheduler):
+    first, second = make_scheduler(per_minute=2), make_scheduler(per_minute=2)
+
+    assert first.reserve(WRITE) == 0
+    assert second.reserve(WRITE) == 0
+    assert first.reserve(WRITE) > 0
+
+
+def test_throttled_response_blocks_for_retry_after(make_scheduler):
+    scheduler = make_scheduler(per_minute=60)
+
+    scheduler.report_throttled(WRITE, retry_after=5)
+
+    assert 4 < scheduler.reserve(WRITE) <= 5
+    assert scheduler.reserve(READ) == 0
+
+
+def test_throttled_response_halves_the_rate(make_scheduler):
+    scheduler = make_scheduler(per_minute=60)
+
+    scheduler.report_throttled(WRITE, retry_after=0.001)
+    scheduler.report_throttled(WRITE, retry_after=0.001)
+    time.sleep(0.01)
+    refill(scheduler, WRITE, 0)
+
+    # Полная скорость - токен в секунду, после двух 429 - в четыре
+    assert 3 < scheduler.reserve(WRITE) <= 4
+
+
+def test_waiting_tenants_get_slots_in_turn(make_scheduler):
+    first, second = make_scheduler(per_minute=1, tenant="first"), make_scheduler(per_minute=1, tenant="second")
+    assert first.reserve(WRITE) == 0
+    assert first.reserve(WRITE) > 0
+    assert second.reserve(WRITE) > 0
+
+    refill(first, WRITE, 1)
+    # Слот достаётся голове очереди, второй лист не забирает его вне очереди
+    assert second.reserve(WRITE) > 0
+    assert first.reserve(WRITE) == 0
+
+    refill(first, WRITE, 1)
+    assert first.reserve(WRITE) > 0
+    assert second.reserve(WRITE) == 0
@@ -0,0 +1,20 @@
+from app.helpers.cell_helper import typed_row
+from app.helpers.list_helper import changed_ranges
+
+# Колонки дат в строке теста: срок этапа и дедлайн
+DATE_COLUMNS = (1, 2)
+
+
+def test_dates_read_back_as_serials_are_unchanged():
+    # Так строку вернёт чтение с FORMULA: даты, записанные с USER_ENTERED, приходят серийными числами
+    old_values = ["TEST-1: Task", 45429.75, 45432, "Open"]
+    values = ["TEST-1: Task", "2024-05-17T18:00:00", "2024-05-20", "Open"]
+
+    assert changed_ranges(typed_row(old_values, DATE_COLUMNS), typed_row(values, DATE_COLUMNS)) == []
+
+
+def test_changed_date_is_detected():
+    old_values = ["TEST-1: Task", 45429, 45432, "Open"]
+    values = ["TEST-1: Task", "2024-05-17", "2024-05-21", "Open"]
+
+    assert changed_ranges(typed_row(old_values, DATE_COLUMNS), typed_row(values, DATE_COLUMNS)) == [(2, [45433])]
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from app.services.sheet_lock import SheetLock, SheetLockTimeout
+
+
+def test_lock_is_reentrant_in_one_thread(redis_client):
+    lock = SheetLock(redis_client, "sheet", "Tasks", ttl=5, wait=0)
+
+    with lock:
+        with lock:
+            assert redis_client.exists(lock.key)
+        # Внутренний выход не снимает блокировку, взятую снаружи
+        assert redis_client.exists(lock.key)
+
+    assert not redis_client.exists(lock.key)
+
+
+def test_lock_is_exclusive_between_owners(redis_client):
+    first = SheetLock(redis_client, "sheet", "Tasks", ttl=5, wait=0)
+    second = SheetLock(redis_client, "sheet", "Tasks", ttl=5, wait=0)
+    other_sheet = SheetLock(redis_client, "sheet", "Archive", ttl=5, wait=0)
+
+    with first:
+        assert not second.acquire()
+        with pytest.raises(SheetLockTimeout):
+            with second:
+                pass
+        assert other_sheet.acquire()
+        other_sheet.release()
+
+    assert second.acquire()
+    second.release()
+
+
+def test_lock_is_not_reentrant_across_threads(redis_client):
+    lock = SheetLock(redis_client, "sheet", "Tasks", ttl=5, wait=0)
+    acquired = []
+
+    with lock:
+        thread = threading.Thread(target=lambda: acquired.append(lock.acquire()))
+        thread.start()
+        thread.join()
+
+    assert acquired == [False]
+
+
+def test_held_lock_is_kept_alive_past_ttl(redis_client):
+    lock = SheetLock(redis_client, "sheet", "Tasks", ttl=0.3, wait=0)
+    other = SheetLock(redis_client, "sheet", "Tasks", ttl=0.3, wait=0)
+
+    with lock:
+        time.sleep(0.8)
+        assert not other.acquire()
+
+    assert other.acquire()
+    other.release()
+
+
+def test_release_does_not_drop_lock_taken_over_after_expiry(redis_client):
+    lock = SheetLock(redis_client, "sheet", "Tasks", ttl=5, wait=0)
+    assert lock.acquire()
+    # Блокировка истекла (процесс завис дольше ttl), её взял другой владелец
+    redis_client.set(lock.key, "other-owner")
+
+    lock.release()
+
+    assert redis_client.get(lock.key) == "other-owner"
@@ -0,0 +1,33 @@
+from datetime import date
+
+import pytest
+
+from app.helpers.string_helper import sprint_dates
+from app.services.base_sheets_service import BaseSheetsService
+
+NEW_YEAR_SPRINT = "Спринт 52 (25.12 – 07.01)"
+
+
+def test_sprint_crossing_new_year_ends_next_year():
+    assert sprint_dates(NEW_YEAR_SPRINT, 2025) == (date(2025, 12, 25), date(2026, 1, 7))
+
+
+@pytest.mark.parametrize("today", [date(2025, 12, 25), date(2025, 12, 31), date(2026, 1, 1), date(2026, 1, 7)])
+def test_new_year_sprint_is_current_on_both_sides_of_new_year(today):
+    assert BaseSheetsService.is_current_date_in_sprint(NEW_YEAR_SPRINT, today)
+
+
+@pytest.mark.parametrize("today", [date(2025, 12, 24), date(2026, 1, 8), date(2026, 12, 1)])
+def test_new_year_sprint_is_not_current_outside_its_window(today):
+    assert not BaseSheetsService.is_current_date_in_sprint(NEW_YEAR_SPRINT, today)
+
+
+def test_sprint_within_one_year():
+    sprint = "Спринт 42 (01.10 – 14.10)"
+    assert BaseSheetsService.is_current_date_in_sprint(sprint, date(2026, 10, 14))
+    assert not BaseSheetsService.is_current_date_in_sprint(sprint, date(2026, 10, 15))
+
+
+@pytest.mark.parametrize("sprint", [None, "", "Без спринта", "Спринт 9 (31.02 – 14.03)"])
+def test_missing_or_invalid_sprint_is_not_current(sprint):
+    assert not BaseSheetsService.is_current_date_in_sprint(sprint, date(2026, 3, 1))
@@ -0,0 +1,66 @@
+import pytest
+
+from app.enums.column_enum import ColumnEnum
+from app.helpers.string_helper import extract_task_key
+
+ARCHIVE = "Tasks (архив)"
+
+
+@pytest.fixture
+def service(make_service):
+    return make_service(ARCHIVE_ENABLED="true", ARCHIVE_AFTER_DAYS="0")
+
+
+def keys(worksheet) -> list:
+    return [extract_task_key(row[0]) for row in worksheet.rows[1:] if row and row[0]]
+
+
+def test_completed_tasks_move_to_archive(service, worksheet, make_task):
+    service.store_tasks_batch([make_task("TEST-1", status="Закрыт"), make_task("TEST-2")])
+
+    assert service.archive.archive_completed() == 1
+
+    archive = service.sheet.worksheet(ARCHIVE)
+    assert keys(worksheet) == ["TEST-2"]
+    assert archive.rows[0] == worksheet.rows[0]
+    assert keys(archive) == ["TEST-1"]
+    assert service.archive.archived_keys(["TEST-1", "TEST-2"]) == {"TEST-1"}
+
+
+def test_interrupted_pass_does_not_duplicate_archive_rows(service, worksheet, make_task):
+    service.store_tasks_batch([make_task("TEST-1", status="Закрыт")])
+    archive = service.sheet.add_worksheet(ARCHIVE)
+    # Прошлый проход дописал строку в архив и прервался до отметки в Redis и удаления из рабочего листа
+    archive.rows = [list(worksheet.rows[0]), list(worksheet.rows[1])]
+
+    assert service.archive.archive_completed() == 1
+
+    assert keys(worksheet) == []
+    assert keys(archive) == ["TEST-1"]
+
+
+def test_reopened_task_returns_to_worksheet_with_comment(service, worksheet, make_task):
+    service.store_tasks_batch([make_task("TEST-1", status="Закрыт")])
+    comment_column = service._get_layout().columns[ColumnEnum.comment]
+    worksheet.rows[1][comment_column] = "Ждёт ревью"
+    service.archive.archive_completed()
+
+    service.store_tasks_batch([make_task("TEST-1", status="Open")])
+
+    archive = service.sheet.worksheet(ARCHIVE)
+    assert keys(worksheet) == ["TEST-1"]
+    assert worksheet.rows[1][comment_column] == "Ждёт ревью"
+    assert keys(archive) == []
+    assert service.archive.archived_keys(["TEST-1"]) == set()
+
+
+def test_finished_archived_task_is_updated_in_archive(service, worksheet, make_task):
+    service.store_tasks_batch([make_task("TEST-1", status="Закрыт")])
+    service.archive.archive_completed()
+
+    service.store_tasks_batch([make_task("TEST-1", status="Закрыт", summary="Renamed")])
+
+    archive = service.sheet.worksheet(ARCHIVE)
+    assert keys(worksheet) == []
+    assert keys(archive) == ["TEST-1"]
+    assert "Renamed" in archive.rows[1][0]
@@ -0,0 +1,56 @@
+import pytest
+
+from app.task_dto import TaskDTO, TaskValidationError
+
+
+@pytest.mark.parametrize("key", ["TEST-1", "q-42", "MY_QUEUE2-100500"])
+def test_valid_task_keys_are_accepted(key):
+    assert TaskDTO.from_payload({"key": key}).key == key
+
+
+@pytest.mark.parametrize("key", [None, 123, "", "TEST", "TEST-", "1TEST-1", "TEST-1a", "TEST-1\n", 'TEST-1")'])
+def test_invalid_task_keys_are_rejected(key):
+    with pytest.raises(TaskValidationError):
+        TaskDTO.from_payload({"key": key})
+
+
+@pytest.mark.parametrize("payload", [["TEST-1"], "TEST-1", None])
+def test_payload_must_be_an_object(payload):
+    with pytest.raises(TaskValidationError):
+        TaskDTO.from_payload(payload)
+
+
+def test_fields_are_normalized():
+    task = TaskDTO.from_payload({
+        "key": "TEST-1",
+        "summary": 42,
+        "offThePlan": "да",
+        "movingOnToTheNextSprint": 0,
+        "outsideOfTheSprintPlan": None,
+        "spDevelopment": "2,5",
+        "spTesting": "3",
+    })
+
+    assert task.summary == "42"
+    assert task.off_the_plan is True
+    assert task.moving_next_sprint is False
+    assert task.outside_sprint is False
+    assert task.sp_development == 2.5
+    assert task.sp_testing == 3
+
+
+@pytest.mark.parametrize("field, value", [
+    ("summary", ["list"]),
+    ("status", True),
+    ("offThePlan", "maybe"),
+    ("spDevelopment", "много"),
+    ("spTesting", {"points": 1}),
+])
+def test_invalid_field_types_are_rejected(field, value):
+    with pytest.raises(TaskValidationError, match=field):
+        TaskDTO.from_payload({"key": "TEST-1", field: value})
+
+
+def test_validation_error_is_value_error():
+    # Воркер и /gh/bulk ловят ValueError, чтобы отложить некорректный payload
+    assert issubclass(TaskValidationError, ValueError)
@@ -0,0 +1,138 @@
+import time
+
+from app.services.task_queue import (
+    CONSUMER_GROUP, INFLIGHT_PREFIX, LEASE_PREFIX, PAYLOADS_KEY, STREAM_KEY, KeysQueue, TaskQueue,
+)
+
+
+def drain_all(queue: KeysQueue, **kwargs) -> list[tuple[str, str]]:
+    return [item for batch in queue.drain(**kwargs) for item in batch]
+
+
+def test_claim_moves_tasks_into_worker_journal(redis_client):
+    queue = KeysQueue(redis_client, worker_id="w1")
+    for number in range(3):
+        redis_client.set(f"TEST-{number}", f"v{number}")
+    redis_client.hset("TEST-hash", "key", "not a task")
+
+    claimed = drain_all(queue)
+
+    assert sorted(claimed) == [("TEST-0", "v0"), ("TEST-1", "v1"), ("TEST-2", "v2")]
+    assert redis_client.keys("TEST-*") == ["TEST-hash"]
+    assert redis_client.hgetall(f"{INFLIGHT_PREFIX}w1") == {"TEST-0": "v0", "TEST-1": "v1", "TEST-2": "v2"}
+    assert redis_client.ttl(f"{LEASE_PREFIX}w1") > 0
+
+
+def test_service_keys_are_not_claimed(redis_client):
+    queue = KeysQueue(redis_client, worker_id="w1")
+    redis_client.set("sync:something", "1")
+
+    assert drain_all(queue) == []
+    assert redis_client.get("sync:something") == "1"
+
+
+def test_ack_keeps_newer_version_in_journal(redis_client):
+    queue = KeysQueue(redis_client, worker_id="w1")
+    redis_client.set("TEST-1", "v1")
+    redis_client.set("TEST-2", "v1")
+    drain_all(queue)
+    # Пока задача писалась, пришла и была забрана её новая версия
+    redis_client.hset(queue.inflight_key, "TEST-2", "v2")
+
+    queue.ack([("TEST-1", "v1"), ("TEST-2", "v1")])
+
+    assert redis_client.hgetall(queue.inflight_key) == {"TEST-2": "v2"}
+
+
+def test_requeue_does_not_overwrite_newer_webhook(redis_client):
+    queue = KeysQueue(redis_client, worker_id="w1")
+    redis_client.set("TEST-1", "v1")
+    redis_client.set("TEST-2", "v1")
+    drain_all(queue)
+    redis_client.set("TEST-2", "v2")
+
+    queue.requeue([("TEST-1", "v1"), ("TEST-2", "v1")])
+
+    assert redis_client.mget(["TEST-1", "TEST-2"]) == ["v1", "v2"]
+    assert redis_client.hlen(queue.inflight_key) == 0
+
+
+def test_reclaim_returns_journal_of_worker_with_expired_lease(redis_client):
+    dead = KeysQueue(redis_client, worker_id="dead")
+    alive = KeysQueue(redis_client, worker_id="alive")
+    redis_client.set("TEST-1", "v1")
+    redis_client.set("TEST-2", "v1")
+    drain_all(dead)
+    redis_client.set("TEST-3", "v1")
+    drain_all(alive)
+    redis_client.delete(f"{LEASE_PREFIX}dead")
+    redis_client.set("TEST-2", "v2")
+
+    assert alive.reclaim() == 2
+
+    assert redis_client.mget(["TEST-1", "TEST-2"]) == ["v1", "v2"]
+    assert not redis_client.exists(dead.inflight_key)
+    # Журнал воркера с живой арендой не трогаем
+    assert redis_client.hgetall(alive.inflight_key) == {"TEST-3": "v1"}
+
+
+def test_reclaim_own_journal_on_startup(redis_client):
+    queue = KeysQueue(redis_client, worker_id="w1")
+    redis_client.set("TEST-1", "v1")
+    drain_all(queue)
+
+    assert queue.reclaim() == 0
+    assert queue.reclaim(own=True) == 1
+    assert redis_client.get("TEST-1") == "v1"
+
+
+def test_stream_ack_keeps_payload_updated_during_write(redis_client):
+    queue = TaskQueue(redis_client, consumer="w1")
+    queue.enqueue("TEST-1", "v1")
+    queue.enqueue("TEST-2", "v1")
+    entries = queue.read(count=10, block_ms=1)
+    payloads = queue.fetch_payloads([task_key for _, task_key in entries])
+    # Пока пачка писалась, пришёл новый вебхук по TEST-2
+    queue.enqueue("TEST-2", "v2")
+
+    queue.ack([entry_id for entry_id, _ in entries], payloads)
+
+    assert redis_client.hgetall(PAYLOADS_KEY) == {"TEST-2": "v2"}
+    assert redis_client.xpending(STREAM_KEY, CONSUMER_GROUP)["pending"] == 0
+    assert [task_key for _, task_key in queue.read(count=10, block_ms=1)] == ["TEST-2"]
+
+
+def test_stream_reclaims_idle_entries_of_other_consumers(redis_client):
+    dead = TaskQueue(redis_client, consumer="dead")
+    alive = TaskQueue(redis_client, consumer="alive")
+    dead.enqueue("TEST-1", "v1")
+    dead.read(count=10, block_ms=1)
+
+    assert alive.reclaim(min_idle_ms=60000) == 0
+    time.sleep(0.05)
+    assert alive.reclaim(min_idle_ms=20) == 1
+
+    pending = redis_client.xpending_range(STREAM_KEY, CONSUMER_GROUP, "-", "+", 10)
+    assert [entry["consumer"] for entry in pending] == ["alive"]
+
+
+def test_drain_claims_only_selected_tasks_within_room(redis_client):
+    queue = KeysQueue(redis_client, worker_id="w1", batch_size=10)
+    for number in range(4):
+        redis_client.set(f"TEST-{number}", "bulk" if number % 2 else "urgent")
+
+    def select(items):
+        return [key for key, value in items if value == "urgent"]
+
+    claimed = drain_all(queue, room=lambda: 3, select=select)
+
+    assert sorted(claimed) == [("TEST-0", "urgent"), ("TEST-2", "urgent")]
+    assert sorted(redis_client.keys("TEST-*")) == ["TEST-1", "TEST-3"]
+
+
+def test_drain_stops_when_worker_has_no_room(redis_client):
+    queue = KeysQueue(redis_client, worker_id="w1")
+    redis_client.set("TEST-1", "v1")
+
+    assert drain_all(queue, room=lambda: 0) == []
+    assert redis_client.get("TEST-1") == "v1"
@@ -0,0 +1,83 @@
+import time
+import uuid
+
+from app.services.worksheet_mirror import WorksheetMirror
+
+
+class VersionedSheet:
+    def __init__(self, version: str):
+        self.id = uuid.uuid4().hex
+        self.version = version
+
+    def get_lastUpdateTime(self) -> str:
+        return self.version
+
+
+def make_mirror(sheet: VersionedSheet) -> WorksheetMirror:
+    mirror = WorksheetMirror(sheet, worksheet=None)
+    mirror.version = sheet.version
+    return mirror
+
+
+def test_failed_write_does_not_leak_into_next_write():
+    sheet = VersionedSheet("v1")
+    mirror = make_mirror(sheet)
+
+    mirror.begin_write()
+    mirror.abort_write()
+    # Пока сервис не писал, документ изменили вне сервиса: копия должна это заметить
+    sheet.version = "v2"
+    mirror.begin_write()
+    sheet.version = "v3"
+    mirror.rows = [["header"]]
+    mirror.commit()
+
+    assert mirror.rows == []
+    assert mirror.version == "v1"
+
+
+def test_own_write_adopts_new_version():
+    sheet = VersionedSheet("v1")
+    mirror = make_mirror(sheet)
+
+    mirror.begin_write()
+    sheet.version = "v2"
+    mirror.commit()
+
+    assert mirror.version == "v2"
+
+
+def test_sibling_worksheet_write_does_not_reload_mirror():
+    sheet = VersionedSheet("v1")
+    tasks, other = make_mirror(sheet), make_mirror(sheet)
+    tasks.rows = [["header"]]
+    tasks._synced_at = time.time()
+
+    other.begin_write()
+    sheet.version = "v2"
+    other.commit()
+    tasks.begin_write()
+    sheet.version = "v3"
+    tasks.commit()
+    tasks.ensure_fresh()
+
+    assert tasks.rows == [["header"]]
+    assert tasks.version == "v3"
+
+
+def test_outside_edit_between_sibling_writes_reloads_mirror():
+    sheet = VersionedSheet("v1")
+    tasks, other = make_mirror(sheet), make_mirror(sheet)
+    tasks.rows = [["header"]]
+    tasks._synced_at = time.time()
+
+    sheet.version = "v2"
+    other.begin_write()
+    sheet.version = "v3"
+    other.commit()
+    tasks.begin_write()
+    sheet.version = "v4"
+    tasks.commit()
+
+    assert tasks.rows == []
+    assert tasks.version == "v1"